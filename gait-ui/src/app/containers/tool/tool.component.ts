@@ -113,7 +113,7 @@ export class ToolComponent {
           entities
             .map((word) => this.capitalize(word))
             .includes(this.capitalize(word))
-            ? this.service.getFields(this.capitalize(word))
+            ? this.service.getFields(this.selectedApi, this.capitalize(word))
             : of([])
         ),
         skipWhile((suggestions) => suggestions.length == 0)
@@ -135,11 +135,18 @@ export class ToolComponent {
   }
 
   private fetchGraphQlQuery(value: string): Observable<string> {
+    let text = '';
     return this.service
-      .generateGraphqlQuery(this.selectedApi!, this.selectedModel, value)
+      .streamGraphqlQuery(this.selectedApi!, this.selectedModel, value)
       .pipe(
-        map((response) => response.query ?? response.message),
-        tap((value) => this.queryModel.set(value)),
+        map((event) =>
+          event.done ? event.query ?? text : (text += event.text ?? '')
+        ),
+        tap((value) => {
+          this.buildingQuery.set(false);
+          this.queryModel.set(value);
+        }),
+        catchError((error) => of(String(error))),
         finalize(() => this.buildingQuery.set(false))
       );
   }
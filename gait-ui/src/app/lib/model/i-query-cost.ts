@@ -0,0 +1,5 @@
+export interface IQueryCost {
+  cost: number;
+  depth: number;
+  fields: number;
+}
@@ -0,0 +1,11 @@
+import { IQueryCost } from './i-query-cost';
+import { IQueryValidation } from './i-query-validation';
+
+export interface IQueryStreamEvent {
+  text?: string;
+  query?: string;
+  done?: boolean;
+  cached?: boolean;
+  validation?: IQueryValidation;
+  cost?: IQueryCost;
+}
@@ -0,0 +1,4 @@
+export interface IQueryValidation {
+  valid: boolean;
+  errors: { message: string; locations?: { line: number; column: number }[] }[];
+}
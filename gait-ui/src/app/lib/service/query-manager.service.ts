@@ -4,6 +4,7 @@ import { Observable } from 'rxjs';
 import { IGenerateQueryResponse } from '../model/i-generate-query-response';
 import { IApiModel } from '../model/i-api-model';
 import { IEntity } from '../model/i-entity';
+import { IQueryStreamEvent } from '../model/i-query-stream-event';
 
 @Injectable({
   providedIn: 'root',
@@ -34,6 +35,55 @@ export class QueryManagerService {
     );
   }
 
+  streamGraphqlQuery(
+    apiUrl: string,
+    model: string,
+    userInput: string
+  ): Observable<IQueryStreamEvent> {
+    const params = new URLSearchParams({
+      api_url: apiUrl,
+      model: model,
+      user_input: userInput,
+    });
+
+    return new Observable<IQueryStreamEvent>((subscriber) => {
+      const source = new EventSource(
+        `${this.apiUrl}/generate_query/stream?${params}`
+      );
+      source.addEventListener('token', (event) => {
+        subscriber.next(JSON.parse((event as MessageEvent).data));
+      });
+      source.addEventListener('done', (event) => {
+        subscriber.next({
+          ...JSON.parse((event as MessageEvent).data),
+          done: true,
+        });
+        subscriber.complete();
+        source.close();
+      });
+      source.addEventListener('error', (event) => {
+        const data = (event as MessageEvent).data;
+        subscriber.error(
+          data ? JSON.parse(data).error : 'Query stream interrupted'
+        );
+        source.close();
+      });
+      return () => source.close();
+    });
+  }
+
+  executeQuery(
+    apiUrl: string,
+    query: string,
+    variables?: Record<string, unknown>
+  ): Observable<any> {
+    return this.http.post<any>(`${this.apiUrl}/execute`, {
+      api_url: apiUrl,
+      query: query,
+      variables: variables,
+    });
+  }
+
   getApis(): Observable<IApiModel[]> {
     return this.http.get<IApiModel[]>(`${this.apiUrl}/apis`);
   }
@@ -45,7 +95,10 @@ export class QueryManagerService {
     });
   }
 
-  getFields(entity: string): Observable<string[]> {
-    return this.http.get<string[]>(`${this.apiUrl}/entities/${entity}`);
+  getFields(apiUrl: string, entity: string): Observable<string[]> {
+    let params = new HttpParams().set('api_url', apiUrl);
+    return this.http.get<string[]>(`${this.apiUrl}/entities/${entity}`, {
+      params: params,
+    });
   }
 }
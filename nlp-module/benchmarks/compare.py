@@ -0,0 +1,70 @@
+"""
+Diff two benchmark suite results and flag regressions.
+
+    python -m benchmarks.compare baseline.json current.json [--threshold 0.10]
+
+A benchmark regresses when its median grows by more than the threshold (relative); a corpus
+regresses when fewer inputs pass. Exits with status 1 when anything regressed, so it can gate a deploy.
+"""
+import argparse
+import json
+import sys
+
+
+def flatten(report):
+    medians, passed = {}, {}
+    for api_url, result in report["results"].items():
+        for name, stats in result.get("benchmarks", {}).items():
+            medians[f"{api_url} {name}"] = stats["median_ms"]
+        if "corpus" in result:
+            passed[api_url] = (result["corpus"]["passed"], result["corpus"]["total"])
+    return medians, passed
+
+
+def compare(baseline, current, threshold):
+    base_medians, base_passed = flatten(baseline)
+    medians, passed = flatten(current)
+    regressions = []
+
+    print(f"{'benchmark':80} {'base ms':>10} {'now ms':>10} {'change':>8}")
+    for key in sorted(base_medians.keys() & medians.keys()):
+        before, after = base_medians[key], medians[key]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:80} {before:10.3f} {after:10.3f} {change:+8.1%}{flag}")
+    for key in sorted(base_medians.keys() ^ medians.keys()):
+        print(f"{key:80} {'only in ' + ('baseline' if key in base_medians else 'current'):>30}")
+
+    for api_url in sorted(base_passed.keys() & passed.keys()):
+        (before, total_before), (after, total) = base_passed[api_url], passed[api_url]
+        flag = ""
+        if after < before:
+            flag = "  REGRESSION"
+            regressions.append(f"{api_url} corpus")
+        print(f"{api_url + ' corpus':80} {before:>6}/{total_before:<3} {after:>6}/{total:<3}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown of a median")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.current, encoding="utf-8") as file:
+        current = json.load(file)
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
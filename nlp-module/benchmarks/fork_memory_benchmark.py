@@ -0,0 +1,130 @@
+"""
+Memory of the schema artifacts in forked workers, without gunicorn or the spaCy model.
+
+The schema entries of the bundled APIs' fixtures (--scale N repeats their types N times, see
+benchmarks.name_matcher_benchmark) are built in one of three ways, then workers are forked and each
+serves a stream of lookups against them (cost estimates of the corpus queries, type and argument
+tables, entity names) with regular gc passes, as a long-running worker would:
+
+    per-worker      every worker builds the entries itself (NLP_PRELOAD=0)
+    preload         the master builds them before forking (preload_app), no gc.freeze()
+    preload+freeze  the same, then gc.freeze() as main.preload_for_workers does
+
+RSS counts the pages a worker shares with the master, PSS divides shared pages among the processes
+sharing them and USS (private pages) is what each worker adds. Linux only.
+
+    python -m benchmarks.fork_memory_benchmark [--workers 1 4 8] [--scale 20] [--rounds 50]
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+
+from graphql import build_client_schema
+
+from benchmarks.name_matcher_benchmark import scaled
+from benchmarks.record_fixtures import bundled_apis, load_fixture
+from benchmarks.suite import CORPUS_PATH
+from benchmarks.worker_memory_benchmark import memory_kib
+from common.query_cost import query_cost
+from common.schema_registry import SchemaEntry
+
+MODES = ("per-worker", "preload", "preload+freeze")
+
+
+def build_entries(scale):
+    entries = []
+    for api_url in bundled_apis():
+        introspection = scaled(load_fixture(api_url), scale)
+        entry = SchemaEntry(api_url, build_client_schema({"__schema": introspection}), introspection)
+        entry.index, entry.parsed_schema, entry.entity_names
+        entries.append(entry)
+    return entries
+
+
+def serve(entries, queries, rounds):
+    for round_number in range(rounds):
+        for entry in entries:
+            index = entry.index
+            for query in queries.get(entry.api_url, ()):
+                query_cost(index, query)
+            for name in index.queries:
+                index.resource_type(name)
+                index.argument_paths.get(name)
+            len(entry.entity_names), len(entry.parsed_schema)
+        if round_number % 10 == 0:
+            gc.collect()
+
+
+def run(mode, workers, scale, rounds, queries):
+    entries = build_entries(scale) if mode != "per-worker" else None
+    if mode == "preload+freeze":
+        gc.freeze()
+    ready_read, ready_write = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            serve(entries or build_entries(scale), queries, rounds)
+            os.write(ready_write, b".")
+            signal.pause()
+            os._exit(0)
+        pids.append(pid)
+    os.close(ready_write)
+    try:
+        for _ in range(workers):
+            os.read(ready_read, 1)
+        master = memory_kib(os.getpid())
+        memory = [memory_kib(pid) for pid in pids]
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        os.close(ready_read)
+        gc.unfreeze()
+        del entries
+        gc.collect()
+
+    def mean_mib(key):
+        return round(sum(values[key] for values in memory) / len(memory) / 1024, 1)
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "master_rss_mib": round(master["rss"] / 1024, 1),
+        "worker_rss_mib": mean_mib("rss"),
+        "worker_pss_mib": mean_mib("pss"),
+        "worker_uss_mib": mean_mib("uss"),
+        "total_pss_mib": round((master["pss"] + sum(values["pss"] for values in memory)) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--scale", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding="utf-8") as file:
+        queries = {api_url: [case["expected_query"] for case in cases] for api_url, cases in json.load(file).items()}
+
+    print(f"{'mode':>14} {'workers':>7} {'master RSS':>10} {'worker RSS':>10} {'worker PSS':>10} "
+          f"{'worker USS':>10} {'total PSS':>9}   (MiB)")
+    results = []
+    for workers in args.workers:
+        for mode in MODES:
+            result = run(mode, workers, args.scale, args.rounds, queries)
+            results.append(result)
+            print(f"{mode:>14} {workers:7} {result['master_rss_mib']:10} {result['worker_rss_mib']:10} "
+                  f"{result['worker_pss_mib']:10} {result['worker_uss_mib']:10} {result['total_pss_mib']:9}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
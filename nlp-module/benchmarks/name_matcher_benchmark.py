@@ -0,0 +1,131 @@
+"""
+Latency of the vectorized name matcher: building a schema's name matrix once, then matching the
+content words of a request against its query names and against the fields of the resource type.
+
+Schemas come from the recorded fixtures (benchmarks.record_fixtures) or, for APIs without one, are
+introspected live. --scale N repeats every type N times under new names to model larger schemas.
+Needs en_core_web_md, which has word vectors.
+
+    python -m benchmarks.name_matcher_benchmark [--runs 2000] [--scale 1] [api_url ...]
+"""
+import argparse
+import statistics
+import time
+
+from graphql import build_client_schema
+
+from benchmarks.record_fixtures import load_fixture
+from common.schema_index import SchemaIndex
+from nlp_custom_model.name_matcher import NameMatcher, content_tokens
+from nlp_custom_model.nlp_processor import get_nlp
+
+APIS = [
+    "https://portal.ehri-project.eu/api/graphql",
+    "https://countries.trevorblades.com/",
+    "https://api.tcgdex.net/v2/graphql",
+]
+
+REQUESTS = [
+    "list the archival institutions and their names",
+    "show documentary units with their titles and identifiers",
+    "get nations with their capital and money",
+    "show all cards with illustrator and rarity",
+    "which people are mentioned in the records",
+]
+
+
+def introspection_of(api_url):
+    introspection = load_fixture(api_url)
+    if introspection is None:
+        from common.schema_fetcher import fetch_graphql_schema
+
+        _, introspection = fetch_graphql_schema(api_url)
+    return introspection
+
+
+def renamed_ref(type_ref, names):
+    if type_ref.get("ofType"):
+        return {**type_ref, "ofType": renamed_ref(type_ref["ofType"], names)}
+    return {**type_ref, "name": names.get(type_ref["name"], type_ref["name"])}
+
+
+def renamed_fields(fields, names, suffix=""):
+    return [{**field, "name": f"{field['name']}{suffix}", "type": renamed_ref(field["type"], names)}
+            for field in fields]
+
+
+def scaled(introspection, scale):
+    """
+    The introspection result with every object type also present scale - 1 more times, renamed and
+    reachable: each copy's fields refer to the same copy's types, and the query type gets a renamed
+    copy of each of its fields returning them, so query and field names grow with scale.
+    """
+    if scale <= 1:
+        return introspection
+    query_name = introspection["queryType"]["name"]
+    objects = [gql_type["name"] for gql_type in introspection["types"] if gql_type["kind"] == "OBJECT"
+               and not gql_type["name"].startswith("__") and gql_type["name"] != query_name]
+    types = [gql_type for gql_type in introspection["types"] if gql_type["name"] != query_name]
+    query_type = next(gql_type for gql_type in introspection["types"] if gql_type["name"] == query_name)
+    query_fields = list(query_type["fields"])
+    for copy in range(1, scale):
+        names = {name: f"{name}{copy}" for name in objects}
+        for gql_type in introspection["types"]:
+            if gql_type["name"] in names:
+                types.append({**gql_type, "name": names[gql_type["name"]],
+                              "fields": renamed_fields(gql_type["fields"], names)})
+        query_fields += renamed_fields(query_type["fields"], names, suffix=str(copy))
+    return {**introspection, "types": types + [{**query_type, "fields": query_fields}]}
+
+
+def percentile(timings, fraction):
+    return sorted(timings)[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+def timed_us(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings), percentile(timings, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("api_urls", nargs="*")
+    args = parser.parse_args()
+
+    nlp = get_nlp()
+    docs = [nlp(text) for text in REQUESTS]
+    print(f"{'api':45} {'names':>6} {'build ms':>9} {'matrix KiB':>11} {'queries p50/p99 us':>19} "
+          f"{'fields p50/p99 us':>18}")
+    for api_url in args.api_urls or APIS:
+        schema = build_client_schema({"__schema": scaled(introspection_of(api_url), args.scale)})
+        index = SchemaIndex(schema)
+        start = time.perf_counter()
+        matcher = NameMatcher(index, nlp.vocab)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        words = [content_tokens(doc) for doc in docs]
+        resources = [(matcher.match_queries(tokens, k=1) or [(next(iter(index.queries)), None, 0)])[0][0]
+                     for tokens in words]
+        types = [index.resource_type(resource) for resource in resources]
+        for type_name in types:
+            matcher.field_matrix(type_name)
+
+        queries = timed_us(lambda: [matcher.match_queries(tokens, k=1) for tokens in words], args.runs)
+        fields = timed_us(lambda: [matcher.match_fields(type_name, tokens) for type_name, tokens in zip(types, words)],
+                          args.runs)
+        per_request = [value / len(docs) for value in queries + fields]
+        print(f"{api_url:45} {len(matcher.rows):6} {build_ms:9.1f} {matcher.matrix.nbytes / 1024:11.1f} "
+              f"{per_request[0]:9.1f}/{per_request[1]:<9.1f} {per_request[2]:8.1f}/{per_request[3]:<9.1f}")
+        for text, tokens, resource in zip(REQUESTS, words, resources):
+            matched = matcher.match_fields(index.resource_type(resource), tokens)
+            print(f"    {text!r} -> {resource} {[field for field, _, _ in matched]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Compare prompt size and end-to-end latency of openai_model.generate_graphql_query with the whole
+schema as SDL against the pruned SDL prompt, for every bundled API. (The previous prompt used
+str(schema), which is only the object's repr, so it never carried the schema at all.)
+
+Requests go to a local stand-in for the OpenAI chat completions endpoint, so no key or network
+access to OpenAI is needed. The stand-in answers with a fixed query after a delay proportional to
+the prompt size (--ms-per-1k-tokens), which stands in for the model's prefill time.
+
+    python -m benchmarks.prompt_benchmark [--runs 5] [--ms-per-1k-tokens 20] [api_url ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.schema_index_benchmark import APIS
+from openai_model.prompt_builder import estimate_tokens
+
+QUESTIONS = {
+    "https://countries.trevorblades.com/": [
+        "list all countries with their capital and currency",
+        "which languages are spoken in each continent",
+    ],
+    "https://portal.ehri-project.eu/api/graphql": [
+        "show documentary units with their identifiers",
+        "list repositories in each country",
+    ],
+    "https://api.tcgdex.net/v2/graphql": [
+        "list cards with their hp and rarity",
+        "show the sets of every serie",
+    ],
+}
+DEFAULT_QUESTIONS = ["list everything"]
+
+
+def start_stand_in(ms_per_1k_tokens):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in body["messages"])
+            time.sleep(prompt_tokens / 1000 * ms_per_1k_tokens / 1000)
+            payload = json.dumps({
+                "id": "chatcmpl-benchmark",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "query { __typename }"}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 5, "total_tokens": prompt_tokens + 5},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def full_schema_query(schema_text, user_input):
+    """
+    Same request as generate_graphql_query, with the given schema text instead of the pruned SDL.
+    """
+    from openai_model import openai_model
+
+    prompt = f"""
+    Given the following GraphQL schema (SDL):
+    {schema_text}
+
+    Generate a GraphQL query that matches this user request:
+    "{user_input}"
+    """
+    response = openai_model.client.get().chat.completions.create(model="gpt-4o-mini", messages=[
+        {"role": "system", "content": "You are an expert GraphQL query generator. You are to only show the generated query."},
+        {"role": "user", "content": prompt},
+    ])
+    return response.choices[0].message.content, prompt
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("api_urls", nargs="*", default=APIS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server = start_stand_in(args.ms_per_1k_tokens)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    from graphql import print_schema
+
+    from common.schema_registry import registry
+    from openai_model import openai_model
+    from openai_model.prompt_builder import schema_prompt
+
+    print(f"{'api':45} {'prompt':8} {'chars':>9} {'~tokens':>9} {'median ms':>10} {'min ms':>8}")
+    for api_url in args.api_urls:
+        entry = registry.get(api_url)
+        full_sdl = print_schema(entry.schema)
+        for user_input in QUESTIONS.get(api_url, DEFAULT_QUESTIONS):
+            print(f"  {user_input!r}")
+            variants = (
+                ("full", lambda: full_schema_query(full_sdl, user_input), lambda: full_sdl),
+                ("pruned", lambda: openai_model.generate_graphql_query(api_url, user_input),
+                 lambda: schema_prompt(entry, user_input)),
+            )
+            for name, run, render in variants:
+                schema_text = render()
+                timings = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - start)
+                print(f"{api_url:45} {name:8} {len(schema_text):9} {estimate_tokens(schema_text):9} "
+                      f"{statistics.median(timings) * 1000:10.1f} {min(timings) * 1000:8.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
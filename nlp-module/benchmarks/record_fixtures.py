@@ -0,0 +1,95 @@
+"""
+Record the introspection result of every API in query-manager/api_data.py as a JSON fixture,
+so the benchmarks can run against the local stub server without touching the live APIs.
+
+    python -m benchmarks.record_fixtures [api_url ...]
+    python -m benchmarks.record_fixtures --from-sdl [api_url ...]
+
+Fixtures are written to benchmarks/fixtures/<slug>.json as {"data": {"__schema": ...}}, the same
+shape the APIs return, and can also be imported into the snapshot store
+(python -m common.snapshot_store import <api_url> <fixture>).
+
+The committed fixtures are synthetic: --from-sdl builds them from benchmarks/fixtures/<slug>.graphql,
+SDL modeled on each bundled API's public schema, so the suite runs without network access. Recording
+from the live APIs replaces them.
+"""
+import importlib.util
+import json
+import os
+import re
+import sys
+from urllib.parse import urlsplit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+API_DATA_PATH = os.path.join(BENCHMARKS_DIR, "..", "..", "query-manager", "api_data.py")
+
+
+def bundled_apis():
+    """
+    The APIs the UI offers, as listed by query-manager.
+    """
+    spec = importlib.util.spec_from_file_location("api_data", API_DATA_PATH)
+    api_data = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(api_data)
+    return [api["url"] for api in api_data.apis]
+
+
+def slug(api_url):
+    parts = urlsplit(api_url)
+    return re.sub(r"[^a-z0-9]+", "-", f"{parts.netloc}{parts.path}".lower()).strip("-")
+
+
+def fixture_path(api_url):
+    return os.path.join(FIXTURES_DIR, f"{slug(api_url)}.json")
+
+
+def load_fixture(api_url):
+    """
+    The recorded __schema dict of an API, or None when it has not been recorded.
+    """
+    path = fixture_path(api_url)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["data"]["__schema"]
+
+
+def sdl_path(api_url):
+    return os.path.join(FIXTURES_DIR, f"{slug(api_url)}.graphql")
+
+
+def write_fixture(api_url, introspection):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with open(fixture_path(api_url), "w", encoding="utf-8") as file:
+        json.dump({"data": {"__schema": introspection}}, file, sort_keys=True, indent=1)
+        file.write("\n")
+    return fixture_path(api_url)
+
+
+def synthesize(api_url):
+    """
+    Write the fixture of an API from its SDL file instead of introspecting it.
+    """
+    from graphql import build_schema, introspection_from_schema
+
+    with open(sdl_path(api_url), encoding="utf-8") as file:
+        schema = build_schema(file.read())
+    return write_fixture(api_url, introspection_from_schema(schema, descriptions=False)["__schema"])
+
+
+def record(api_url):
+    from common.schema_fetcher import fetch_graphql_schema
+
+    _, introspection = fetch_graphql_schema(api_url)
+    return write_fixture(api_url, introspection)
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    write = synthesize if "--from-sdl" in arguments else record
+    for api_url in [argument for argument in arguments if argument != "--from-sdl"] or bundled_apis():
+        try:
+            print(f"{api_url} -> {write(api_url)}")
+        except Exception as e:
+            print(f"{api_url}: recording failed: {e}")
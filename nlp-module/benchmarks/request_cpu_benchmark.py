@@ -0,0 +1,71 @@
+"""
+CPU time of a custom-model request (nlp_main.get_graphql_query) over the corpus inputs, and how many
+times the spaCy pipeline runs per request. Schemas are built from the recorded fixtures
+(benchmarks.record_fixtures), so no API is contacted. Needs en_core_web_md.
+
+    python -m benchmarks.request_cpu_benchmark [--runs 20] [api_url ...]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import time
+
+from graphql import build_client_schema
+from spacy.language import Language
+
+from benchmarks.record_fixtures import BENCHMARKS_DIR, bundled_apis, load_fixture
+
+
+def fixture_fetcher(api_url):
+    introspection = load_fixture(api_url)
+    return build_client_schema({"__schema": introspection}), introspection
+
+
+def count_pipeline_calls():
+    calls = [0]
+    call = Language.__call__
+
+    def counted(self, *args, **kwargs):
+        calls[0] += 1
+        return call(self, *args, **kwargs)
+
+    Language.__call__ = counted
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("api_urls", nargs="*")
+    args = parser.parse_args()
+
+    from common.schema_registry import registry
+    from nlp_custom_model import nlp_main
+
+    registry._fetcher = fixture_fetcher
+    with open(os.path.join(BENCHMARKS_DIR, "corpus.json"), encoding="utf-8") as file:
+        corpus = json.load(file)
+    calls = count_pipeline_calls()
+
+    for api_url in args.api_urls or bundled_apis():
+        texts = [case["input"] for case in corpus.get(api_url, ())]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for text in texts:  # loads the model and builds the schema index outside the timings
+                nlp_main.get_graphql_query(api_url, text)
+            calls[0] = 0
+            timings = []
+            for _ in range(args.runs):
+                for text in texts:
+                    start = time.process_time()
+                    nlp_main.get_graphql_query(api_url, text)
+                    timings.append((time.process_time() - start) * 1000)
+        print(f"{api_url:45} CPU per request: median {statistics.median(timings):.2f} ms  "
+              f"mean {statistics.fmean(timings):.2f} ms  "
+              f"pipeline runs per request: {calls[0] / len(timings):g}  ({len(timings)} requests)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Compare build time and memory of parse_graphql_schema against SchemaIndex.
+
+    python -m benchmarks.schema_index_benchmark [api_url ...]
+"""
+import sys
+import time
+import tracemalloc
+
+from common.schema_fetcher import fetch_graphql_schema, parse_graphql_schema
+from common.schema_index import SchemaIndex
+
+APIS = [
+    "https://countries.trevorblades.com/",
+    "https://portal.ehri-project.eu/api/graphql",
+    "https://api.tcgdex.net/v2/graphql",
+]
+
+
+def measure(build, schema):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(schema)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def main(api_urls):
+    print(f"{'api':45} {'builder':20} {'time ms':>10} {'retained KiB':>14} {'peak KiB':>10}")
+    for api_url in api_urls:
+        schema, _ = fetch_graphql_schema(api_url)
+        for name, build in (("parse_graphql_schema", parse_graphql_schema), ("SchemaIndex", SchemaIndex)):
+            _, elapsed, retained, peak = measure(build, schema)
+            print(f"{api_url:45} {name:20} {elapsed * 1000:10.1f} {retained / 1024:14.1f} {peak / 1024:10.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or APIS)
@@ -0,0 +1,45 @@
+"""
+Measure cold import time of main.py (what a worker pays before it can serve /health/live)
+and, separately, the time of the explicit warm-up. Also lists which of the heavy libraries the
+import alone pulls in; none of them should be.
+
+    python -m benchmarks.startup_benchmark [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["spacy", "nltk", "openai"]
+
+
+def time_subprocess(code, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=MODULE_DIR, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:20} min {min(timings):.3f}s  median {statistics.median(timings):.3f}s  ({len(timings)} runs)")
+
+
+def imported_heavy_modules():
+    code = f"import sys, main; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=MODULE_DIR, check=True, capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def main(runs):
+    report("python startup", time_subprocess("pass", runs))
+    report("import main", time_subprocess("import main", runs))
+    report("import + warm_up", time_subprocess("import main; main.warm_up()", runs))
+    print(f"loaded by import main: {', '.join(imported_heavy_modules()) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,82 @@
+"""
+Local GraphQL server that answers introspection queries from the recorded fixtures.
+
+Each recorded API is served under /<slug> (see record_fixtures.slug); every POST to that path
+gets the recorded introspection result back, optionally after a fixed delay to model network
+latency. Anything that is not an introspection query gets a GraphQL error.
+
+    python -m benchmarks.stub_server [port] [latency_ms]
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.record_fixtures import bundled_apis, load_fixture, slug
+
+
+class StubServer:
+    def __init__(self, api_urls=None, port=0, latency=0.0):
+        self.responses = {}
+        for api_url in api_urls or bundled_apis():
+            introspection = load_fixture(api_url)
+            if introspection is not None:
+                self.responses[api_url] = json.dumps({"data": {"__schema": introspection}}).encode("utf-8")
+        self.latency = latency
+        self._by_path = {f"/{slug(api_url)}": body for api_url, body in self.responses.items()}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                body = stub._by_path.get(self.path.rstrip("/"))
+                if body is None:
+                    self.send_error(404)
+                    return
+                if "__schema" not in request.get("query", ""):
+                    body = json.dumps({"errors": [{"message": "The stub server only answers introspection"}]})
+                    body = body.encode("utf-8")
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def url_for(self, api_url):
+        return f"{self.base_url}/{slug(api_url)}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-graphql", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    stub = StubServer(port=port, latency=latency_ms / 1000).start()
+    for api_url in stub.responses:
+        print(f"{api_url} -> {stub.url_for(api_url)}")
+    if not stub.responses:
+        print("No fixtures recorded yet; run python -m benchmarks.record_fixtures first.")
+    stub._thread.join()
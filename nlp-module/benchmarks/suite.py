@@ -0,0 +1,280 @@
+"""
+Offline benchmark suite for the schema and NLP hot path.
+
+Every bundled API is served from its recorded fixture by the local stub server, so no live API
+is contacted. For each API the suite times fetch_graphql_schema, parse_graphql_schema,
+SchemaIndex, convert_schema_to_rdf, every nlp_processor stage and
+query_generator.generate_graphql_query over the corpus inputs, then checks the custom model's
+output against the expected queries in corpus.json, which must themselves validate against the
+fixture. The page-size argument the generator adds to list queries (common.query_cost) is not part
+of the expected queries and is ignored there. The result is JSON, meant to be saved per commit and
+diffed with benchmarks.compare.
+
+    python -m benchmarks.record_fixtures              # once, with network access
+    python -m benchmarks.suite [--runs 20] [--output results.json] [api_url ...]
+    python -m benchmarks.suite --check-corpus    # validate corpus.json against the fixtures only
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from graphql import ObjectValueNode, build_client_schema, parse, print_ast, validate
+
+from benchmarks.record_fixtures import BENCHMARKS_DIR, bundled_apis, load_fixture
+from benchmarks.stub_server import StubServer
+from common.query_cost import PAGE_SIZE_ARGUMENTS
+
+CORPUS_PATH = os.path.join(BENCHMARKS_DIR, "corpus.json")
+
+
+def timed(fn, runs, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(timings), 4),
+        "min_ms": round(min(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+    }
+
+
+def without_page_size(arguments):
+    """
+    Argument nodes without page-size arguments, top-level or in an input object (pagination: {itemsPerPage: 20}).
+    """
+    kept = []
+    for argument in arguments:
+        if argument.name.value in PAGE_SIZE_ARGUMENTS:
+            continue
+        if isinstance(argument.value, ObjectValueNode):
+            fields = without_page_size(argument.value.fields)
+            if not fields:
+                continue
+            argument = argument.__class__(name=argument.name, value=ObjectValueNode(fields=tuple(fields)))
+        kept.append(argument)
+    return kept
+
+
+def selected_paths(selection_set, prefix=""):
+    """
+    Dotted paths of the fields selected below a selection set: { items { id } } -> {"items", "items.id"}.
+    """
+    paths = set()
+    for selection in selection_set.selections if selection_set else ():
+        if not hasattr(selection, "name"):
+            continue
+        path = f"{prefix}{selection.name.value}"
+        paths.add(path)
+        paths |= selected_paths(selection.selection_set, f"{path}.")
+    return paths
+
+
+def root_selection(query, ignore_page_size=False):
+    """
+    Name, printed arguments and selected field paths of the first root field of a query.
+    """
+    field = parse(query).definitions[0].selection_set.selections[0]
+    arguments = without_page_size(field.arguments) if ignore_page_size else field.arguments
+    arguments = {argument.name.value: print_ast(argument.value) for argument in arguments}
+    return field.name.value, arguments, selected_paths(field.selection_set)
+
+
+def invalid_expected_queries(schema, cases):
+    """
+    {input: error messages} of the corpus cases whose expected query does not validate against schema.
+    """
+    invalid = {}
+    for case in cases:
+        errors = validate(schema, parse(case["expected_query"]))
+        if errors:
+            invalid[case["input"]] = [error.message for error in errors]
+    return invalid
+
+
+def check_expected(query, expected_query):
+    """
+    The generated query must select the same root field with the same arguments, and at least the
+    fields the expected query selects, at the same nesting. A page-size argument the expected query
+    does not have is ignored. Returns None on success, or why it failed.
+    """
+    if not query:
+        return "no query generated"
+    name, arguments, fields = root_selection(query)
+    expected_name, expected_arguments, expected_fields = root_selection(expected_query)
+    if name != expected_name:
+        return f"root field {name!r}, expected {expected_name!r}"
+    if arguments != expected_arguments and root_selection(query, ignore_page_size=True)[1] != expected_arguments:
+        return f"arguments {arguments}, expected {expected_arguments}"
+    missing = expected_fields - fields
+    if missing:
+        return f"missing fields {sorted(missing)}"
+    return None
+
+
+def benchmark_schema(api_url, stub, runs):
+    from common.schema_fetcher import fetch_graphql_schema, parse_graphql_schema
+    from common.schema_index import SchemaIndex
+    from rdf.rdf_processor import convert_schema_to_rdf
+
+    stub_url = stub.url_for(api_url)
+    schema, introspection = fetch_graphql_schema(stub_url)
+    results = {
+        "fetch_graphql_schema": timed(lambda: fetch_graphql_schema(stub_url), runs),
+        "parse_graphql_schema": timed(lambda: parse_graphql_schema(schema), runs),
+        "SchemaIndex": timed(lambda: SchemaIndex(schema), runs),
+        "convert_schema_to_rdf": timed(lambda: convert_schema_to_rdf(introspection), runs),
+    }
+    return schema, results
+
+
+def benchmark_nlp(schema, cases, runs):
+    from nlp_custom_model import nlp_processor
+    from nlp_custom_model.lexicon import lexicon
+    from nlp_custom_model.nlp_main import build_query
+    from nlp_custom_model.query_generator import generate_graphql_query
+    from common.schema_index import SchemaIndex
+
+    index = SchemaIndex(schema, synonyms=lexicon.synonyms)
+    nlp = nlp_processor.get_nlp()
+    texts = [case["input"] for case in cases]
+    invalid = invalid_expected_queries(schema, cases)
+    docs = [nlp(text) for text in texts]
+    intents = [nlp_processor.advanced_intent_detection(doc) for doc in docs]
+    spans = [nlp_processor.split_request_and_condition(doc) for doc in docs]
+    resources = [nlp_processor.extract_resource_and_fields(request, index) for request, _ in spans]
+    conditions = [nlp_processor.extract_conditions(condition, index, resource)
+                  for (_, condition), (resource, _) in zip(spans, resources)]
+    generated = [(intent, resource, fields, condition)
+                 for intent, (resource, fields), condition in zip(intents, resources, conditions) if resource]
+
+    results = {
+        "nlp_processor.parse": timed(lambda: [nlp(text) for text in texts], runs),
+        "nlp_processor.advanced_intent_detection":
+            timed(lambda: [nlp_processor.advanced_intent_detection(doc) for doc in docs], runs),
+        "nlp_processor.split_request_and_condition":
+            timed(lambda: [nlp_processor.split_request_and_condition(doc) for doc in docs], runs),
+        "nlp_processor.extract_resource_and_fields":
+            timed(lambda: [nlp_processor.extract_resource_and_fields(request, index) for request, _ in spans], runs),
+        "nlp_processor.extract_conditions":
+            timed(lambda: [nlp_processor.extract_conditions(condition, index, resource)
+                           for (_, condition), (resource, _) in zip(spans, resources)], runs),
+        "query_generator.generate_graphql_query":
+            timed(lambda: [generate_graphql_query(*args, index) for args in generated], runs),
+        "nlp_main.build_query": timed(lambda: [build_query(nlp(text), index) for text in texts], runs),
+    }
+
+    failures = []
+    for case, doc in zip(cases, docs):
+        if case["input"] in invalid:
+            failures.append({"input": case["input"], "query": None,
+                             "reason": f"invalid expected query: {'; '.join(invalid[case['input']])}"})
+            continue
+        try:
+            query = build_query(doc, index)
+            reason = check_expected(query, case["expected_query"])
+        except Exception as e:
+            query, reason = None, f"{type(e).__name__}: {e}"
+        if reason:
+            failures.append({"input": case["input"], "query": query, "reason": reason})
+    corpus = {"total": len(cases), "passed": len(cases) - len(failures), "failures": failures}
+    return results, corpus
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(api_urls, runs):
+    with open(CORPUS_PATH, encoding="utf-8") as file:
+        corpus = json.load(file)
+
+    stub = StubServer(api_urls).start()
+    results = {}
+    try:
+        for api_url in api_urls:
+            if api_url not in stub.responses:
+                results[api_url] = {"error": "no fixture recorded; run python -m benchmarks.record_fixtures"}
+                continue
+            schema, benchmarks = benchmark_schema(api_url, stub, runs)
+            results[api_url] = {"benchmarks": benchmarks}
+            cases = corpus.get(api_url, [])
+            if cases:
+                try:
+                    nlp_benchmarks, accuracy = benchmark_nlp(schema, cases, runs)
+                    benchmarks.update(nlp_benchmarks)
+                    results[api_url]["corpus"] = accuracy
+                except Exception as e:
+                    results[api_url]["nlp_error"] = f"{type(e).__name__}: {e}"
+    finally:
+        stub.stop()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "runs": runs,
+        },
+        "results": results,
+    }
+
+
+def check_corpus(api_urls):
+    """
+    Print the corpus cases whose expected query does not validate against the API's fixture; 1 if any.
+    """
+    with open(CORPUS_PATH, encoding="utf-8") as file:
+        corpus = json.load(file)
+    failed = 0
+    for api_url in api_urls:
+        introspection = load_fixture(api_url)
+        if introspection is None:
+            print(f"{api_url}: no fixture")
+            failed += 1
+            continue
+        cases = corpus.get(api_url, [])
+        invalid = invalid_expected_queries(build_client_schema({"__schema": introspection}), cases)
+        for user_input, errors in invalid.items():
+            print(f"{api_url}: {user_input!r}: {'; '.join(errors)}")
+        print(f"{api_url}: {len(cases) - len(invalid)}/{len(cases)} expected queries valid")
+        failed += len(invalid)
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("api_urls", nargs="*")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    parser.add_argument("--check-corpus", action="store_true", help="Only validate corpus.json against the fixtures")
+    args = parser.parse_args()
+
+    if args.check_corpus:
+        sys.exit(check_corpus(args.api_urls or bundled_apis()))
+
+    report = run(args.api_urls or bundled_apis(), args.runs)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Memory of nlp-module under gunicorn with 1, 4 and 8 workers, with and without sharing.
+
+For every worker count the server is started twice: once as before (NLP_PRELOAD=0, no shared artifact
+directory), so every worker loads the model and builds the schema artifacts itself, and once with
+preload_app and SHARED_ARTIFACT_DIR. After the workers are ready, every API given is queried a few
+times per worker, then RSS and PSS (RSS with shared pages divided among the processes sharing them) of
+the master and each worker are read from /proc/<pid>/smaps_rollup. RSS counts shared pages in every
+worker; PSS is what the workers cost together. Linux only; needs gunicorn and en_core_web_md.
+
+    python -m benchmarks.worker_memory_benchmark [--workers 1 4 8] [--api-url URL ...]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REQUESTS = ["get countries name and capital", "list repositories", "show cards name"]
+
+
+def memory_kib(pid):
+    """
+    {"rss", "pss", "uss"} of a process in KiB; USS is its private pages.
+    """
+    values = {"uss": 0}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key.lower()] = int(rest.split()[0])
+            elif key in ("Private_Clean", "Private_Dirty"):
+                values["uss"] += int(rest.split()[0])
+    return values
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def get(url, timeout=60):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except (urllib.error.URLError, OSError):
+        return None, b""
+
+
+def wait_ready(base_url, master, workers, timeout):
+    deadline = time.monotonic() + timeout
+    ready = 0
+    while time.monotonic() < deadline:
+        if master.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {master.returncode}")
+        status, _ = get(f"{base_url}/apis/health/ready", timeout=5)
+        # Requests land on arbitrary workers; several ready answers in a row make it likely all are.
+        ready = ready + 1 if status == 200 and len(children(master.pid)) == workers else 0
+        if ready >= workers * 3:
+            return
+        time.sleep(0.2)
+    raise TimeoutError("the workers did not become ready")
+
+
+def run(workers, shared, api_urls, port, timeout):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), NLP_PRELOAD="1" if shared else "0",
+               SCHEMA_REFRESH_INTERVAL="0", PYTHONUNBUFFERED="1")
+    artifacts = tempfile.TemporaryDirectory() if shared else None
+    env["SHARED_ARTIFACT_DIR"] = artifacts.name if artifacts else ""
+    base_url = f"http://127.0.0.1:{port}"
+    master = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:app", "--bind", f"127.0.0.1:{port}",
+                               "--workers", str(workers)],
+                              cwd=MODULE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        wait_ready(base_url, master, workers, timeout)
+        startup = time.perf_counter() - start
+        for api_url in api_urls:
+            for user_input in REQUESTS * workers * 2:
+                params = urllib.parse.urlencode({"api_url": api_url, "user_input": user_input, "model": "custom"})
+                get(f"{base_url}/apis/generate_query?{params}")
+            get(f"{base_url}/apis/entities?{urllib.parse.urlencode({'api_url': api_url})}")
+        master_memory = memory_kib(master.pid)
+        worker_memory = [memory_kib(pid) for pid in children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+        if artifacts is not None:
+            artifacts.cleanup()
+
+    return {
+        "workers": workers,
+        "shared": shared,
+        "startup_s": round(startup, 2),
+        "master_rss_mib": round(master_memory["rss"] / 1024, 1),
+        "worker_rss_mib": round(sum(memory["rss"] for memory in worker_memory) / len(worker_memory) / 1024, 1),
+        "worker_pss_mib": round(sum(memory["pss"] for memory in worker_memory) / len(worker_memory) / 1024, 1),
+        "total_pss_mib": round((master_memory["pss"] + sum(memory["pss"] for memory in worker_memory)) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--api-url", action="append", default=[])
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'shared':>6} {'startup s':>9} {'master RSS':>10} {'worker RSS':>10} "
+          f"{'worker PSS':>10} {'total PSS':>9}   (MiB)")
+    results = []
+    for workers in args.workers:
+        for shared in (False, True):
+            result = run(workers, shared, args.api_url, args.port, args.timeout)
+            results.append(result)
+            print(f"{workers:7} {str(shared):>6} {result['startup_s']:9} {result['master_rss_mib']:10} "
+                  f"{result['worker_rss_mib']:10} {result['worker_pss_mib']:10} {result['total_pss_mib']:9}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class LazyResource:
+    """
+    Value produced by a loader on first use, exactly once, from whichever thread asks first.
+    A failed load is remembered in the state and retried on the next get().
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded = False
+        self.error = None
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    try:
+                        self._value = self._loader()
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.load_seconds = time.perf_counter() - start
+                    self.error = None
+                    self._loaded = True
+        return self._value
+
+    def state(self):
+        if self._loaded:
+            return {"state": "loaded", "load_seconds": round(self.load_seconds, 3)}
+        if self.error:
+            return {"state": "failed", "error": self.error}
+        return {"state": "not_loaded"}
@@ -0,0 +1,238 @@
+"""
+Lightweight request instrumentation: per-stage timers reported as Server-Timing, request IDs,
+and counters and latency histograms rendered in the Prometheus text format on /metrics.
+
+With METRICS_ENABLED=0 stages and metric updates return immediately; only the request ID is kept.
+Metrics are per process, so with several server workers each worker reports its own.
+"""
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in {"1", "true", "yes"}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id = ContextVar("request_id", default=None)
+_timings = ContextVar("timings", default=None)
+
+
+def _label_value(value):
+    # The exposition format escapes backslash, double quote and line feed in label values.
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames, labels):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_label_value(value)}"' for name, value in zip(labelnames, labels))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][position] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, count, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _label_text(self.labelnames + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _label_text(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {total}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Counter or gauge whose samples are read from collect() at render time, for values other modules
+    already track. collect returns (label values, value) pairs.
+    """
+
+    def __init__(self, name, documentation, metric_type, labelnames, collect):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labelnames = tuple(labelnames)
+        self._collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for key, value in self._collect():
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+_metrics = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+request_seconds = register(Histogram("http_request_duration_seconds", "Latency of HTTP requests by handler.",
+                                     ("method", "handler", "status")))
+stage_seconds = register(Histogram("stage_duration_seconds", "Latency of request processing stages.", ("stage",)))
+upstream_errors = register(Counter("upstream_errors_total", "Failed calls to upstream services.",
+                                   ("upstream", "kind")))
+
+
+class stage:
+    """
+    Times a block as one processing stage: observed in stage_duration_seconds and, inside a request,
+    reported in its Server-Timing header.
+
+        with stage("spacy"):
+            doc = nlp(text)
+    """
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if METRICS_ENABLED:
+            record_stage(self.name, time.perf_counter() - self._start)
+        return False
+
+
+def record_stage(name, seconds):
+    stage_seconds.observe(seconds, stage=name)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds * 1000))
+
+
+def server_timing(timings):
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings)
+
+
+def parse_server_timing(header, prefix=""):
+    """
+    (name, milliseconds) pairs of a Server-Timing header, e.g. to relay an upstream's stages.
+    """
+    timings = []
+    for entry in (header or "").split(","):
+        name, *params = [part.strip() for part in entry.split(";")]
+        durations = [param[4:] for param in params if param.startswith("dur=")]
+        if name and durations:
+            try:
+                timings.append((prefix + name, float(durations[0])))
+            except ValueError:
+                pass
+    return timings
+
+
+def add_timings(timings):
+    current = _timings.get()
+    if METRICS_ENABLED and current is not None:
+        current.extend(timings)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that assigns every request an ID (taken from X-Request-ID when the caller sends
+    one), echoes it back, collects the request's stages into a Server-Timing header and observes
+    its latency per handler.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        rid = headers.get(REQUEST_ID_HEADER.lower().encode("latin-1"), b"").decode("latin-1") or uuid.uuid4().hex
+        request_id.set(rid)
+        timings = [] if METRICS_ENABLED else None
+        _timings.set(timings)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                extra = [(REQUEST_ID_HEADER.encode("latin-1"), rid.encode("latin-1"))]
+                if timings is not None:
+                    total = ("total", (time.perf_counter() - start) * 1000)
+                    extra.append((b"server-timing", server_timing(timings + [total]).encode("latin-1")))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            if METRICS_ENABLED:
+                endpoint = scope.get("endpoint")
+                handler = getattr(endpoint, "__name__", "unmatched")
+                request_seconds.observe(time.perf_counter() - start, method=scope["method"], handler=handler,
+                                        status=status[0])
@@ -0,0 +1,147 @@
+"""
+Query cost model over a SchemaIndex: selection depth, estimated list fan-out and field count.
+
+A field costs one for every value expected to resolve, i.e. one times the fan-out of every list
+above it. A list's fan-out is the page size the query asks for (first, limit, ... on the list or on
+the connection field right above it) or QUERY_COST_LIST_SIZE when there is none.
+"""
+import os
+from collections import namedtuple
+
+from graphql import (FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, InlineFragmentNode,
+                     ObjectValueNode, OperationDefinitionNode, OperationType, parse)
+
+from common.query_validator import strip_fences
+from common.schema_index import COMPOSITE_KINDS
+
+QUERY_COST_LIST_SIZE = int(os.environ.get("QUERY_COST_LIST_SIZE", 50))
+QUERY_COST_BUDGET = float(os.environ.get("QUERY_COST_BUDGET", 1000))
+QUERY_PAGE_SIZE = int(os.environ.get("QUERY_PAGE_SIZE", 20))
+
+PAGE_SIZE_ARGUMENTS = ("first", "last", "limit", "take", "pageSize", "perPage", "itemsPerPage", "size", "count")
+NUMERIC_TYPES = {"Int", "Float"}
+
+QueryCost = namedtuple("QueryCost", ["cost", "depth", "fields"])
+
+
+class QueryCostExceeded(ValueError):
+    pass
+
+
+def page_size_argument(index, query_name):
+    """
+    Key path of the numeric page size argument of a query field (possibly inside an input object), or None.
+    """
+    paths = index.argument_paths.get(query_name, {})
+    for name in PAGE_SIZE_ARGUMENTS:
+        path = paths.get(name)
+        if path and index.argument_children(query_name, path[:-1])[name].type_name in NUMERIC_TYPES:
+            return path
+    return None
+
+
+def selection_cost(index, type_name, depth=None):
+    """
+    Cost of one object of type_name selected with index.selection(type_name, depth).
+    """
+    if depth is None:
+        depth = index.selection_depth
+    cost = len(index.scalar_fields.get(type_name, ()))
+    if depth > 0:
+        for info in index.types[type_name].fields.values():
+            if info.kind in COMPOSITE_KINDS and not info.required_args and index.selection(info.type_name, depth - 1):
+                fan_out = QUERY_COST_LIST_SIZE if info.is_list else 1
+                cost += 1 + fan_out * selection_cost(index, info.type_name, depth - 1)
+    return cost
+
+
+def field_cost(index, info, list_size=QUERY_COST_LIST_SIZE):
+    """
+    Cost of selecting one field, as build_fields renders it, on one object.
+    """
+    if info.kind not in COMPOSITE_KINDS:
+        return 1
+    return 1 + (list_size if info.is_list else 1) * selection_cost(index, info.type_name)
+
+
+def _page_size(arguments):
+    for argument in arguments:
+        if argument.name.value in PAGE_SIZE_ARGUMENTS:
+            try:
+                return max(int(float(argument.value.value)), 0)
+            except (AttributeError, TypeError, ValueError):
+                return None
+        if isinstance(argument.value, ObjectValueNode):
+            page_size = _page_size(argument.value.fields)
+            if page_size is not None:
+                return page_size
+    return None
+
+
+def _selections_cost(index, fields, selection_set, multiplier, page_size, fragments, visited):
+    cost, depth, count = 0, 0, 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            info = fields.get(selection.name.value) if fields else None
+            requested = _page_size(selection.arguments)
+            cost += multiplier
+            count += 1
+            if selection.selection_set is None:
+                depth = max(depth, 1)
+                continue
+            fan_out, inner_page_size = 1, None
+            if info is not None and info.is_list:
+                fan_out = next(size for size in (requested, page_size, QUERY_COST_LIST_SIZE) if size is not None)
+            else:
+                inner_page_size = requested
+            type_info = index.types.get(info.type_name) if info is not None else None
+            nested = _selections_cost(index, type_info.fields if type_info else None, selection.selection_set,
+                                      multiplier * fan_out, inner_page_size, fragments, visited)
+            cost += nested.cost
+            depth = max(depth, nested.depth + 1)
+            count += nested.fields
+            continue
+
+        if isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            if name in visited or name not in fragments:
+                continue
+            fragment, visited = fragments[name], visited | {name}
+        elif isinstance(selection, InlineFragmentNode):
+            fragment = selection
+        else:
+            continue
+        type_info = index.types.get(fragment.type_condition.name.value) if fragment.type_condition else None
+        nested = _selections_cost(index, type_info.fields if type_info else fields, fragment.selection_set,
+                                  multiplier, page_size, fragments, visited)
+        cost += nested.cost
+        depth = max(depth, nested.depth)
+        count += nested.fields
+    return QueryCost(cost, depth, count)
+
+
+def estimate_cost(index, query):
+    """
+    QueryCost of the query operations in a document; fields the schema does not know count as leaves.
+    """
+    document = parse(strip_fences(query), no_location=True)
+    fragments = {definition.name.value: definition for definition in document.definitions
+                 if isinstance(definition, FragmentDefinitionNode)}
+    cost, depth, count = 0, 0, 0
+    for definition in document.definitions:
+        if isinstance(definition, OperationDefinitionNode) and definition.operation == OperationType.QUERY:
+            total = _selections_cost(index, index.queries, definition.selection_set, 1, None, fragments, frozenset())
+            cost += total.cost
+            depth = max(depth, total.depth)
+            count += total.fields
+    return QueryCost(cost, depth, count)
+
+
+def query_cost(index, query):
+    """
+    estimate_cost as a dict for API responses, or None for a query that does not parse.
+    """
+    try:
+        return estimate_cost(index, query)._asdict()
+    except GraphQLError:
+        return None
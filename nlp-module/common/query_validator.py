@@ -0,0 +1,106 @@
+"""
+Local validation of generated queries against an API's cached GraphQLSchema, so a broken query
+is reported with the query instead of after a round trip to the API.
+"""
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+from graphql import GraphQLError, parse, specified_rules, validate, validate_schema
+from graphql.validation import (FragmentsOnCompositeTypesRule, KnownDirectivesRule, KnownFragmentNamesRule,
+                                KnownTypeNamesRule, NoFragmentCyclesRule, NoUndefinedVariablesRule,
+                                NoUnusedFragmentsRule, NoUnusedVariablesRule, PossibleFragmentSpreadsRule,
+                                SingleFieldSubscriptionsRule, UniqueDirectivesPerLocationRule,
+                                UniqueFragmentNamesRule, UniqueVariableNamesRule, VariablesAreInputTypesRule,
+                                VariablesInAllowedPositionRule)
+
+from common.metrics import stage
+
+VALIDATION_MAX_ERRORS = 20
+VALIDATION_CACHE_SIZE = int(os.environ.get("VALIDATION_CACHE_SIZE", 1024))
+
+FENCE_PATTERN = re.compile(r"^\s*```[a-zA-Z]*\s*\n|\n?\s*```\s*$")
+
+# Rules that can only report something when the query uses the feature. Whether it does is decided
+# from the query text, conservatively: a marker inside a string literal merely keeps the rules on.
+FEATURE_RULES = {
+    "fragments": {FragmentsOnCompositeTypesRule, UniqueFragmentNamesRule, KnownFragmentNamesRule,
+                  NoUnusedFragmentsRule, PossibleFragmentSpreadsRule, NoFragmentCyclesRule, KnownTypeNamesRule},
+    "variables": {VariablesAreInputTypesRule, UniqueVariableNamesRule, NoUndefinedVariablesRule,
+                  NoUnusedVariablesRule, VariablesInAllowedPositionRule, KnownTypeNamesRule},
+    "directives": {KnownDirectivesRule, UniqueDirectivesPerLocationRule},
+    "subscription": {SingleFieldSubscriptionsRule},
+}
+
+_rule_sets = {}
+_results = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def strip_fences(query):
+    """
+    Query text without the Markdown code fence the OpenAI model tends to wrap it in.
+    """
+    return FENCE_PATTERN.sub("", query).strip()
+
+
+def query_features(query):
+    features = set()
+    if "..." in query or "fragment" in query:
+        features.add("fragments")
+    if "$" in query:
+        features.add("variables")
+    if "@" in query:
+        features.add("directives")
+    if "subscription" in query:
+        features.add("subscription")
+    return frozenset(features)
+
+
+def validation_rules(features):
+    """
+    specified_rules, in order, minus the rules for features the query does not use. Built once per feature set.
+    """
+    rules = _rule_sets.get(features)
+    if rules is None:
+        needed = set().union(*(FEATURE_RULES[feature] for feature in features))
+        unused = set().union(*FEATURE_RULES.values()) - needed
+        rules = _rule_sets[features] = tuple(rule for rule in specified_rules if rule not in unused)
+    return rules
+
+
+def _validate(schema, query):
+    try:
+        document = parse(query)
+    except GraphQLError as e:
+        return {"valid": False, "errors": [e.formatted]}
+    errors = validate(schema, document, validation_rules(query_features(query)), max_errors=VALIDATION_MAX_ERRORS)
+    return {"valid": not errors, "errors": [error.formatted for error in errors]}
+
+
+def validate_query(schema, query):
+    """
+    Parse and validate a query. Returns {"valid": bool, "errors": [formatted GraphQL errors]}, or None
+    when the API's own schema does not pass validation and there is nothing to check against.
+
+    graphql-core checks the schema itself only once and keeps the result on the schema object, and
+    results are remembered per schema for the most recent queries, so a repeated query costs a lookup.
+    """
+    with stage("validation"):
+        if validate_schema(schema):
+            return None
+        query = strip_fences(query)
+        with _lock:
+            results = _results.setdefault(schema, OrderedDict())
+            result = results.get(query)
+            if result is not None:
+                results.move_to_end(query)
+                return result
+        result = _validate(schema, query)
+        with _lock:
+            results[query] = result
+            while len(results) > VALIDATION_CACHE_SIZE:
+                results.popitem(last=False)
+    return result
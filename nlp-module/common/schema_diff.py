@@ -0,0 +1,134 @@
+"""
+Structural comparison of two introspection results.
+
+The structural hash ignores descriptions and the order of types, fields, arguments and enum values,
+so it only changes when something a query or a derived artifact depends on changes. The diff lists
+added and removed types and, per changed type, the added, removed and changed members (fields,
+input fields or enum values).
+"""
+import hashlib
+import json
+from collections import namedtuple
+
+MEMBER_KEYS = ("fields", "inputFields", "enumValues")
+IGNORED_KEYS = {"description", "deprecationReason"}
+
+SchemaDiff = namedtuple("SchemaDiff", ["added_types", "removed_types", "changed_types", "root_changed"])
+
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items() if key not in IGNORED_KEYS}
+    if isinstance(value, list):
+        items = [_canonical(item) for item in value]
+        if all(isinstance(item, dict) and "name" in item for item in items):
+            items.sort(key=lambda item: item["name"])
+        return items
+    return value
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def type_signatures(introspection):
+    """
+    Canonical form of every named type, without its members: {type name: (type digest, {member name: digest})}.
+    """
+    signatures = {}
+    for gql_type in introspection["types"]:
+        canonical = _canonical(gql_type)
+        members = {}
+        for key in MEMBER_KEYS:
+            for member in canonical.pop(key, None) or ():
+                members[member["name"]] = _digest(member)
+        signatures[gql_type["name"]] = (_digest(canonical), members)
+    return signatures
+
+
+def root_types(introspection):
+    return tuple((introspection.get(key) or {}).get("name")
+                 for key in ("queryType", "mutationType", "subscriptionType"))
+
+
+def structural_hash(introspection):
+    signatures = type_signatures(introspection)
+    return _digest([root_types(introspection), sorted((name, digest, sorted(members.items()))
+                                                      for name, (digest, members) in signatures.items())])
+
+
+def diff_schemas(old_introspection, new_introspection):
+    old, new = type_signatures(old_introspection), type_signatures(new_introspection)
+    changed = {}
+    for name in old.keys() & new.keys():
+        (old_digest, old_members), (new_digest, new_members) = old[name], new[name]
+        if old_digest == new_digest and old_members == new_members:
+            continue
+        changed[name] = {
+            "type_changed": old_digest != new_digest,
+            "added": sorted(new_members.keys() - old_members.keys()),
+            "removed": sorted(old_members.keys() - new_members.keys()),
+            "changed": sorted(member for member in old_members.keys() & new_members.keys()
+                              if old_members[member] != new_members[member]),
+        }
+    return SchemaDiff(
+        added_types=sorted(new.keys() - old.keys()),
+        removed_types=sorted(old.keys() - new.keys()),
+        changed_types=changed,
+        root_changed=root_types(old_introspection) != root_types(new_introspection),
+    )
+
+
+def diff_size(diff):
+    """
+    (number of added, removed or changed types, number of added, removed or changed members).
+    """
+    types = len(diff.added_types) + len(diff.removed_types) + len(diff.changed_types)
+    members = sum(len(change["added"]) + len(change["removed"]) + len(change["changed"])
+                  for change in diff.changed_types.values())
+    return types, members
+
+
+def touched_types(diff):
+    return set(diff.added_types) | set(diff.removed_types) | set(diff.changed_types)
+
+
+def affected_query_fields(diff, index, query_type_name):
+    """
+    Query root fields whose result or argument types reach a touched type in index (the new schema),
+    plus root fields that were added, removed or changed. None when the root types changed, meaning all.
+    """
+    if diff.root_changed:
+        return None
+    touched = touched_types(diff)
+
+    # Walk the type graph backwards from the touched types to everything that can reach them.
+    referrers = {}
+    for type_name, type_info in index.types.items():
+        for info in type_info.fields.values():
+            referrers.setdefault(info.type_name, set()).add(type_name)
+    reaching, pending = set(touched), list(touched)
+    while pending:
+        for referrer in referrers.get(pending.pop(), ()):
+            if referrer not in reaching:
+                reaching.add(referrer)
+                pending.append(referrer)
+
+    affected = set()
+    root_change = diff.changed_types.get(query_type_name)
+    if root_change is not None:
+        affected.update(root_change["added"], root_change["removed"], root_change["changed"])
+    for query_name, info in index.queries.items():
+        if info.type_name in reaching or any(arg.type_name in reaching for arg in index.arguments[query_name].values()):
+            affected.add(query_name)
+    return affected
+
+
+def diff_summary(diff, affected):
+    return {
+        "added_types": diff.added_types,
+        "removed_types": diff.removed_types,
+        "changed_types": diff.changed_types,
+        "root_changed": diff.root_changed,
+        "affected_query_fields": None if affected is None else sorted(affected),
+    }
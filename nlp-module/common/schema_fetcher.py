@@ -1,63 +1,143 @@
+import asyncio
+import atexit
+import os
+import threading
+import weakref
 from pprint import pprint
+from urllib.parse import urlsplit
 
-from gql import gql, Client
-from gql.transport.aiohttp import AIOHTTPTransport
-from graphql import GraphQLInputObjectType, GraphQLObjectType
+import aiohttp
+from gql.transport.exceptions import TransportQueryError
+from graphql import GraphQLInputObjectType, GraphQLObjectType, build_client_schema, get_introspection_query
 
+from common.single_flight import SingleFlight
+
+SCHEMA_FETCH_TIMEOUT = float(os.environ.get("SCHEMA_FETCH_TIMEOUT", 30))
+
+INTROSPECTION_QUERY = get_introspection_query(descriptions=False)
+
+# aiohttp sessions are bound to the event loop that created them, so the pool is kept per loop and host.
+_sessions = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+# Concurrent introspections of the same URL on one event loop share a single request.
+introspections = SingleFlight("introspection")
 
-def fetch_graphql_schema(api_url):
-    transport = AIOHTTPTransport(url=api_url)
 
+async def _get_session(api_url):
+    loop = asyncio.get_running_loop()
+    host = urlsplit(api_url).netloc
+    with _sessions_lock:
+        loop_sessions = _sessions.setdefault(loop, {})
+        session = loop_sessions.get(host)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SCHEMA_FETCH_TIMEOUT))
+            loop_sessions[host] = session
+    return session
+
+
+async def close_sessions():
     """
-    Fetch the GraphQL schema using introspection.
+    Close the pooled sessions that belong to the running event loop.
     """
-    query = gql("""
-    query IntrospectionQuery {
-      __schema {
-        queryType { name }
-        types {
-          ...FullType
-        }
-      }
-    }
-    fragment FullType on __Type {
-      kind
-      name
-      fields(includeDeprecated: true) {
-        name
-        args {
-          name
-          type {
-            ...TypeRef
-          }
-        }
-        type {
-          ...TypeRef
-        }
-      }
-      inputFields {
-        name
-        type { ...TypeRef }
-      }
-    }
-    fragment TypeRef on __Type {
-      kind
-      name
-      ofType {
-        kind
-        name
-        ofType {
-          kind
-          name
-        }
-      }
-    }
-    """)
+    with _sessions_lock:
+        loop_sessions = _sessions.pop(asyncio.get_running_loop(), {})
+    for session in loop_sessions.values():
+        await session.close()
 
-    client = Client(transport=transport, fetch_schema_from_transport=True)
 
-    result = client.execute(query)
-    return client.schema, result['__schema']
+async def fetch_graphql_schema_async(api_url):
+    """
+    Fetch the GraphQL schema using a single introspection request.
+    Returns the GraphQLSchema built locally from the result and the raw __schema dict.
+    """
+    return await introspections.do_async(api_url, lambda: _introspect(api_url))
+
+
+async def _introspect(api_url):
+    session = await _get_session(api_url)
+    payload = {"query": INTROSPECTION_QUERY, "operationName": "IntrospectionQuery"}
+    async with session.post(api_url, json=payload) as response:
+        response.raise_for_status()
+        result = await response.json(content_type=None)
+
+    if result.get("errors"):
+        raise TransportQueryError(str(result["errors"][0]), errors=result["errors"], data=result.get("data"))
+
+    data = result["data"]
+    return build_client_schema(data), data["__schema"]
+
+
+async def fetch_graphql_schemas_async(api_urls):
+    """
+    Introspect several APIs concurrently. Failed fetches map to their exception.
+    """
+    results = await asyncio.gather(*(fetch_graphql_schema_async(url) for url in api_urls), return_exceptions=True)
+    return dict(zip(api_urls, results))
+
+
+def _background_loop():
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="schema-fetcher", daemon=True)
+            _loop_thread.start()
+    return _loop
+
+
+def stop_background_loop():
+    """
+    Close the background loop's sessions, then stop and close the loop, e.g. before the process forks.
+    The next synchronous fetch starts a new one.
+    """
+    global _loop, _loop_thread
+    with _loop_lock:
+        loop, thread = _loop, _loop_thread
+        _loop = _loop_thread = None
+    if loop is None:
+        return
+    asyncio.run_coroutine_threadsafe(close_sessions(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def _reset_after_fork():
+    # A forked child has none of the parent's threads: its copy of the loop would never run again.
+    global _loop, _loop_thread, _loop_lock, _sessions, _sessions_lock
+    _loop = _loop_thread = None
+    _loop_lock = threading.Lock()
+    _sessions = weakref.WeakKeyDictionary()
+    _sessions_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_sync(coroutine):
+    """
+    Run a coroutine on the fetcher's background loop, so synchronous callers share its pooled sessions.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _background_loop()).result()
+
+
+@atexit.register
+def _close_background_sessions():
+    if _loop is not None and _loop.is_running():
+        run_sync(close_sessions())
+
+
+def fetch_graphql_schema(api_url):
+    return run_sync(fetch_graphql_schema_async(api_url))
+
+
+def fetch_graphql_schemas(api_urls):
+    return run_sync(fetch_graphql_schemas_async(api_urls))
 
 
 def extract_fields(graphql_type, visited_types=None):
@@ -131,11 +211,18 @@ def extract_input_object_fields(input_type, visited_types=None):
     return fields
 
 
-def parse_graphql_schema(schema):
+def parse_graphql_schema(schema, reuse=None):
+    """
+    Arguments and nested fields of every query field. reuse maps query field names to entries parsed
+    earlier that are still valid, e.g. from a previous version of the schema.
+    """
     query_fields = schema.query_type.fields
     result = {}
 
     for query_name, query_field in query_fields.items():
+        if reuse and query_name in reuse:
+            result[query_name] = reuse[query_name]
+            continue
         query_info = {
             "arguments": extract_arguments(query_field),  # Extract query arguments
             "fields": extract_fields(query_field.type)  # Extract fields
@@ -0,0 +1,214 @@
+import os
+from collections import namedtuple
+
+from graphql import (GraphQLEnumType, GraphQLInputObjectType, GraphQLInterfaceType, GraphQLList, GraphQLNonNull,
+                     GraphQLObjectType, GraphQLScalarType, GraphQLUnionType)
+from graphql.pyutils import Undefined
+
+SCHEMA_SELECTION_DEPTH = int(os.environ.get("SCHEMA_SELECTION_DEPTH", 0))
+SCHEMA_ARGUMENT_DEPTH = int(os.environ.get("SCHEMA_ARGUMENT_DEPTH", 4))
+
+LEAF_KINDS = {"SCALAR", "ENUM"}
+COMPOSITE_KINDS = {"OBJECT", "INTERFACE", "UNION"}
+
+FieldInfo = namedtuple("FieldInfo", ["type_name", "kind", "is_list", "required_args"])
+TypeInfo = namedtuple("TypeInfo", ["kind", "fields"])
+
+
+def type_kind(named_type):
+    if isinstance(named_type, GraphQLObjectType):
+        return "OBJECT"
+    if isinstance(named_type, GraphQLInterfaceType):
+        return "INTERFACE"
+    if isinstance(named_type, GraphQLUnionType):
+        return "UNION"
+    if isinstance(named_type, GraphQLInputObjectType):
+        return "INPUT_OBJECT"
+    if isinstance(named_type, GraphQLEnumType):
+        return "ENUM"
+    if isinstance(named_type, GraphQLScalarType):
+        return "SCALAR"
+    return None
+
+
+def field_info(graphql_type, args=None):
+    is_list = False
+    while hasattr(graphql_type, 'of_type'):
+        if isinstance(graphql_type, GraphQLList):
+            is_list = True
+        graphql_type = graphql_type.of_type
+
+    required_args = any(
+        isinstance(arg.type, GraphQLNonNull) and arg.default_value is Undefined for arg in (args or {}).values()
+    )
+    return FieldInfo(graphql_type.name, type_kind(graphql_type), is_list, required_args)
+
+
+class SchemaIndex:
+    """
+    Flat, compiled view of a GraphQLSchema, built once per schema.
+
+    Holds a type table, the query root fields with their arguments, inverted maps from
+    field and argument names to their key paths, the selectable leaf fields of every type and the
+    values of every enum.
+    When a synonyms callable is given, every argument container also gets a synonym -> key map; maps of
+    a previous index (reuse_synonyms) are taken over for containers with the same keys in the same order.
+    Nested selections are rendered on demand and memoized per (type, depth).
+    The index only holds plain Python data, so it can be pickled independently of the schema.
+    """
+
+    def __init__(self, schema, selection_depth=SCHEMA_SELECTION_DEPTH, argument_depth=SCHEMA_ARGUMENT_DEPTH,
+                 synonyms=None, reuse_synonyms=None):
+        self.selection_depth = selection_depth
+        self.argument_depth = argument_depth
+        self.types = {}
+        self.queries = {}
+        self.arguments = {}
+        self.scalar_fields = {}
+        self.argument_paths = {}
+        self.field_paths = {}
+        self.argument_synonyms = {}
+        self.enum_values = {}
+        self._selections = {}
+
+        for type_name, named_type in schema.type_map.items():
+            if type_name.startswith("__"):
+                continue
+            fields = {}
+            if isinstance(named_type, (GraphQLObjectType, GraphQLInterfaceType)):
+                fields = {name: field_info(field.type, field.args) for name, field in named_type.fields.items()}
+            elif isinstance(named_type, GraphQLInputObjectType):
+                fields = {name: field_info(field.type) for name, field in named_type.fields.items()}
+            elif isinstance(named_type, GraphQLEnumType):
+                self.enum_values[type_name] = {value.lower(): value for value in named_type.values}
+            self.types[type_name] = TypeInfo(type_kind(named_type), fields)
+
+        for type_name, type_info in self.types.items():
+            if type_info.kind in COMPOSITE_KINDS:
+                self.scalar_fields[type_name] = tuple(
+                    name for name, info in type_info.fields.items() if info.kind in LEAF_KINDS and not info.required_args
+                )
+
+        query_type = schema.query_type
+        for query_name, query_field in (query_type.fields.items() if query_type else ()):
+            self.queries[query_name] = field_info(query_field.type, query_field.args)
+            self.arguments[query_name] = {name: field_info(arg.type) for name, arg in query_field.args.items()}
+            self.argument_paths[query_name] = self._index_arguments(self.arguments[query_name])
+            self._index_fields(self.queries[query_name].type_name, (query_name,), self.selection_depth + 1)
+
+        containers = {("query", name): arguments for name, arguments in self.arguments.items()}
+        containers.update({("input", name): type_info.fields for name, type_info in self.types.items()
+                           if type_info.kind == "INPUT_OBJECT"})
+        for container_key, container in containers.items():
+            previous = (reuse_synonyms or {}).get(container_key)
+            if previous is not None and list(dict.fromkeys(previous.values())) == list(container):
+                self.argument_synonyms[container_key] = previous
+                continue
+            matches = {}
+            for key in container:
+                matches.setdefault(key, key)
+                for synonym in (synonyms(key) if synonyms else ()):
+                    matches.setdefault(synonym, key)
+            self.argument_synonyms[container_key] = matches
+
+    def _index_arguments(self, arguments):
+        # Same precedence as a depth-first key search: a level's own keys win over anything nested below them.
+        paths = {}
+
+        def walk(container, path, visited):
+            if len(path) >= self.argument_depth:
+                return
+            for name in container:
+                paths.setdefault(name, path + (name,))
+            for name, info in container.items():
+                if info.kind == "INPUT_OBJECT" and info.type_name not in visited:
+                    walk(self.types[info.type_name].fields, path + (name,), visited | {info.type_name})
+
+        walk(arguments, (), frozenset())
+        return paths
+
+    def _index_fields(self, type_name, path, depth):
+        if depth <= 0 or type_name not in self.types:
+            return
+        for name, info in self.types[type_name].fields.items():
+            self.field_paths.setdefault(name, []).append(path + (name,))
+            if info.kind in COMPOSITE_KINDS:
+                self._index_fields(info.type_name, path + (name,), depth - 1)
+
+    def resource_type(self, query_name):
+        return self.queries[query_name].type_name
+
+    def fields_of(self, query_name):
+        type_info = self.types.get(self.resource_type(query_name))
+        return type_info.fields if type_info else {}
+
+    def argument_path(self, query_name, name):
+        return self.argument_paths.get(query_name, {}).get(name)
+
+    def _container_key(self, query_name, path):
+        container_key = ("query", query_name)
+        container = self.arguments.get(query_name, {})
+        for key in path:
+            info = container.get(key)
+            if info is None or info.kind != "INPUT_OBJECT":
+                return None
+            container_key = ("input", info.type_name)
+            container = self.types[info.type_name].fields
+        return container_key
+
+    def argument_children(self, query_name, path=()):
+        """
+        Arguments (for an empty path) or input fields found at the given argument key path.
+        """
+        container_key = self._container_key(query_name, path)
+        if container_key is None:
+            return {}
+        if container_key[0] == "query":
+            return self.arguments.get(query_name, {})
+        return self.types[container_key[1]].fields
+
+    def synonyms_at(self, query_name, path=()):
+        """
+        Synonym -> key map of the arguments or input fields found at the given argument key path.
+        """
+        return self.argument_synonyms.get(self._container_key(query_name, path), {})
+
+    def match_argument(self, query_name, path, word):
+        """
+        Key at the given argument key path that equals word or lists it among its synonyms.
+        """
+        return self.synonyms_at(query_name, path).get(word)
+
+    def filter_argument(self, query_name):
+        """
+        First argument of the query that takes an input object (e.g. "filter", "where").
+        """
+        return next((name for name, info in self.arguments.get(query_name, {}).items()
+                     if info.kind == "INPUT_OBJECT"), None)
+
+    def enum_value(self, type_name, word):
+        """
+        Value of an enum that equals word, ignoring case.
+        """
+        return self.enum_values.get(type_name, {}).get(str(word).lower())
+
+    def first_input_field(self, type_name):
+        return next(iter(self.types[type_name].fields), None)
+
+    def selection(self, type_name, depth=None):
+        """
+        Selection set body for a composite type: its leaf fields and, while depth allows, its nested objects.
+        """
+        if depth is None:
+            depth = self.selection_depth
+        key = (type_name, depth)
+        if key not in self._selections:
+            parts = list(self.scalar_fields.get(type_name, ()))
+            if depth > 0:
+                for name, info in self.types[type_name].fields.items():
+                    if info.kind in COMPOSITE_KINDS and not info.required_args:
+                        nested = self.selection(info.type_name, depth - 1)
+                        if nested:
+                            parts.append(f"{name} {{ {nested} }}")
+            self._selections[key] = " ".join(parts)
+        return self._selections[key]
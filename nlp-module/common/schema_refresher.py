@@ -0,0 +1,189 @@
+"""
+Background re-introspection of the known APIs on a fixed interval.
+
+A refresh whose schema is structurally unchanged keeps the cached entry and its artifacts. A changed
+schema gets a new entry, which rebuilds only what the change touched from the previous entry (see
+SchemaEntry.inherit) before the registry publishes it. Every refresh goes through SchemaRegistry.refresh:
+this thread's, the background refresh of a stale snapshot and POST /schema_cache alike. Its listener
+here records the diff and tells query-manager which query root fields were affected, so it can keep the
+cached queries that are still valid.
+
+Of the server workers only the one holding the SCHEMA_REFRESH_LOCK file lock runs the periodic refresh,
+so a cycle introspects every API once and notifies query-manager once; when that worker exits another
+takes the lock over at its next interval. The other workers load the new snapshot from the snapshot
+store when their entries expire.
+"""
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: every process refreshes
+    fcntl = None
+
+import httpx
+
+from common.metrics import Histogram, register
+from common.schema_diff import diff_size, diff_summary
+
+SCHEMA_REFRESH_INTERVAL = float(os.environ.get("SCHEMA_REFRESH_INTERVAL", 1800))
+SCHEMA_REFRESH_TIMEOUT = float(os.environ.get("SCHEMA_REFRESH_TIMEOUT", 10))
+# Comma separated API URLs to refresh besides the cached and stored ones.
+SCHEMA_REFRESH_APIS = os.environ.get("SCHEMA_REFRESH_APIS", "")
+# query-manager lists the bundled APIs on /apis and takes schema change notifications; empty disables both.
+QUERY_MANAGER_URL = os.environ.get("QUERY_MANAGER_URL", "http://127.0.0.1:8000")
+# Lock file electing the one process that runs the periodic refresh; empty lets every process refresh.
+SCHEMA_REFRESH_LOCK = os.environ.get("SCHEMA_REFRESH_LOCK",
+                                     os.path.join(tempfile.gettempdir(), "nlp-module-schema-refresh.lock"))
+
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+refresh_seconds = register(Histogram("schema_refresh_duration_seconds", "Latency of background schema refreshes.",
+                                     ("api_url", "outcome")))
+diff_types = register(Histogram("schema_diff_types", "Types added, removed or changed by a schema refresh.",
+                                ("api_url",), buckets=COUNT_BUCKETS))
+diff_members = register(Histogram("schema_diff_members",
+                                  "Fields, input fields and enum values added, removed or changed by a schema refresh.",
+                                  ("api_url",), buckets=COUNT_BUCKETS))
+
+
+class SchemaRefresher:
+    """
+    Thread refreshing every known API of a SchemaRegistry every interval seconds.
+    """
+
+    def __init__(self, registry, interval=SCHEMA_REFRESH_INTERVAL, api_urls=SCHEMA_REFRESH_APIS,
+                 query_manager_url=QUERY_MANAGER_URL, lock_path=SCHEMA_REFRESH_LOCK):
+        self.registry = registry
+        self.interval = interval
+        self.api_urls = [url.strip() for url in api_urls.split(",") if url.strip()]
+        self.query_manager_url = query_manager_url.rstrip("/")
+        self.lock_path = lock_path
+        self.results = {}
+        self.runs = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        registry.listeners.append(self.schema_changed)
+
+    @property
+    def enabled(self):
+        return bool(self.interval) and not self.registry.offline
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="schema-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @property
+    def leader(self):
+        """
+        Whether this process holds the refresh lock, taking it if it is free.
+        """
+        if self._lock_file is not None or not self.lock_path or fcntl is None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.leader:
+                self.run_once()
+
+    def known_api_urls(self):
+        """
+        Cached, stored, configured and query-manager's bundled API URLs.
+        """
+        api_urls = list(self.registry.stats()["entries"])
+        if self.registry.store is not None:
+            api_urls.extend(self.registry.store.api_urls())
+        api_urls.extend(self.api_urls)
+        if self.query_manager_url:
+            try:
+                response = httpx.get(f"{self.query_manager_url}/apis", timeout=SCHEMA_REFRESH_TIMEOUT)
+                response.raise_for_status()
+                api_urls.extend(api["url"] for api in response.json())
+            except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+                print(f"Listing the APIs of query-manager failed: {e}")
+        return list(dict.fromkeys(api_urls))
+
+    def run_once(self):
+        self.runs += 1
+        return {api_url: self.refresh(api_url) for api_url in self.known_api_urls()}
+
+    def refresh(self, api_url):
+        """
+        Re-introspect one API. Returns and remembers {"outcome": "unchanged" | "changed" | "failed", ...}.
+        """
+        start = time.perf_counter()
+        current = self.registry.peek(api_url)
+        try:
+            entry = self.registry.refresh(api_url)
+        except Exception as e:
+            result = {"outcome": "failed", "error": str(e)}
+        else:
+            if entry is current:
+                result = {"outcome": "unchanged", "version": entry.version}
+            else:
+                result = {"outcome": "changed", "version": entry.version}
+                if entry.diff is not None:
+                    result.update(previous_version=entry.previous_version,
+                                  diff=diff_summary(entry.diff, entry.affected_query_fields))
+        elapsed = time.perf_counter() - start
+        refresh_seconds.observe(elapsed, api_url=api_url, outcome=result["outcome"])
+        result.update(seconds=round(elapsed, 3), refreshed_at=time.time())
+        self.results[api_url] = result
+        if result["outcome"] != "unchanged":
+            print(f"Schema refresh of {api_url}: {result['outcome']} in {elapsed:.2f}s")
+        return result
+
+    def schema_changed(self, entry):
+        """
+        Registry listener: record the size of the diff and notify query-manager.
+        """
+        types, members = diff_size(entry.diff)
+        diff_types.observe(types, api_url=entry.api_url)
+        diff_members.observe(members, api_url=entry.api_url)
+        self.notify(entry.api_url, entry.previous_version, entry.version, entry.affected_query_fields)
+
+    def notify(self, api_url, old_version, new_version, affected_query_fields):
+        if not self.query_manager_url:
+            return
+        payload = {
+            "api_url": api_url,
+            "old_version": old_version,
+            "new_version": new_version,
+            "affected_query_fields": None if affected_query_fields is None else sorted(affected_query_fields),
+        }
+        try:
+            response = httpx.post(f"{self.query_manager_url}/cache/schema_change", json=payload,
+                                  timeout=SCHEMA_REFRESH_TIMEOUT)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Notifying query-manager of the schema change of {api_url} failed: {e}")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "leader": self._lock_file is not None or not self.lock_path or fcntl is None,
+            "interval": self.interval,
+            "runs": self.runs,
+            "results": dict(self.results),
+        }
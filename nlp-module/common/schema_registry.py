@@ -0,0 +1,387 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from graphql import build_client_schema
+
+from common import schema_fetcher
+from common.schema_fetcher import fetch_graphql_schema, fetch_graphql_schema_async, parse_graphql_schema
+from common.metrics import stage, upstream_errors
+from common.schema_diff import affected_query_fields, diff_schemas, structural_hash, touched_types
+from common.schema_index import SchemaIndex
+from common.single_flight import SingleFlight
+from common.snapshot_store import SCHEMA_OFFLINE, SCHEMA_SNAPSHOT_PATH, SnapshotStore, content_hash
+from rdf.rdf_processor import convert_schema_to_rdf, entity_names, serialize_graph, update_graph
+
+SCHEMA_CACHE_TTL = float(os.environ.get("SCHEMA_CACHE_TTL", 3600))
+SCHEMA_CACHE_MAX_ENTRIES = int(os.environ.get("SCHEMA_CACHE_MAX_ENTRIES", 16))
+
+artifact_builds = SingleFlight("artifact_builds")
+
+
+class SchemaEntry:
+    """
+    Introspection result of one API together with the artifacts derived from it.
+    Derived artifacts are built on first access and kept for the entry's lifetime; with a
+    snapshot store they are read from, and written back to, the store under the schema version.
+
+    An entry that replaces an older version of the same API (inherit) builds its artifacts incrementally
+    from the older entry's: only what depends on the changed types is rebuilt.
+    """
+
+    def __init__(self, api_url, schema, introspection, synonyms=None, store=None, version=None):
+        self.api_url = api_url
+        self.schema = schema
+        self.introspection = introspection
+        self.version = version or content_hash(introspection)
+        self.synonyms = synonyms
+        self.store = store
+        self.fetched_at = time.monotonic()
+        self._values = {}
+        self._types_by_name = None
+        self._structure = None
+        self.previous = None
+        self.previous_version = None
+        self.diff = None
+        self.affected_query_fields = None
+
+    def _artifact(self, name, build):
+        if self.store is not None:
+            value = self.store.load_artifact(self.api_url, self.version, name)
+            if value is not None:
+                return value
+        value = build()
+        if self.store is not None:
+            self.store.save_artifact(self.api_url, self.version, name, value)
+        return value
+
+    def _memo(self, name, build):
+        # Concurrent first accesses share one build, also across entries holding the same schema version.
+        if name not in self._values:
+            key = (self.api_url, self.version, name)
+            value = artifact_builds.do(key, lambda: self._timed_build(name, build))
+            self._values.setdefault(name, value)
+        return self._values[name]
+
+    @staticmethod
+    def _timed_build(name, build):
+        with stage(f"build_{name}"):
+            return build()
+
+    def derived(self, name, build):
+        """
+        Artifact computed once per entry by build(); lets other packages attach their own derived data.
+        """
+        return self._memo(name, lambda: self._artifact(name, build))
+
+    @property
+    def structure(self):
+        """
+        Hash of the schema's structure; unlike version it ignores descriptions and ordering.
+        """
+        if self._structure is None:
+            self._structure = structural_hash(self.introspection)
+        return self._structure
+
+    def inherit(self, previous):
+        """
+        Diff this entry's schema against the entry it replaces and reuse that entry's artifacts where
+        the diff leaves them valid.
+        """
+        self.previous = previous
+        self.previous_version = previous.version
+        self.diff = diff_schemas(previous.introspection, self.introspection)
+        self.affected_query_fields = affected_query_fields(self.diff, self.index, self.schema.query_type.name)
+
+    def _previous_artifact(self, name):
+        previous = self.previous
+        return previous._values.get(name) if previous is not None else None
+
+    def warm_from_previous(self):
+        """
+        Build the artifacts the replaced entry had built, then let it go.
+        """
+        if self.previous is None:
+            return
+        for name in list(self.previous._values):
+            if name in ("parsed_schema", "index", "graph", "entity_names"):
+                getattr(self, name)
+            elif name.startswith("rdf_"):
+                self.rdf(name[len("rdf_"):])
+        self.previous = None
+
+    def _parse(self):
+        reuse = self._previous_artifact("parsed_schema")
+        if reuse is not None and self.affected_query_fields is not None:
+            reuse = {name: value for name, value in reuse.items() if name not in self.affected_query_fields}
+            return parse_graphql_schema(self.schema, reuse=reuse)
+        return parse_graphql_schema(self.schema)
+
+    def _build_index(self):
+        previous = self._previous_artifact("index")
+        return SchemaIndex(self.schema, synonyms=self.synonyms,
+                           reuse_synonyms=previous.argument_synonyms if previous is not None else None)
+
+    def _build_graph(self):
+        previous = self.previous
+        graph = previous._values.get("graph") if previous is not None else None
+        if graph is None or self.diff is None:
+            return convert_schema_to_rdf(self.introspection)
+        return update_graph(graph, previous.types_by_name, self.types_by_name, touched_types(self.diff))
+
+    def _graph_unchanged(self):
+        previous = self._previous_artifact("graph")
+        return previous is not None and self.graph is previous
+
+    @property
+    def parsed_schema(self):
+        return self.derived("parsed_schema", self._parse)
+
+    @property
+    def index(self):
+        return self.derived("index", self._build_index)
+
+    @property
+    def graph(self):
+        return self._memo("graph", self._build_graph)
+
+    @property
+    def entity_names(self):
+        def build():
+            if self._graph_unchanged() and self._previous_artifact("entity_names") is not None:
+                return self._previous_artifact("entity_names")
+            return entity_names(self.graph)
+
+        return self._memo("entity_names", build)
+
+    @property
+    def types_by_name(self):
+        if self._types_by_name is None:
+            self._types_by_name = {gql_type["name"]: gql_type for gql_type in self.introspection["types"]}
+        return self._types_by_name
+
+    def rdf(self, rdf_format):
+        """
+        RDF graph serialized with the given rdflib format, and a strong ETag for those bytes.
+        """
+        def build():
+            previous = self._previous_artifact(f"rdf_{rdf_format}")
+            if previous is not None and self._graph_unchanged():
+                return previous
+            data = self._artifact(f"rdf_{rdf_format}", lambda: serialize_graph(self.graph, rdf_format))
+            return data, hashlib.sha256(data).hexdigest()[:32]
+
+        return self._memo(f"rdf_{rdf_format}", build)
+
+
+class SchemaRegistry:
+    """
+    Thread-safe cache of SchemaEntry objects keyed by API URL, with TTL and LRU eviction.
+    A ttl of 0 disables expiry. synonyms, when set, is handed to every SchemaIndex built from an entry.
+
+    With a snapshot store, misses are served from the latest stored snapshot; snapshots older than
+    the ttl are refreshed in the background. In offline mode only snapshots are served.
+    """
+
+    def __init__(self, ttl=SCHEMA_CACHE_TTL, max_entries=SCHEMA_CACHE_MAX_ENTRIES, fetcher=fetch_graphql_schema,
+                 synonyms=None, store=None, offline=False, async_fetcher=fetch_graphql_schema_async):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.synonyms = synonyms
+        self.store = store
+        self.offline = offline
+        self._fetcher = fetcher
+        self._async_fetcher = async_fetcher
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = {}
+        self._loads = SingleFlight("schema_loads")
+        # Called with every entry a refresh published in place of one with a different schema.
+        self.listeners = []
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self, entry):
+        return not self.ttl or time.monotonic() - entry.fetched_at < self.ttl
+
+    def _put(self, entry):
+        with self._lock:
+            self._entries[entry.api_url] = entry
+            self._entries.move_to_end(entry.api_url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _cached(self, api_url):
+        with self._lock:
+            entry = self._entries.get(api_url)
+            if entry is not None and self._is_fresh(entry):
+                self._entries.move_to_end(api_url)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        return None
+
+    def peek(self, api_url):
+        """
+        The cached entry of an API, fresh or not, without counting a lookup.
+        """
+        with self._lock:
+            return self._entries.get(api_url)
+
+    def get(self, api_url):
+        entry = self._cached(api_url)
+        if entry is not None:
+            return entry
+        # Concurrent misses for one URL share a single load; the entry is cached before waiters return.
+        return self._loads.do(api_url, lambda: self._put(self._load(api_url)))
+
+    async def get_async(self, api_url):
+        """
+        get() for event loops: the introspection is awaited and blocking store access runs in a thread.
+        """
+        entry = self._cached(api_url)
+        if entry is not None:
+            return entry
+        return await self._loads.do_async(api_url, lambda: self._load_async(api_url))
+
+    async def _load_async(self, api_url):
+        if self.store is not None or self.offline:
+            with stage("snapshot"):
+                entry = await asyncio.to_thread(self._load_snapshot, api_url)
+            if entry is not None:
+                return self._put(entry)
+        try:
+            with stage("introspection"):
+                schema, introspection = await self._async_fetcher(api_url)
+        except Exception as e:
+            upstream_errors.inc(upstream="introspection", kind=type(e).__name__)
+            raise
+        entry = SchemaEntry(api_url, schema, introspection, synonyms=self.synonyms, store=self.store)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save, api_url, introspection, entry.version)
+        return self._put(entry)
+
+    def _load_snapshot(self, api_url):
+        snapshot = self.store.load(api_url) if self.store is not None else None
+        if snapshot is not None:
+            if not self.offline and self.ttl and time.time() - snapshot.fetched_at >= self.ttl:
+                self.refresh_in_background(api_url)
+            return self._entry_from_snapshot(snapshot)
+        if self.offline:
+            raise LookupError(f"No schema snapshot for {api_url} (offline mode)")
+        return None
+
+    def _load(self, api_url):
+        return self._load_snapshot(api_url) or self._fetch(api_url)
+
+    def _entry_from_snapshot(self, snapshot):
+        schema = build_client_schema({"__schema": snapshot.introspection})
+        return SchemaEntry(snapshot.api_url, schema, snapshot.introspection, synonyms=self.synonyms,
+                           store=self.store, version=snapshot.version)
+
+    def _fetch(self, api_url):
+        try:
+            with stage("introspection"):
+                schema, introspection = self._fetcher(api_url)
+        except Exception as e:
+            upstream_errors.inc(upstream="introspection", kind=type(e).__name__)
+            raise
+        entry = SchemaEntry(api_url, schema, introspection, synonyms=self.synonyms, store=self.store)
+        if self.store is not None:
+            self.store.save(api_url, introspection, version=entry.version)
+        return entry
+
+    def refresh(self, api_url):
+        """
+        Re-introspect an API now and replace its entry. The previous entry is kept if the schema's
+        structure did not change; otherwise the new entry inherits from it (see SchemaEntry.inherit),
+        builds the artifacts the previous one had before it is published, and the listeners are called.
+        Every refresh, in the background or not, goes through here.
+        """
+        entry = self._fetch(api_url)
+        current = self.peek(api_url)
+        if current is not None and (current.version == entry.version or current.structure == entry.structure):
+            current.fetched_at = time.monotonic()
+            return current
+        if current is None:
+            return self._put(entry)
+        entry.inherit(current)
+        entry.warm_from_previous()
+        self._put(entry)
+        for listener in self.listeners:
+            try:
+                listener(entry)
+            except Exception as e:
+                print(f"Schema change listener for {api_url} failed: {e}")
+        return entry
+
+    def refresh_in_background(self, api_url):
+        def run():
+            try:
+                self.refresh(api_url)
+            except Exception as e:
+                print(f"Background refresh of {api_url} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.pop(api_url, None)
+
+        with self._lock:
+            if api_url in self._refreshing:
+                return
+            thread = self._refreshing[api_url] = threading.Thread(target=run, name="schema-refresh", daemon=True)
+        thread.start()
+
+    def wait_for_refreshes(self, timeout=None):
+        """
+        Wait for the background refreshes in flight, e.g. before the process forks.
+        """
+        with self._lock:
+            threads = list(self._refreshing.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def preload(self):
+        """
+        Load the latest snapshot of every stored API, up to max_entries.
+        """
+        if self.store is None:
+            return []
+        loaded = []
+        for api_url in self.store.api_urls()[:self.max_entries]:
+            try:
+                self.get(api_url)
+                loaded.append(api_url)
+            except Exception as e:
+                print(f"Loading the snapshot of {api_url} failed: {e}")
+        return loaded
+
+    def invalidate(self, api_url=None):
+        with self._lock:
+            if api_url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(api_url, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": {api_url: entry.version for api_url, entry in self._entries.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "offline": self.offline,
+                "snapshot_store": self.store.path if self.store is not None else None,
+                "single_flight": {flight.name: flight.stats() for flight in
+                                  (self._loads, schema_fetcher.introspections, artifact_builds)},
+            }
+
+
+registry = SchemaRegistry(
+    store=SnapshotStore(SCHEMA_SNAPSHOT_PATH) if SCHEMA_SNAPSHOT_PATH else None,
+    offline=SCHEMA_OFFLINE,
+)
@@ -0,0 +1,60 @@
+"""
+Read-only NumPy artifacts shared by all worker processes through memory-mapped .npy files.
+
+The first process that needs an array builds it and writes it under SHARED_ARTIFACT_DIR, named by a
+hash of what it was built from; every process, the builder included, then maps the file read-only, so
+the operating system keeps one copy in the page cache however many workers use it. Without a
+directory arrays are built and kept in process memory.
+
+Only arrays are mapped this way. The Python structures of a schema (type tables, SchemaIndex, RDF
+graph) are shared by building them in the gunicorn master and freezing them before the fork
+(main.preload_for_workers); benchmarks.fork_memory_benchmark measures what a worker still copies.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+SHARED_ARTIFACT_DIR = os.environ.get("SHARED_ARTIFACT_DIR", "")
+
+
+def artifact_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def shared_array(name, key, build, directory=None):
+    """
+    build() as a read-only array memory-mapped from <directory>/<name>-<key>.npy, written on first use.
+    """
+    directory = SHARED_ARTIFACT_DIR if directory is None else directory
+    if not directory:
+        return build()
+    path = os.path.join(directory, f"{name}-{key}.npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        print(f"Rebuilding the unreadable shared artifact {path}: {e}")
+
+    array = np.ascontiguousarray(build())
+    if array.size == 0:
+        # Empty arrays cannot be memory-mapped.
+        return array
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Written under a temporary name and renamed, so other workers never map a partial file.
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".npy.tmp")
+        with os.fdopen(descriptor, "wb") as file:
+            np.save(file, array)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except OSError as e:
+        print(f"Writing the shared artifact {path} failed: {e}")
+        return array
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is in flight wait
+    for it and receive the same result, or the same exception. Nothing is cached: once the call
+    returns, the next caller for the key runs the function again. do() is for threads, do_async()
+    for coroutines on an event loop; the two keep separate sets of in-flight calls.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key, coroutine_fn):
+        """
+        The shared call runs as its own task, so a cancelled caller does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get((loop, key))
+            if task is None:
+                task = self._tasks[(loop, key)] = loop.create_task(coroutine_fn())
+                task.add_done_callback(lambda done: self._forget(loop, key, done))
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, loop, key, task):
+        with self._lock:
+            del self._tasks[(loop, key)]
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an error nobody awaited any more is not logged as lost.
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
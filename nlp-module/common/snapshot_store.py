@@ -0,0 +1,154 @@
+"""
+SQLite store of introspection snapshots, versioned by API URL and content hash,
+together with the artifacts derived from them (parsed schema, compiled index) as pickles.
+
+    python -m common.snapshot_store import <api_url> <introspection.json>
+    python -m common.snapshot_store export <api_url> <introspection.json>
+    python -m common.snapshot_store list
+
+Importing fixtures is how the service runs without network access (SCHEMA_OFFLINE=1).
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+SCHEMA_SNAPSHOT_PATH = os.environ.get("SCHEMA_SNAPSHOT_PATH", "schema_snapshots.sqlite3")
+SCHEMA_OFFLINE = os.environ.get("SCHEMA_OFFLINE", "").lower() in {"1", "true", "yes"}
+
+# Bump whenever the pickled layout of a derived artifact changes; rows with another version are rebuilt.
+ARTIFACT_FORMAT_VERSION = 3
+
+Snapshot = namedtuple("Snapshot", ["api_url", "version", "fetched_at", "introspection"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    api_url TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    introspection BLOB NOT NULL,
+    PRIMARY KEY (api_url, content_hash)
+);
+CREATE TABLE IF NOT EXISTS latest (
+    api_url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    api_url TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    format_version INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (api_url, content_hash, name)
+);
+"""
+
+
+def content_hash(introspection):
+    canonical = json.dumps(introspection, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def read_introspection_file(path):
+    """
+    Accepts a raw __schema dict, an introspection result ({"__schema": ...}) or a full response ({"data": ...}).
+    """
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    data = data.get("data", data)
+    return data.get("__schema", data)
+
+
+class SnapshotStore:
+    def __init__(self, path=SCHEMA_SNAPSHOT_PATH):
+        self.path = path
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    connection.executescript(_SCHEMA)
+                    self._initialized = True
+        return connection
+
+    def save(self, api_url, introspection, version=None, fetched_at=None):
+        version = version or content_hash(introspection)
+        blob = zlib.compress(json.dumps(introspection).encode("utf-8"))
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO snapshots (api_url, content_hash, fetched_at, introspection) VALUES (?, ?, ?, ?)",
+                (api_url, version, fetched_at or time.time(), blob),
+            )
+            connection.execute("INSERT OR REPLACE INTO latest (api_url, content_hash) VALUES (?, ?)", (api_url, version))
+        return version
+
+    def load(self, api_url, version=None):
+        query = "SELECT s.content_hash, s.fetched_at, s.introspection FROM snapshots s "
+        if version is None:
+            query += "JOIN latest l ON l.api_url = s.api_url AND l.content_hash = s.content_hash WHERE s.api_url = ?"
+            params = (api_url,)
+        else:
+            query += "WHERE s.api_url = ? AND s.content_hash = ?"
+            params = (api_url, version)
+        with self._connect() as connection:
+            row = connection.execute(query, params).fetchone()
+        if row is None:
+            return None
+        version, fetched_at, blob = row
+        return Snapshot(api_url, version, fetched_at, json.loads(zlib.decompress(blob)))
+
+    def save_artifact(self, api_url, version, name, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO artifacts (api_url, content_hash, name, format_version, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (api_url, version, name, ARTIFACT_FORMAT_VERSION, blob),
+            )
+
+    def load_artifact(self, api_url, version, name):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT data FROM artifacts WHERE api_url = ? AND content_hash = ? AND name = ? AND format_version = ?",
+                (api_url, version, name, ARTIFACT_FORMAT_VERSION),
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def api_urls(self):
+        with self._connect() as connection:
+            return [row[0] for row in connection.execute("SELECT api_url FROM latest ORDER BY api_url")]
+
+    def touch(self, api_url, version):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE snapshots SET fetched_at = ? WHERE api_url = ? AND content_hash = ?",
+                (time.time(), api_url, version),
+            )
+
+
+if __name__ == "__main__":
+    store = SnapshotStore()
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "import":
+        api_url, path = sys.argv[2], sys.argv[3]
+        print(f"{api_url}: {store.save(api_url, read_introspection_file(path))}")
+    elif command == "export":
+        api_url, path = sys.argv[2], sys.argv[3]
+        snapshot = store.load(api_url)
+        if snapshot is None:
+            sys.exit(f"No snapshot for {api_url}")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"__schema": snapshot.introspection}, file)
+    else:
+        for api_url in store.api_urls():
+            snapshot = store.load(api_url)
+            print(f"{api_url}  {snapshot.version}  {time.ctime(snapshot.fetched_at)}")
@@ -0,0 +1,19 @@
+"""
+gunicorn settings, read from the working directory; command line options take precedence.
+
+With preload_app (NLP_PRELOAD, on by default) main is imported once in the master process, which loads
+the spaCy model and the stored schemas before the workers are forked, so the workers share those pages
+instead of holding a copy each. Artifacts built later are shared through SHARED_ARTIFACT_DIR.
+"""
+import os
+
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ.get("NLP_PRELOAD", "1").lower() in {"1", "true", "yes"}
+
+
+def when_ready(server):
+    # Called in the master after the preloaded app was imported and before the first worker is forked.
+    if preload_app:
+        import main
+
+        main.preload_for_workers()
@@ -1,161 +1,458 @@
-from flask import Flask, Response, request, jsonify
-from flask_cors import CORS
-from flask_restx import Api, Resource, fields
-from rdflib import Graph, Namespace, RDF, RDFS, URIRef, Literal
-from rdflib.plugins.sparql import prepareQuery
+import gc
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional
 
-from common.schema_fetcher import fetch_graphql_schema
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from common import metrics
+from common.query_cost import QueryCostExceeded, query_cost
+from common.query_validator import validate_query
+from common.schema_fetcher import close_sessions, stop_background_loop
+from common.schema_refresher import SchemaRefresher
+from common.schema_registry import registry
 from openai_model import openai_model
 from nlp_custom_model import nlp_main
-from rdf.rdf_processor import convert_schema_to_rdf
+from nlp_custom_model.lexicon import lexicon, wordnet_corpus
+from nlp_custom_model.nlp_processor import nlp_model
+from rdf.rdf_processor import RDF_FORMATS
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+app = FastAPI(
+    title="GAIT API",
+    description="A GraphQL Query Generator API",
+    version="1.0",
+    docs_url="/",  # Swagger UI, where flask-restx served it
+    openapi_url="/swagger.json",
+    openapi_tags=[{"name": "apis", "description": "Query Endpoints"}],
+)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=["ETag", "X-Next-Cursor", "Server-Timing", metrics.REQUEST_ID_HEADER])
+app.add_middleware(metrics.MetricsMiddleware)
 
-api = Api(app, title="GAIT API", description="A GraphQL Query Generator API", version="1.0")  # Swagger UI
+ns = APIRouter(prefix="/apis", tags=["apis"])
 
-ns = api.namespace("apis", description="Query Endpoints")
 
-GRAPHQL = Namespace("http://example.org/graphql#")
+class QueryValidation(BaseModel):
+    valid: bool = Field(..., description="Whether the query validates against the API's schema")
+    errors: List[dict] = Field([], description="GraphQL validation errors with their locations")
 
-query_model = api.model(
-    "QueryInput",
-    {
-        "api_url": fields.String(required=True, description="GraphQL API URL"),
-        "user_input": fields.String(required=True, description="User query input"),
-        "model": fields.String(required=True, description="NLP Model ('openai' or 'custom')"),
-    },
-)
 
-query_response_model = api.model(
-    "QueryResponse",
-    {
-        "query": fields.String(description="Generated GraphQL query"),
-        "error": fields.String(description="Error message (if any)"),
-    },
-)
+class QueryCost(BaseModel):
+    cost: float = Field(..., description="Estimated number of values resolved, list fan-out included")
+    depth: int = Field(..., description="Deepest selection set nesting")
+    fields: int = Field(..., description="Number of selected fields")
+
+
+class QueryResponse(BaseModel):
+    query: Optional[str] = Field(None, description="Generated GraphQL query")
+    error: Optional[str] = Field(None, description="Error message (if any)")
+    schema_version: Optional[str] = Field(None, description="Content hash of the schema the query was generated against")
+    validation: Optional[QueryValidation] = Field(None, description="Local validation of the query")
+    cost: Optional[QueryCost] = Field(None, description="Estimated cost of the query")
+
+
+class ValidateQueryInput(BaseModel):
+    api_url: str = Field(..., description="GraphQL API URL")
+    query: str = Field(..., description="GraphQL query to validate")
+
+
+class BatchQueryInput(BaseModel):
+    api_url: str = Field(..., description="GraphQL API URL")
+    user_inputs: List[str] = Field(..., description="User query inputs")
+    model: str = Field("custom", description="NLP Model ('openai' or 'custom')")
+    batch_size: Optional[int] = Field(None, description="spaCy batch size (default NLP_BATCH_SIZE)")
+    n_process: Optional[int] = Field(None, description="spaCy worker processes, at most NLP_N_PROCESS")
+    max_cost: Optional[float] = Field(None, description="Largest estimated query cost to accept")
+
+
+RDF_CHUNK_SIZE = 64 * 1024
+ENTITIES_MAX_AGE = int(os.environ.get("ENTITIES_MAX_AGE", 60))
+
+NLP_WARMUP = os.environ.get("NLP_WARMUP", "1").lower() in {"1", "true", "yes"}
+NLP_HOST = os.environ.get("NLP_HOST", "0.0.0.0")
+NLP_PORT = int(os.environ.get("NLP_PORT", 5000))
+NLP_WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# Readiness only waits for the spaCy model; WordNet and OpenAI degrade per request when unavailable.
+REQUIRED_RESOURCES = [nlp_model]
+OPTIONAL_RESOURCES = [wordnet_corpus, openai_model.async_client]
+# Loaded by the gunicorn master before it forks (preload_for_workers); the OpenAI client keeps connections
+# tied to an event loop, so every worker creates its own.
+SHARED_RESOURCES = [nlp_model, wordnet_corpus]
+
+refresher = SchemaRefresher(registry)
+
+metrics.register(metrics.CallbackMetric(
+    "schema_cache_lookups_total", "Schema registry lookups by result.", "counter", ("result",),
+    lambda: [(("hit",), registry.hits), (("miss",), registry.misses)],
+))
+metrics.register(metrics.CallbackMetric(
+    "single_flight_calls_total", "Calls through each single-flight layer, executed or coalesced.", "counter",
+    ("layer", "outcome"),
+    lambda: [((layer, outcome), stats[outcome]) for layer, stats in registry.stats()["single_flight"].items()
+             for outcome in ("executions", "coalesced")],
+))
+metrics.register(metrics.CallbackMetric(
+    "lexicon_lookups_total", "Synonym lookups by result.", "counter", ("result",),
+    lambda: [(("hit",), lexicon.hits), (("miss",), lexicon.misses)],
+))
 
-last_api_url = None
-graph = None
-schema = None
-
-@ns.route('/generate_query')
-class GenerateQuery(Resource):
-    @api.expect(query_model)
-    @api.marshal_with(query_response_model)
-    def get(self):
-        global last_api_url
-        global schema
-        global graph
-        api_url = request.args.get('api_url')
-        user_input = request.args.get('user_input')
-        model = request.args.get('model').lower()
-
-        if not api_url or not user_input or not model:
-            return {"error": "Missing required parameters"}, 400
-
-        last_api_url = api_url
-        if not schema:
-            _, schema = fetch_graphql_schema(api_url)
-        if not graph:
-            graph = convert_schema_to_rdf(schema)
-        try:
-            if model == "openai":
-                query = openai_model.generate_graphql_query(api_url, user_input)
-            elif model == "custom":
-                query = nlp_main.get_graphql_query(api_url, user_input)
-                if not query:
-                    return {"error": "Resource not recognized. Please try again."}, 400
-            else:
-                return {"error": "Invalid model type"}, 400
-
-            return {"query": query}
-        except Exception as e:
-            return {"error": str(e)}, 500
 
-@ns.route('/generate_rdf')
-class GenerateRDF(Resource):
-    @api.doc(params={"api_url": "GraphQL API URL"})
-    def get(self):
-        global last_api_url
-        api_url = request.args.get('api_url')
+def error(message, status_code):
+    return JSONResponse({"error": message}, status_code=status_code)
 
-        if not api_url:
-            return {"error": "Missing required parameter: api_url"}, 400
 
-        last_api_url = api_url
+def warm_up(resources=None):
+    """
+    Load stored schema snapshots, the spaCy model, WordNet, the intent lexicon and the OpenAI client
+    (or only the given resources) ahead of the first request, then compile the matchers of the stored schemas.
+    """
+    api_urls = registry.preload()
+    for resource in REQUIRED_RESOURCES + OPTIONAL_RESOURCES if resources is None else resources:
         try:
-            _, schema = fetch_graphql_schema(api_url)
-            rdf_data = convert_schema_to_rdf(schema)
-            return Response(rdf_data, mimetype="text/turtle")
+            resource.get()
         except Exception as e:
-            return {"error": str(e)}, 500
-
-@ns.route('/entities')
-class Entities(Resource):
-    @api.doc(params={"api_url": "GraphQL API URL"})
-    def get(self):
-        global last_api_url
-        global schema
-        global graph
-        api_url = request.args.get('api_url')
-        base_url = request.host_url.rstrip("/")
-
-        if not schema or api_url != last_api_url:
-            _, schema = fetch_graphql_schema(api_url)
-        if not graph or api_url != last_api_url:
-            graph = convert_schema_to_rdf(schema)
-        if not api_url:
-            api_url = last_api_url
+            print(f"Warm-up of {resource.name} failed: {e}")
+    lexicon.intent_synonyms()
+    for api_url in api_urls if nlp_model.loaded else ():
+        try:
+            nlp_main.compile_matchers(api_url)
+        except Exception as e:
+            print(f"Compiling the matchers of {api_url} failed: {e}")
+    return readiness()
+
+
+def preload_for_workers():
+    """
+    Warm up in the gunicorn master before it forks the workers (gunicorn.conf.py, preload_app), so they
+    share the spaCy model, the stored schemas and their artifacts copy-on-write instead of loading them
+    each. Runs no threads past its return: a thread would not survive the fork, but a lock it held would.
+    Stale snapshots start background refreshes, which run on the schema fetcher's loop; both are finished first.
+    """
+    warm_up(SHARED_RESOURCES)
+    for api_url in registry.stats()["entries"]:
+        registry.peek(api_url).entity_names  # builds the RDF graph on the way
+    registry.wait_for_refreshes()
+    stop_background_loop()
+    # The garbage collector would otherwise write to every preloaded object in each worker and copy its page.
+    gc.freeze()
+    return readiness()
+
+
+def readiness():
+    ready = all(resource.loaded for resource in REQUIRED_RESOURCES)
+    resources = {resource.name: resource.state() for resource in REQUIRED_RESOURCES + OPTIONAL_RESOURCES}
+    return {"ready": ready, "resources": resources}
+
+@app.on_event("startup")
+async def start_warm_up():
+    if NLP_WARMUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    refresher.start()
+
+@app.on_event("shutdown")
+async def close_upstream_sessions():
+    refresher.stop()
+    await close_sessions()
+
+def query_result(entry, query, max_cost=None):
+    """
+    Generated query with the schema version, validation and estimated cost. Raises QueryCostExceeded
+    for a query over max_cost (the custom model already builds its queries within it).
+    May build the schema index, so async callers run it in the threadpool.
+    """
+    cost = query_cost(entry.index, query)
+    if max_cost is not None and cost and cost["cost"] > max_cost:
+        raise QueryCostExceeded(f"Estimated query cost {cost['cost']:g} exceeds max_cost {max_cost:g}.")
+    return {"query": query, "schema_version": entry.version, "validation": validate_query(entry.schema, query),
+            "cost": cost}
+
+@ns.get('/generate_query', response_model=QueryResponse, response_model_exclude_none=True)
+async def generate_query(api_url: str = "", user_input: str = "", model: str = "", max_cost: Optional[float] = None):
+    model = model.lower()
+
+    if not api_url or not user_input or not model:
+        return error("Missing required parameters", 400)
+
+    try:
+        entry = await registry.get_async(api_url)
+        if model == "openai":
+            messages = await run_in_threadpool(openai_model.build_messages, api_url, user_input)
+            query = await openai_model.generate_graphql_query_async(api_url, user_input, messages)
+        elif model == "custom":
+            query = await run_in_threadpool(nlp_main.get_graphql_query, api_url, user_input, max_cost)
+            if not query:
+                return error("Resource not recognized. Please try again.", 400)
         else:
-            last_api_url = api_url
+            return error("Invalid model type", 400)
 
-        try:
-            query = prepareQuery(
-                """
-                SELECT ?entity WHERE {
-                    ?entity a rdfs:Class .
-                }
-                """
-            )
+        return await run_in_threadpool(query_result, entry, query, max_cost)
+    except QueryCostExceeded as e:
+        return error(str(e), 400)
+    except Exception as e:
+        return error(str(e), 500)
 
-            entities = [
-                {
-                    "uri": f"{base_url}/apis/entities/{str(row.entity).split('#')[-1]}",
-                }
-                for row in graph.query(query)
-            ]
-            return {"entities": entities}
-        except Exception as e:
-            return {"error": str(e)}, 500
-
-@ns.route('/entities/<string:entity_name>')
-class Fields(Resource):
-    @api.doc(params={"api_url": "GraphQL API URL"})
-    def get(self, entity_name):
-        global last_api_url
-        global schema
-        global graph
-        api_url = request.args.get('api_url')
-        base_url = request.host_url.rstrip("/")
-        if not schema:
-            _, schema = fetch_graphql_schema(api_url)
-        if not graph:
-            graph = convert_schema_to_rdf(schema)
-        if not api_url:
-            api_url = last_api_url
+@ns.post('/validate_query', response_model=QueryResponse, response_model_exclude_none=True)
+async def validate_graphql_query(payload: ValidateQueryInput):
+    try:
+        entry = await registry.get_async(payload.api_url)
+    except Exception as e:
+        return error(str(e), 500)
+    return {"query": payload.query, "schema_version": entry.version,
+            "validation": await run_in_threadpool(validate_query, entry.schema, payload.query)}
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def generate_query_events(api_url, user_input, model, max_cost=None):
+    """
+    Server-sent events for one query: "token" events with text as it is generated, then a "done" event
+    with the whole query, or an "error" event. The custom model produces its query in one token.
+    """
+    try:
+        entry = await registry.get_async(api_url)
+        if model == "openai":
+            messages = await run_in_threadpool(openai_model.build_messages, api_url, user_input)
+            parts = []
+            async for text in openai_model.stream_graphql_query_async(api_url, user_input, messages):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            query = "".join(parts)
         else:
-            last_api_url = api_url
+            query = await run_in_threadpool(nlp_main.get_graphql_query, api_url, user_input, max_cost)
+            if not query:
+                yield sse_event("error", {"error": "Resource not recognized. Please try again."})
+                return
+            yield sse_event("token", {"text": query})
+        yield sse_event("done", await run_in_threadpool(query_result, entry, query, max_cost))
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
 
+@ns.get('/generate_query/stream', response_class=StreamingResponse,
+        responses={200: {"content": {"text/event-stream": {}}}})
+async def generate_query_stream(api_url: str = "", user_input: str = "", model: str = "",
+                                max_cost: Optional[float] = None):
+    model = model.lower()
+
+    if not api_url or not user_input or not model:
+        return error("Missing required parameters", 400)
+    if model not in ("openai", "custom"):
+        return error("Invalid model type", 400)
+
+    return StreamingResponse(generate_query_events(api_url, user_input, model, max_cost),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def stream_chunks(data, chunk_size=RDF_CHUNK_SIZE):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+def paginate(items, cursor, limit):
+    """
+    Slice items by an opaque cursor (the offset of the first item) and an optional limit.
+    Returns the page and the cursor of the next page, if any.
+    """
+    start = int(cursor) if cursor else 0
+    if start < 0 or (limit is not None and limit <= 0):
+        raise ValueError("cursor must be >= 0 and limit > 0")
+    end = len(items) if limit is None else min(start + limit, len(items))
+    return items[start:end], (str(end) if end < len(items) else None)
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+def best_match(accept, offers, default):
+    """
+    The offered media type the Accept header ranks highest (by q value, then by the order of offers).
+    """
+    ranked = []
+    for item in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        ranked.append((media_type.lower(), quality))
+
+    best, best_quality = default, 0.0
+    for offer in offers:
+        family = offer.split("/")[0] + "/*"
+        quality = max((q for media_type, q in ranked if media_type in (offer, family, "*/*")), default=0.0)
+        if quality > best_quality:
+            best, best_quality = offer, quality
+    return best
+
+def schema_cached(request, data, entry, base_url, next_cursor=None):
+    """
+    Response for data derived from a schema entry, revalidated through an ETag tied to the schema version.
+    """
+    full_path = f"{request.url.path}?{request.url.query}"
+    etag = hashlib.sha256(f"{entry.version}|{base_url}|{full_path}".encode("utf-8")).hexdigest()[:32]
+    if etag_matches(request, etag):
+        response = Response(status_code=304)
+    else:
+        response = JSONResponse(data)
+    response.headers["ETag"] = f'"{etag}"'
+    response.headers["Cache-Control"] = f"public, max-age={ENTITIES_MAX_AGE}"
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+async def generate_openai_queries(entry, user_inputs, max_cost=None):
+    api_url = entry.api_url
+    for position, user_input in enumerate(user_inputs):
         try:
-            _, schema = fetch_graphql_schema(api_url)
-            for gql_type in schema["types"]:
-                if gql_type["name"] == entity_name and gql_type["kind"] == "OBJECT":
-                    fields = [f"uri: {base_url}/apis/entities/{entity_name}/{field['name']}" for field in gql_type.get("fields", [])]
-                    return {"entity": entity_name, "fields": fields}
-            return {"error": f"Entity '{entity_name}' not found"}, 404
+            messages = await run_in_threadpool(openai_model.build_messages, api_url, user_input)
+            query = await openai_model.generate_graphql_query_async(api_url, user_input, messages)
+            result = await run_in_threadpool(query_result, entry, query, max_cost)
+            yield {"index": position, "query": query, "validation": result["validation"], "cost": result["cost"]}
         except Exception as e:
-            return {"error": str(e)}, 500
+            yield {"index": position, "error": str(e)}
+
+@ns.post('/generate_queries', response_class=StreamingResponse,
+         responses={200: {"content": {"application/x-ndjson": {}}}})
+async def generate_queries(payload: BatchQueryInput):
+    model = (payload.model or "custom").lower()
+
+    try:
+        entry = await registry.get_async(payload.api_url)
+        if model == "openai":
+            results = generate_openai_queries(entry, payload.user_inputs, payload.max_cost)
+            lines = (json.dumps(result) + "\n" async for result in results)
+        elif model == "custom":
+            # A plain generator: StreamingResponse iterates it in the threadpool, off the event loop.
+            results = await run_in_threadpool(
+                nlp_main.get_graphql_queries,
+                payload.api_url,
+                payload.user_inputs,
+                batch_size=payload.batch_size or nlp_main.NLP_BATCH_SIZE,
+                n_process=payload.n_process or nlp_main.NLP_N_PROCESS,
+                max_cost=payload.max_cost,
+            )
+            lines = (json.dumps(result) + "\n" for result in results)
+        else:
+            return error("Invalid model type", 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@ns.get('/generate_rdf', response_class=Response,
+        responses={200: {"content": {media_type: {} for media_type in RDF_FORMATS}}})
+async def generate_rdf(request: Request, api_url: str = ""):
+    if not api_url:
+        return error("Missing required parameter: api_url", 400)
+
+    media_type = best_match(request.headers.get("accept"), list(RDF_FORMATS), default="text/turtle")
+    try:
+        entry = await registry.get_async(api_url)
+        rdf_data, etag = await run_in_threadpool(entry.rdf, RDF_FORMATS[media_type])
+    except Exception as e:
+        return error(str(e), 500)
+
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Length"] = str(len(rdf_data))
+    return StreamingResponse(stream_chunks(rdf_data), media_type=media_type, headers=headers)
+
+@ns.get('/entities')
+async def entities(request: Request, api_url: str = "", limit: Optional[int] = None,
+                   cursor: Optional[str] = None):
+    base_url = str(request.base_url).rstrip("/")
+    if not api_url:
+        return error("Missing required parameter: api_url", 400)
+
+    try:
+        entry = await registry.get_async(api_url)
+        names, next_cursor = paginate(await run_in_threadpool(lambda: entry.entity_names), cursor, limit)
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+    entities = [{"uri": f"{base_url}/apis/entities/{name}"} for name in names]
+    return schema_cached(request, {"entities": entities, "next_cursor": next_cursor}, entry, base_url, next_cursor)
+
+@ns.get('/entities/{entity_name}')
+async def entity_fields(entity_name: str, request: Request, api_url: str = "",
+                        limit: Optional[int] = None, cursor: Optional[str] = None):
+    base_url = str(request.base_url).rstrip("/")
+    if not api_url:
+        return error("Missing required parameter: api_url", 400)
+
+    try:
+        entry = await registry.get_async(api_url)
+        gql_type = entry.types_by_name.get(entity_name)
+        if not gql_type or gql_type["kind"] != "OBJECT":
+            return error(f"Entity '{entity_name}' not found", 404)
+
+        field_names, next_cursor = paginate([field["name"] for field in gql_type.get("fields") or []], cursor, limit)
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+    fields = [f"uri: {base_url}/apis/entities/{entity_name}/{name}" for name in field_names]
+    return schema_cached(request, {"entity": entity_name, "fields": fields, "next_cursor": next_cursor},
+                         entry, base_url, next_cursor)
+
+@ns.get('/schema_cache')
+async def schema_cache_stats():
+    return {**registry.stats(), "refresher": refresher.stats()}
+
+@ns.post('/schema_cache')
+async def refresh_schema(api_url: str = ""):
+    if not api_url:
+        return error("Missing required parameter: api_url", 400)
+    if registry.offline:
+        return error("Schema refresh is disabled in offline mode", 409)
+    result = await run_in_threadpool(refresher.refresh, api_url)
+    if result["outcome"] == "failed":
+        return error(result["error"], 502)
+    return {**registry.stats(), "refresh": result}
+
+@ns.delete('/schema_cache')
+async def invalidate_schema(api_url: Optional[str] = None):
+    registry.invalidate(api_url)
+    return registry.stats()
+
+@ns.get('/lexicon')
+async def lexicon_stats():
+    return lexicon.stats()
+
+@ns.get('/health/live')
+async def liveness():
+    return {"status": "alive"}
+
+@ns.get('/health/ready')
+async def health_ready():
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@ns.post('/health/warmup')
+async def health_warmup():
+    state = await run_in_threadpool(warm_up)
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+app.include_router(ns)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    import uvicorn
+
+    uvicorn.run("main:app", host=NLP_HOST, port=NLP_PORT, workers=NLP_WORKERS)
@@ -0,0 +1,135 @@
+"""
+Frozen synonym sets for the custom model, built once per word and optionally loaded from disk.
+
+    python -m nlp_custom_model.lexicon lexicon.json [api_url ...]
+
+writes a lexicon holding the intent vocabulary and the argument names of the given APIs,
+which workers load through NLP_LEXICON_PATH without touching WordNet.
+"""
+import json
+import os
+import sys
+import threading
+
+from common.lazy_resource import LazyResource
+
+NLP_LEXICON_PATH = os.environ.get("NLP_LEXICON_PATH")
+NLP_OFFLINE = os.environ.get("NLP_OFFLINE", "").lower() in {"1", "true", "yes"}
+
+WORDNET_CORPORA = ["wordnet", "omw-1.4"]
+
+INTENT_WORDS = {
+    "fetch": ["get", "fetch", "find", "list"],
+    "filter": ["filter", "search", "where"],
+}
+INTENT_PHRASES = {
+    "filter": ["show me", "display"],
+}
+
+
+def _load_wordnet():
+    import nltk
+
+    for corpus in WORDNET_CORPORA:
+        try:
+            nltk.data.find(f"corpora/{corpus}.zip")
+        except LookupError:
+            try:
+                nltk.data.find(f"corpora/{corpus}")
+            except LookupError:
+                if NLP_OFFLINE or not nltk.download(corpus, quiet=True):
+                    raise LookupError(f"NLTK corpus '{corpus}' is not installed")
+
+    from nltk.corpus import wordnet
+    wordnet.ensure_loaded()
+    return wordnet
+
+
+wordnet_corpus = LazyResource("wordnet", _load_wordnet)
+
+
+def wordnet_synonyms(word):
+    # Without WordNet (e.g. offline and not installed) words only match themselves; warm-up retries the load.
+    if wordnet_corpus.error:
+        return set()
+    try:
+        wordnet = wordnet_corpus.get()
+    except LookupError:
+        return set()
+
+    synonyms = set()
+    for syn in wordnet.synsets(word):
+        for lemma in syn.lemmas():
+            synonyms.add(lemma.name().replace("_", " "))
+    return synonyms
+
+
+class Lexicon:
+    def __init__(self, synonyms=None):
+        self._synonyms = {word: frozenset(values) for word, values in (synonyms or {}).items()}
+        self._lock = threading.Lock()
+        self._intents = None
+        self.hits = 0
+        self.misses = 0
+
+    def synonyms(self, word):
+        result = self._synonyms.get(word)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = frozenset(wordnet_synonyms(word))
+        if wordnet_corpus.loaded:
+            with self._lock:
+                self._synonyms.setdefault(word, result)
+        return result
+
+    def intent_synonyms(self):
+        if self._intents is None:
+            intents = {}
+            for intent_type, words in INTENT_WORDS.items():
+                synonyms = set(INTENT_PHRASES.get(intent_type, ()))
+                for word in words:
+                    synonyms |= self.synonyms(word)
+                intents[intent_type] = frozenset(synonyms)
+            if not wordnet_corpus.error:
+                self._intents = intents
+            return intents
+        return self._intents
+
+    def stats(self):
+        return {"words": len(self._synonyms), "hits": self.hits, "misses": self.misses}
+
+    def save(self, path):
+        with self._lock:
+            data = {word: sorted(values) for word, values in self._synonyms.items()}
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"synonyms": data}, file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as file:
+            return cls(json.load(file)["synonyms"])
+
+
+def load_lexicon(path=NLP_LEXICON_PATH):
+    if path and os.path.exists(path):
+        return Lexicon.load(path)
+    return Lexicon()
+
+
+lexicon = load_lexicon()
+
+
+if __name__ == "__main__":
+    from common.schema_fetcher import fetch_graphql_schema
+    from common.schema_index import SchemaIndex
+
+    output_path, api_urls = sys.argv[1], sys.argv[2:]
+    lexicon.intent_synonyms()
+    for api_url in api_urls:
+        schema, _ = fetch_graphql_schema(api_url)
+        SchemaIndex(schema, synonyms=lexicon.synonyms)
+    lexicon.save(output_path)
+    print(f"Saved {lexicon.stats()['words']} words to {output_path}")
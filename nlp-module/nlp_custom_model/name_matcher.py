@@ -0,0 +1,143 @@
+"""
+Semantic matching of request words to a schema's query and field names with the spaCy model's word vectors.
+
+The names of a schema are embedded once, as the mean vector of their camelCase / snake_case words, into
+one L2-normalized float32 matrix. A request is matched by a single product of its content token vectors
+with the candidate rows, so "nations" finds countries without a synonym list. Names and tokens without
+a vector, and models without vectors, simply never match.
+
+With SHARED_ARTIFACT_DIR set the matrix is a memory-mapped file shared by all workers (common.shared_artifacts).
+"""
+import os
+import re
+import threading
+import weakref
+
+import numpy as np
+
+from common.shared_artifacts import artifact_key, shared_array
+
+NAME_MATCH_THRESHOLD = float(os.environ.get("NAME_MATCH_THRESHOLD", 0.7))
+NAME_MATCH_TOP_K = int(os.environ.get("NAME_MATCH_TOP_K", 5))
+
+NAME_WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+# Parts of speech that never name a resource or a field; verbs are intents ("get", "list", "show").
+FUNCTION_POS = {"VERB", "AUX", "ADP", "DET", "PRON", "CCONJ", "SCONJ", "PART", "NUM", "PUNCT", "SYM"}
+
+_matchers = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def name_words(name):
+    """
+    Lower-case words of a camelCase, PascalCase or snake_case name: "countryCode" -> ["country", "code"].
+    """
+    return [word.lower() for word in NAME_WORD_PATTERN.findall(name)]
+
+
+def top_k(scores, k, threshold):
+    """
+    Positions of the (at most) k highest scores that reach threshold, best first.
+    """
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[scores[candidates] >= threshold]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def content_tokens(tokens):
+    return [token for token in tokens
+            if not (token.is_stop or token.is_punct or token.like_num or token.pos_ in FUNCTION_POS)]
+
+
+class NameMatcher:
+    """
+    Embedding matrix of a SchemaIndex's query names, followed by the other field names of its types.
+    The query rows are a view of it; a type's field rows are gathered from it per request.
+    """
+
+    def __init__(self, index, vocab):
+        self.index = index
+        self.vocab = vocab
+        self.enabled = vocab.vectors.shape[0] > 0
+        self.query_names = list(index.queries)
+        names = list(dict.fromkeys(self.query_names + [name for type_info in index.types.values()
+                                                        for name in type_info.fields]))
+        self.rows = {name: row for row, name in enumerate(names)}
+        width = vocab.vectors.shape[1] if self.enabled else 0
+        key = artifact_key(vocab.vectors.name, vocab.vectors.shape, *names)
+        self.matrix = shared_array("names", key, lambda: self._embed_all(names, width)) if self.enabled \
+            else np.zeros((len(names), 0), dtype=np.float32)
+        self.query_matrix = self.matrix[:len(self.query_names)]
+        self._field_rows = {}
+
+    def _embed_all(self, names, width):
+        matrix = np.zeros((len(names), width), dtype=np.float32)
+        for row, name in enumerate(names):
+            vectors = [self.vocab.get_vector(word) for word in name_words(name) if self.vocab.has_vector(word)]
+            if vectors:
+                matrix[row] = np.mean(vectors, axis=0)
+        return _normalize(matrix)
+
+    def field_matrix(self, type_name):
+        rows = self._field_rows.get(type_name)
+        if rows is None:
+            names = list(self.index.types[type_name].fields) if type_name in self.index.types else []
+            rows = self._field_rows[type_name] = (names, np.array([self.rows[name] for name in names], dtype=np.intp))
+        names, positions = rows
+        return names, self.matrix[positions]
+
+    def token_matrix(self, tokens):
+        tokens = [token for token in tokens if token.has_vector]
+        if not tokens:
+            return tokens, None
+        return tokens, _normalize(np.array([token.vector for token in tokens], dtype=np.float32))
+
+    def match_queries(self, tokens, k=NAME_MATCH_TOP_K, threshold=NAME_MATCH_THRESHOLD):
+        """
+        [(query name, token, score)] for the query names most similar to any of the tokens, best first.
+        """
+        tokens, vectors = self.token_matrix(tokens) if self.enabled else ([], None)
+        if vectors is None or not self.query_names:
+            return []
+        scores = vectors @ self.query_matrix.T
+        best_tokens = scores.argmax(axis=0)
+        best = scores[best_tokens, np.arange(len(self.query_names))]
+        return [(self.query_names[column], tokens[best_tokens[column]], float(best[column]))
+                for column in top_k(best, k, threshold)]
+
+    def match_fields(self, type_name, tokens, k=NAME_MATCH_TOP_K, threshold=NAME_MATCH_THRESHOLD):
+        """
+        [(field name, token, score)] of type_name's fields, at most one per token (its most similar one), best first.
+        """
+        tokens, vectors = self.token_matrix(tokens) if self.enabled else ([], None)
+        names, matrix = self.field_matrix(type_name)
+        if vectors is None or not names:
+            return []
+        scores = vectors @ matrix.T
+        best_fields = scores.argmax(axis=1)
+        best = scores[np.arange(len(tokens)), best_fields]
+        matches = {}
+        for row in top_k(best, len(tokens), threshold):
+            matches.setdefault(names[best_fields[row]], (tokens[row], float(best[row])))
+        return [(name, token, score) for name, (token, score) in list(matches.items())[:k]]
+
+
+def name_matcher(index, vocab):
+    """
+    The NameMatcher of a SchemaIndex, built on first use and kept for as long as the index is.
+    """
+    with _lock:
+        matcher = _matchers.get(index)
+    if matcher is None or matcher.vocab is not vocab:
+        matcher = NameMatcher(index, vocab)
+        with _lock:
+            _matchers[index] = matcher
+    return matcher
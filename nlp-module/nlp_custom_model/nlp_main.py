@@ -1,25 +1,89 @@
+import os
 from pprint import pprint
 
-from nlp_custom_model.nlp_processor import nlp, advanced_intent_detection, \
+from nlp_custom_model.lexicon import lexicon
+from nlp_custom_model.name_matcher import name_matcher
+from nlp_custom_model.nlp_processor import get_nlp, advanced_intent_detection, \
     extract_resource_fields_and_conditions
 from nlp_custom_model.query_generator import generate_graphql_query
-from common.schema_fetcher import fetch_graphql_schema, parse_graphql_schema
+from nlp_custom_model.schema_matcher import schema_matcher
+from common.metrics import stage
+from common.query_cost import query_cost
+from common.query_validator import validate_query
+from common.schema_registry import registry
 
+NLP_BATCH_SIZE = int(os.environ.get("NLP_BATCH_SIZE", 64))
+NLP_N_PROCESS = int(os.environ.get("NLP_N_PROCESS", 1))
 
-def get_graphql_query(api_url, user_query):
-    schema, _ = fetch_graphql_schema(api_url)
-    parsed_schema = parse_graphql_schema(schema)
+RESOURCE_NOT_RECOGNIZED = "Resource not recognized. Please try again."
 
-    doc_main = nlp(user_query)
-    intent = advanced_intent_detection(doc_main)
-    resource, fields, condition_value_dict = extract_resource_fields_and_conditions(doc_main, parsed_schema)
+# Argument synonym maps are precomputed from the lexicon whenever a schema is indexed.
+registry.synonyms = lexicon.synonyms
+
+
+def compile_matchers(api_url):
+    """
+    Index an API's schema and compile its phrase and name matchers ahead of the first request for it.
+    """
+    index = registry.get(api_url).index
+    vocab = get_nlp().vocab
+    schema_matcher(index, vocab)
+    name_matcher(index, vocab)
+
+
+def build_query(doc_main, index, max_cost=None):
+    with stage("intent"):
+        intent = advanced_intent_detection(doc_main)
+    resource, fields, condition_value_dict = extract_resource_fields_and_conditions(doc_main, index)
 
     if resource:
-        query = generate_graphql_query(intent, resource, fields, condition_value_dict, parsed_schema)
-        return query
-    else:
-        print("Resource not recognized. Please try again.")
-        return None
+        with stage("query_build"):
+            return generate_graphql_query(intent, resource, fields, condition_value_dict, index, max_cost)
+    return None
+
+
+def get_graphql_query(api_url, user_query, max_cost=None):
+    index = registry.get(api_url).index
+
+    with stage("spacy"):
+        doc = get_nlp()(user_query)
+    query = build_query(doc, index, max_cost)
+    if not query:
+        print(RESOURCE_NOT_RECOGNIZED)
+    return query
+
+
+def _generate_queries(entry, user_queries, batch_size, n_process, max_cost):
+    index = entry.index
+    texts = [user_query if isinstance(user_query, str) else "" for user_query in user_queries]
+    docs = get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+
+    for position, (user_query, doc) in enumerate(zip(user_queries, docs)):
+        if not isinstance(user_query, str) or not user_query.strip():
+            yield {"index": position, "error": "Input must be a non-empty string"}
+            continue
+        try:
+            query = build_query(doc, index, max_cost)
+            if query:
+                yield {"index": position, "query": query, "validation": validate_query(entry.schema, query),
+                       "cost": query_cost(index, query)}
+            else:
+                yield {"index": position, "error": RESOURCE_NOT_RECOGNIZED}
+        except Exception as e:
+            yield {"index": position, "error": str(e)}
+
+
+def get_graphql_queries(api_url, user_queries, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS, max_cost=None):
+    """
+    Generate queries for many inputs against one API, parsing them with nlp.pipe.
+    The schema is resolved up front; the returned generator yields one result per input, in input order,
+    and a failing input only produces an error for its own result. Queries come with their validation and cost.
+    n_process is capped at NLP_N_PROCESS, so callers cannot make the server fork more spaCy processes.
+    """
+    n_process = max(1, min(n_process, NLP_N_PROCESS))
+    entry = registry.get(api_url)
+    entry.index  # built here so schema errors are raised before the first result is streamed
+    return _generate_queries(entry, user_queries, batch_size, n_process, max_cost)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,24 @@
 from collections.abc import Mapping
 
-import spacy
-from nltk.corpus import wordnet
-import nltk
+from common.lazy_resource import LazyResource
+from common.metrics import stage
+from nlp_custom_model.lexicon import lexicon
+from nlp_custom_model.name_matcher import content_tokens, name_matcher
+from nlp_custom_model.schema_matcher import schema_matcher
 
-nlp = spacy.load("en_core_web_md")
-nltk.download('wordnet')
-nltk.download('omw-1.4')
+
+def _load_nlp():
+    import spacy
+
+    # Only the tagger, parser and lemmatizer outputs are read, so named entity recognition is never loaded.
+    return spacy.load("en_core_web_md", exclude=["ner"])
+
+
+nlp_model = LazyResource("spacy", _load_nlp)
+
+
+def get_nlp():
+    return nlp_model.get()
 
 
 def merge_dicts(dict1, dict2):
@@ -19,18 +31,11 @@ def merge_dicts(dict1, dict2):
 
 
 def get_synonyms(word):
-    synonyms = set()
-    for syn in wordnet.synsets(word):
-        for lemma in syn.lemmas():
-            synonyms.add(lemma.name().replace("_", " "))
-    return list(synonyms)
+    return lexicon.synonyms(word)
 
 
 def advanced_intent_detection(doc_main):
-    intent_synonyms = {
-        "fetch": get_synonyms("get") + get_synonyms("fetch") + get_synonyms("find") + get_synonyms("list"),
-        "filter": get_synonyms("filter") + get_synonyms("search") + get_synonyms("where") + ["show me", "display"],
-    }
+    intent_synonyms = lexicon.intent_synonyms()
 
     for token in doc_main:
         for intent_type, synonyms in intent_synonyms.items():
@@ -39,9 +44,10 @@ def advanced_intent_detection(doc_main):
     return "fetch"  # Default
 
 
-def split_request_and_condition(query):
-    doc = nlp(query)
-
+def split_request_and_condition(doc):
+    """
+    Split a parsed request into its request and condition spans at the first condition preposition.
+    """
     condition_prepositions = {"with", "by", "where"}
 
     split_index = None
@@ -51,66 +57,53 @@ def split_request_and_condition(query):
             break
 
     if split_index is not None:
-        request = doc[:split_index].text
-        condition = doc[split_index + 1:].text
+        request = doc[:split_index]
+        condition = doc[split_index + 1:]
     else:
-        request = query
-        condition = ""
+        request = doc[:]
+        condition = doc[len(doc):]
 
     return request, condition
 
 
-def extract_resource_and_fields(doc_main, schema):
-    resource = None
-    mentioned_fields = {}
+def extract_resource_and_fields(span, index):
+    """
+    The query a request span asks for and the fields of its type it mentions. Names written out in the
+    request (schema_matcher) win; other content words are matched to names by word vector similarity
+    (name_matcher).
+    """
+    mentions = schema_matcher(index, span.doc.vocab).mentions(span)
+    matcher = name_matcher(index, span.doc.vocab)
+    words = content_tokens(span)
 
-    for token in doc_main:
-        if token.text in schema:
-            resource = token.text
-            break
-
-    if resource:
-        all_fields = list(schema[resource]["fields"].keys())
-        doc_main_str = doc_main.text
-
-        for field in all_fields:
-            if field.lower() in doc_main_str:
-                if isinstance(schema[resource]["fields"][field], dict):
-                    # remove the keys that have [Circular Reference] as value
-                    filtered_fields = {k: v for k, v in schema[resource]["fields"][field].items() if
-                                       v != "[Circular Reference]"}
-                    mentioned_fields[field] = list(filtered_fields.keys())
-                else:
-                    mentioned_fields[field] = None
-
-        if not mentioned_fields:
-            for field in all_fields:
-                if isinstance(schema[resource]["fields"][field], dict):
-                    # remove the keys that have [Circular Reference] as value
-                    filtered_fields = {k: v for k, v in schema[resource]["fields"][field].items() if
-                                       v != "[Circular Reference]"}
-                    mentioned_fields[field] = list(filtered_fields.keys())
-                else:
-                    mentioned_fields[field] = None
+    if mentions["query"]:
+        resource, start, end = mentions["query"][0]
+    else:
+        matches = matcher.match_queries(words, k=1)
+        if not matches:
+            return None, []
+        resource, token, _ = matches[0]
+        start, end = token.i, token.i + 1
+    covered = set(range(start, end))
+
+    # An empty list leaves the choice of fields to query_generator's cost-bounded default selection.
+    mentioned_fields = []
+    resource_fields = index.fields_of(resource)
+    for field, field_start, field_end in mentions["field"]:
+        if field in resource_fields and covered.isdisjoint(range(field_start, field_end)):
+            covered.update(range(field_start, field_end))
+            if field not in mentioned_fields:
+                mentioned_fields.append(field)
+
+    words = [token for token in words if token.i not in covered]
+    matches = matcher.match_fields(index.resource_type(resource), words)
+    for field, _, _ in sorted(matches, key=lambda match: match[1].i):
+        if field not in mentioned_fields:
+            mentioned_fields.append(field)
 
     return resource, mentioned_fields
 
 
-def find_key_path(dictionary, target_key, path=None):
-    if path is None:
-        path = []
-
-    if isinstance(dictionary, dict):
-        if target_key in dictionary:
-            return path + [target_key]
-
-        for key, value in dictionary.items():
-            new_path = find_key_path(value, target_key, path + [key])
-            if new_path is not None:
-                return new_path
-    return None
-
-
 def build_nested_dict(keys, value):
     nested_dict = {}
     current_level = nested_dict
@@ -124,68 +117,52 @@ def build_nested_dict(keys, value):
     return nested_dict
 
 
-def extract_conditions(doc_main, schema, resource):
-    tokens = [token.text for token in doc_main]
+def extract_conditions(span, index, resource):
     condition_value_dict = {}
 
-    key_paths = []
-    for token in doc_main:
-        if token.text in schema[resource]["fields"]:
-            key_path = find_key_path(schema[resource]["arguments"], token.text)
-            if key_path:
-                key_paths.append(key_path)
-
-    if resource and resource in schema:
-        filter_mapping = schema[resource].get("arguments", {})
-
-        for key_path in key_paths:
-            temp_filter_mapping = filter_mapping
-
-            # Navigate through key_path
-            for key in key_path[:-1]:
-                if key in temp_filter_mapping:
-                    temp_filter_mapping = temp_filter_mapping[key]
-
-            for token in doc_main:
-                if token.text != key_path[-1]:
-                    continue
-                normalized_token = token.lemma_.lower()
-
-                matched_filter = None
-                for filter_key in temp_filter_mapping:
-                    if normalized_token == filter_key or normalized_token in get_synonyms(filter_key):
-                        matched_filter = filter_key
-                        break
-
-                if matched_filter:
-                    condition_value = None
-                    operator = None
-
-                    if isinstance(temp_filter_mapping[matched_filter], dict):
-                        operator = list(temp_filter_mapping[matched_filter].keys())[0]
-
-                    full_key_path = key_path + [operator] if operator else key_path
-
-                    for child in token.children:
-                        if child.dep_ in {"attr", "prep", "dobj", "pobj"} or child.pos_ in {"NUM", "NOUN", "PROPN"}:
-                            condition_value = child.text
-                            break
-
-                    if not condition_value:
-                        condition_value = doc_main[token.i + 1].text
-
-                    if condition_value:
-                        temp_dict = build_nested_dict(full_key_path, condition_value)
-                        condition_value_dict = merge_dicts(condition_value_dict, temp_dict)
-                        break
+    if not resource or resource not in index.queries:
+        return condition_value_dict
+
+    # Argument names and their synonyms, as found by schema_matcher; the first value found per argument wins.
+    matcher = schema_matcher(index, span.doc.vocab)
+    argument_words = matcher.argument_words(resource)
+    found = set()
+    for word, start, end in matcher.mentions(span)["argument"]:
+        key_path = argument_words.get(word)
+        if key_path is None or key_path in found:
+            continue
+
+        operator = None
+        matched_info = index.argument_children(resource, key_path[:-1])[key_path[-1]]
+        if matched_info.kind == "INPUT_OBJECT":
+            operator = index.first_input_field(matched_info.type_name)
+
+        full_key_path = list(key_path) + [operator] if operator else list(key_path)
+
+        condition_value = None
+        token = span.doc[end - 1]
+        for child in token.children:
+            if start <= child.i < end or not span.start <= child.i < span.end:
+                continue
+            if child.dep_ in {"attr", "prep", "dobj", "pobj"} or child.pos_ in {"NUM", "NOUN", "PROPN"}:
+                condition_value = child.text
+                break
+
+        if not condition_value and end < span.end:
+            condition_value = span.doc[end].text
+
+        if condition_value:
+            found.add(key_path)
+            temp_dict = build_nested_dict(full_key_path, condition_value)
+            condition_value_dict = merge_dicts(condition_value_dict, temp_dict)
 
     return condition_value_dict
 
 
-def extract_resource_fields_and_conditions(doc_main, schema):
-    request, condition = split_request_and_condition(doc_main.text)
-    doc_request = nlp(request)
-    doc_condition = nlp(condition)
-    resource, fields = extract_resource_and_fields(doc_request, schema)
-    condition_value_dict = extract_conditions(doc_condition, schema, resource)
+def extract_resource_fields_and_conditions(doc_main, index):
+    request, condition = split_request_and_condition(doc_main)
+    with stage("resource_fields"):
+        resource, fields = extract_resource_and_fields(request, index)
+    with stage("conditions"):
+        condition_value_dict = extract_conditions(condition, index, resource)
     return resource, fields, condition_value_dict
@@ -1,45 +1,170 @@
-def build_fields(fields_list, schema, resource):
+import json
+
+from common.query_cost import (QUERY_COST_BUDGET, QUERY_COST_LIST_SIZE, QUERY_PAGE_SIZE, QueryCostExceeded,
+                               field_cost, page_size_argument)
+from common.schema_index import COMPOSITE_KINDS
+
+BOOLEAN_WORDS = {"true": "true", "yes": "true", "1": "true", "false": "false", "no": "false", "0": "false"}
+
+
+def build_fields(fields_list, index, resource):
+    resource_fields = index.fields_of(resource)
     field_strings = []
     for field in fields_list:
-        if field in schema[resource]["fields"]:
-            field_type = schema[resource]["fields"][field]
-            if isinstance(field_type, dict):  # Nested object
-                nested_fields = [k for k, v in field_type.items() if v != "[Circular Reference]"]
-                nested_fields_str = " ".join(nested_fields)
+        field_type = resource_fields.get(field)
+        if field_type is None or field_type.required_args:
+            continue
+        if field_type.kind in COMPOSITE_KINDS:  # Nested object
+            nested_fields_str = index.selection(field_type.type_name)
+            if nested_fields_str:
                 field_strings.append(f"{field} {{ {nested_fields_str} }}")
-            else:
-                field_strings.append(field)
+        else:
+            field_strings.append(field)
     return " ".join(field_strings)
 
 
-def build_conditions(conditions):
+def default_fields(index, resource):
+    """
+    Fields to choose from when none are mentioned: leaves in schema order, then nested objects and
+    then nested lists, each cheapest first.
+    """
+    candidates = [(name, info) for name, info in index.fields_of(resource).items()
+                  if not info.required_args and (info.kind not in COMPOSITE_KINDS or index.selection(info.type_name))]
+    candidates.sort(key=lambda item: (item[1].kind in COMPOSITE_KINDS, item[1].is_list, field_cost(index, item[1])))
+    return [name for name, _ in candidates]
+
+
+def selection_cost(index, resource, fields, page_size):
+    """
+    Estimated cost of the query field with the given fields selected, asking for page_size items
+    (None when the query cannot be paginated).
+    """
+    root = index.queries[resource]
+    resource_fields = index.fields_of(resource)
+    # A page size bounds the root list, or for a connection-style root the lists directly below it.
+    list_size = page_size if page_size is not None and not root.is_list else QUERY_COST_LIST_SIZE
+    per_item = sum(field_cost(index, resource_fields[field], list_size) for field in fields if field in resource_fields)
+    fan_out = (QUERY_COST_LIST_SIZE if page_size is None else page_size) if root.is_list else 1
+    return 1 + fan_out * per_item
+
+
+def choose_selection(index, resource, fields, page_size, max_cost=None):
+    """
+    Fields to select and page size to ask for. Mentioned fields are all kept; without any, fields are
+    added from default_fields while the estimated cost stays within QUERY_COST_BUDGET (or max_cost
+    when lower). When a paginated query still exceeds max_cost its page size is reduced; if that is
+    not enough, QueryCostExceeded is raised.
+    """
+    if not fields:
+        budget = min(QUERY_COST_BUDGET, max_cost) if max_cost is not None else QUERY_COST_BUDGET
+        fields = []
+        for field in default_fields(index, resource):
+            if not fields or selection_cost(index, resource, fields + [field], page_size) <= budget:
+                fields.append(field)
+
+    cost = selection_cost(index, resource, fields, page_size)
+    if max_cost is not None and cost > max_cost and page_size:
+        base = selection_cost(index, resource, fields, 0)
+        per_page_item = selection_cost(index, resource, fields, 1) - base
+        page_size = min(page_size, int((max_cost - base) // per_page_item)) if per_page_item else page_size
+        cost = selection_cost(index, resource, fields, page_size) if page_size >= 1 else cost
+    if max_cost is not None and cost > max_cost:
+        raise QueryCostExceeded(f"Estimated query cost {cost:g} exceeds max_cost {max_cost:g}.")
+    return fields, page_size
+
+
+def argument_value(conditions, path):
+    for key in path:
+        if not isinstance(conditions, dict) or key not in conditions:
+            return None
+        conditions = conditions[key]
+    return conditions
+
+
+def with_argument(conditions, path, value):
+    conditions = dict(conditions)
+    if len(path) == 1:
+        conditions[path[0]] = value
+    else:
+        nested = conditions.get(path[0])
+        conditions[path[0]] = with_argument(nested if isinstance(nested, dict) else {}, path[1:], value)
+    return conditions
+
+
+def coerce_literal(value, field_type, index):
+    """
+    GraphQL literal for a condition value, written as the scalar or enum type the schema expects.
+    Values that do not fit the type, and arguments the schema does not know, stay strings.
+    """
+    if field_type is not None:
+        text = str(value).strip()
+        if field_type.kind == "ENUM":
+            enum_value = index.enum_value(field_type.type_name, text)
+            if enum_value:
+                return enum_value
+        elif field_type.type_name == "Int":
+            try:
+                return str(int(text))
+            except ValueError:
+                pass
+        elif field_type.type_name == "Float":
+            try:
+                return repr(float(text))
+            except ValueError:
+                pass
+        elif field_type.type_name == "Boolean" and text.lower() in BOOLEAN_WORDS:
+            return BOOLEAN_WORDS[text.lower()]
+    return json.dumps(str(value))
+
+
+def build_conditions(conditions, index, arguments):
     condition_parts = []
     for key, value in conditions.items():
+        field_type = arguments.get(key)
         if isinstance(value, dict):
-            nested_condition = build_conditions(value)
+            nested_arguments = {}
+            if field_type is not None and field_type.kind == "INPUT_OBJECT":
+                nested_arguments = index.types[field_type.type_name].fields
+            nested_condition = build_conditions(value, index, nested_arguments)
             condition_parts.append(f"{key}: {{ {nested_condition} }}")
         else:
-            condition_parts.append(f'{key}: "{value}"')
+            condition_parts.append(f"{key}: {coerce_literal(value, field_type, index)}")
     return ", ".join(condition_parts)
 
 
-def generate_graphql_query(intent, resource, fields, condition_value_dict, schema):
-    if not resource or resource not in schema:
+def generate_graphql_query(intent, resource, fields, condition_value_dict, index, max_cost=None):
+    """
+    Query for the resource. Without mentioned fields a cost-bounded default selection is used, and a
+    page size argument is added when the query takes one and the input did not set it.
+    """
+    if not resource or resource not in index.queries:
         raise ValueError("Invalid resource specified.")
 
     # Determine the argument key for filtering (e.g., "filter", "where")
-    condition_keys = schema[resource].get("arguments", {}).keys()
-    condition_arg = next((key for key in condition_keys if isinstance(schema[resource]["arguments"][key], dict)), None)
+    condition_arg = index.filter_argument(resource)
+
+    arguments = index.arguments[resource]
+    condition_value_dict = condition_value_dict or {}
+    if condition_arg and condition_arg in condition_value_dict:
+        condition_value_dict = {condition_arg: condition_value_dict[condition_arg]}
+
+    page_path = page_size_argument(index, resource)
+    page_size = None
+    if page_path:
+        requested = argument_value(condition_value_dict, page_path)
+        try:
+            page_size = int(float(requested)) if requested is not None else QUERY_PAGE_SIZE
+        except (TypeError, ValueError):
+            page_size = QUERY_PAGE_SIZE
+    fields, chosen_page_size = choose_selection(index, resource, fields, page_size, max_cost)
+    if page_path and (argument_value(condition_value_dict, page_path) is None or chosen_page_size != page_size):
+        condition_value_dict = with_argument(condition_value_dict, page_path, chosen_page_size)
 
     condition_str = ""
     if condition_value_dict:
-        if condition_arg and condition_arg in condition_value_dict:
-            nested_condition_str = build_conditions(condition_value_dict[condition_arg])
-            condition_str = f'({condition_arg}: {{ {nested_condition_str} }})'
-        else:
-            condition_str = f'({build_conditions(condition_value_dict)})'
+        condition_str = f"({build_conditions(condition_value_dict, index, arguments)})"
 
-    fields_str = build_fields(fields, schema, resource)
+    fields_str = build_fields(fields, index, resource)
 
     query = f"""
     {{
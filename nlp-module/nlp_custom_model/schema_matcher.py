@@ -0,0 +1,121 @@
+"""
+spaCy PhraseMatchers compiled from a schema's names, so resources, fields and condition arguments are
+found in one pass over a request instead of by comparing every token with every schema key.
+
+Query names, field names and argument names with their synonyms are compiled once per SchemaIndex
+(i.e. per schema version). Every name is matched as one token ("setlogo") and as its camelCase /
+snake_case words ("set logo"), by lower-case text and by lemma ("names" finds name). Matching costs
+one hash lookup per token and pattern length, however many names the schema has.
+"""
+import re
+import threading
+import weakref
+
+from nlp_custom_model.name_matcher import name_words
+
+KINDS = ("query", "field", "argument")
+SYNONYM_SEPARATOR = re.compile(r"[\s_]+")
+
+_matchers = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def name_phrases(name):
+    """
+    Word sequences a schema name or synonym is written as in a request.
+    """
+    phrases = [SYNONYM_SEPARATOR.split(name.lower().strip())]
+    words = name_words(name)
+    if words and words != phrases[0]:
+        phrases.append(words)
+    return [phrase for phrase in phrases if all(phrase)]
+
+
+class SchemaMatcher:
+    """
+    Phrase patterns for the query names, field names and argument words of a SchemaIndex.
+    mentions() returns, per kind, the names a span mentions in order; argument_words() resolves an
+    argument word to its key path for one query.
+    """
+
+    def __init__(self, index, vocab):
+        # spaCy is imported on first use, like the model itself (nlp_processor), to keep `import main` fast.
+        from spacy.matcher import PhraseMatcher
+
+        self.index = index
+        self.vocab = vocab
+        self.labels = {}
+        self._argument_words = {}
+        self._by_lower = PhraseMatcher(vocab, attr="LOWER")
+        self._by_lemma = PhraseMatcher(vocab, attr="LEMMA")
+
+        for name in index.queries:
+            self._add("query", name)
+        for name in dict.fromkeys(name for type_info in index.types.values() if type_info.kind != "INPUT_OBJECT"
+                                  for name in type_info.fields):
+            self._add("field", name)
+        for name in dict.fromkeys(word for synonyms in index.argument_synonyms.values() for word in synonyms):
+            self._add("argument", name)
+
+    def _add(self, kind, name):
+        from spacy.tokens import Doc
+
+        label = f"{kind}:{name}"
+        self.labels[self.vocab.strings.add(label)] = (kind, name)
+        patterns = []
+        for phrase in name_phrases(name):
+            pattern = Doc(self.vocab, words=phrase)
+            for token in pattern:
+                token.lemma_ = token.lower_
+            patterns.append(pattern)
+        self._by_lower.add(label, patterns)
+        self._by_lemma.add(label, patterns)
+
+    def mentions(self, span):
+        """
+        {kind: [(name, start, end)]} of the names in span, in order of appearance. Overlapping mentions of
+        one kind are resolved in favour of the longest; token offsets are relative to the Doc.
+        """
+        found = {kind: {} for kind in KINDS}
+        for match_id, start, end in self._by_lower(span) + self._by_lemma(span):
+            kind, name = self.labels[match_id]
+            found[kind].setdefault((start, end), name)
+
+        mentions = {}
+        for kind, spans in found.items():
+            taken, kept = set(), []
+            for (start, end), name in sorted(spans.items(), key=lambda item: (item[0][0] - item[0][1], item[0][0])):
+                if taken.isdisjoint(range(start, end)):
+                    taken.update(range(start, end))
+                    kept.append((name, start, end))
+            mentions[kind] = sorted(kept, key=lambda mention: mention[1])
+        return mentions
+
+    def argument_words(self, query_name):
+        """
+        {argument name or synonym: key path} for the arguments of one query, built on first use.
+        """
+        words = self._argument_words.get(query_name)
+        if words is None:
+            words = {}
+            for name, path in self.index.argument_paths.get(query_name, {}).items():
+                words.setdefault(name, path)
+            for name, path in self.index.argument_paths.get(query_name, {}).items():
+                for word, key in self.index.synonyms_at(query_name, path[:-1]).items():
+                    if key == name:
+                        words.setdefault(word, path)
+            self._argument_words[query_name] = words
+        return words
+
+
+def schema_matcher(index, vocab):
+    """
+    The SchemaMatcher of a SchemaIndex, compiled on first use and kept for as long as the index is.
+    """
+    with _lock:
+        matcher = _matchers.get(index)
+    if matcher is None or matcher.vocab is not vocab:
+        matcher = SchemaMatcher(index, vocab)
+        with _lock:
+            _matchers[index] = matcher
+    return matcher
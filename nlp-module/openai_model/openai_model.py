@@ -1,30 +1,92 @@
-from openai import OpenAI
 import os
 
 from dotenv import load_dotenv
 
-from common.schema_fetcher import fetch_graphql_schema
+from common.lazy_resource import LazyResource
+from common.metrics import stage, upstream_errors
+from common.schema_registry import registry
+from openai_model.prompt_builder import schema_prompt
 
 load_dotenv()
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
-def generate_graphql_query(api_url, user_input):
-    """Generate a GraphQL query based on user input."""
-    schema, _ = fetch_graphql_schema(api_url)
-    schema_text = str(schema)  # Convert schema JSON to string for OpenAI
+
+def _create_client():
+    from openai import OpenAI
+
+    return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+
+def _create_async_client():
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+
+client = LazyResource("openai", _create_client)
+async_client = LazyResource("openai_async", _create_async_client)
+
+MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT = "You are an expert GraphQL query generator. You are to only show the generated query."
+
+
+def build_messages(api_url, user_input):
+    with stage("prompt"):
+        schema_text = schema_prompt(registry.get(api_url), user_input)  # Only the part of the schema the request needs
 
     prompt = f"""
-    Given the following GraphQL schema:
+    Given the following GraphQL schema (SDL):
     {schema_text}
 
     Generate a GraphQL query that matches this user request:
     "{user_input}"
     """
 
-    response = client.chat.completions.create(model="gpt-4o-mini",
-    messages=[
-        {"role": "system", "content": "You are an expert GraphQL query generator. You are to only show the generated query."},
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": prompt}
-    ])
+    ]
+
+def generate_graphql_query(api_url, user_input):
+    """Generate a GraphQL query based on user input."""
+    response = client.get().chat.completions.create(model=MODEL, messages=build_messages(api_url, user_input))
 
     return response.choices[0].message.content
+
+def stream_graphql_query(api_url, user_input):
+    """Generate a GraphQL query based on user input, yielding the completion text as it arrives."""
+    stream = client.get().chat.completions.create(model=MODEL, messages=build_messages(api_url, user_input),
+                                                  stream=True)
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.response.close()
+
+async def generate_graphql_query_async(api_url, user_input, messages=None):
+    """generate_graphql_query with the request awaited; pass messages built off the event loop."""
+    messages = messages or build_messages(api_url, user_input)
+    try:
+        with stage("openai"):
+            response = await async_client.get().chat.completions.create(model=MODEL, messages=messages)
+    except Exception as e:
+        upstream_errors.inc(upstream="openai", kind=type(e).__name__)
+        raise
+
+    return response.choices[0].message.content
+
+async def stream_graphql_query_async(api_url, user_input, messages=None):
+    """stream_graphql_query with the request awaited; pass messages built off the event loop."""
+    messages = messages or build_messages(api_url, user_input)
+    try:
+        with stage("openai"):
+            stream = await async_client.get().chat.completions.create(model=MODEL, messages=messages, stream=True)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.response.aclose()
+    except Exception as e:
+        upstream_errors.inc(upstream="openai", kind=type(e).__name__)
+        raise
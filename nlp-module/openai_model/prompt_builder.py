@@ -0,0 +1,146 @@
+import os
+import re
+from collections import deque
+
+from graphql import (GraphQLInputObjectType, GraphQLInterfaceType, GraphQLObjectType, GraphQLUnionType,
+                     is_specified_scalar_type, print_type)
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 2000))
+
+# Rough size of a token for English text and SDL; good enough to keep prompts under a budget.
+CHARS_PER_TOKEN = 4
+
+WORD_PATTERN = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def stem(word):
+    word = word.lower()
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def name_words(name):
+    """
+    Stemmed words of a camelCase / snake_case name, e.g. "allCardSets" -> {"all", "card", "set"}.
+    """
+    return {stem(word) for word in WORD_PATTERN.findall(name)}
+
+
+def compact(sdl):
+    return " ".join(line.strip() for line in sdl.splitlines() if line.strip())
+
+
+def named_type(graphql_type):
+    while hasattr(graphql_type, "of_type"):
+        graphql_type = graphql_type.of_type
+    return graphql_type
+
+
+def referenced_types(graphql_type):
+    if isinstance(graphql_type, (GraphQLObjectType, GraphQLInterfaceType)):
+        for field in graphql_type.fields.values():
+            yield named_type(field.type).name
+            for arg in field.args.values():
+                yield named_type(arg.type).name
+        for interface in graphql_type.interfaces:
+            yield interface.name
+    elif isinstance(graphql_type, GraphQLInputObjectType):
+        for field in graphql_type.fields.values():
+            yield named_type(field.type).name
+    elif isinstance(graphql_type, GraphQLUnionType):
+        for member in graphql_type.types:
+            yield member.name
+
+
+class SdlFragments:
+    """
+    Compact SDL of a schema split into per-type fragments, rendered once per schema version.
+
+    Every query root field is rendered on its own, together with the words of its name and return
+    type, so a prompt can be assembled from only the root fields a request mentions and the types
+    reachable from them. Holds plain strings only, so it can be stored next to the other artifacts.
+    """
+
+    def __init__(self, schema):
+        self.fragments = {}
+        self.references = {}
+        self.root_fields = {}
+        self.root_words = {}
+        self.root_types = {}
+
+        for type_name, graphql_type in schema.type_map.items():
+            if type_name.startswith("__") or is_specified_scalar_type(graphql_type) or graphql_type is schema.query_type:
+                continue
+            self.fragments[type_name] = compact(print_type(graphql_type))
+            self.references[type_name] = tuple(dict.fromkeys(referenced_types(graphql_type)))
+
+        query_type = schema.query_type
+        for field_name, field in (query_type.fields.items() if query_type else ()):
+            single = GraphQLObjectType(query_type.name, {field_name: field})
+            self.root_fields[field_name] = compact(print_type(single))[len(f"type {query_type.name} {{"):-1].strip()
+            self.root_types[field_name] = tuple(dict.fromkeys(
+                [named_type(field.type).name] + [named_type(arg.type).name for arg in field.args.values()]
+            ))
+            self.root_words[field_name] = name_words(field_name) | name_words(named_type(field.type).name)
+        self.query_type_name = query_type.name if query_type else "Query"
+
+    def relevant_root_fields(self, user_input):
+        """
+        Root fields sharing a word with the request, best match first; all of them when none match.
+        """
+        words = name_words(user_input)
+        scores = {name: len(field_words & words) for name, field_words in self.root_words.items()}
+        matched = sorted((name for name, score in scores.items() if score), key=lambda name: -scores[name])
+        return matched or list(self.root_fields)
+
+    def reachable_types(self, root_fields):
+        """
+        Type names reachable from the given root fields, closest first.
+        """
+        seen = set()
+        queue = deque(type_name for field in root_fields for type_name in self.root_types[field])
+        while queue:
+            type_name = queue.popleft()
+            if type_name in seen or type_name not in self.fragments:
+                continue
+            seen.add(type_name)
+            yield type_name
+            queue.extend(self.references[type_name])
+
+    def render(self, user_input, token_budget=PROMPT_TOKEN_BUDGET):
+        """
+        SDL of the relevant part of the schema. Root fields and types are added in order of relevance
+        while they fit in token_budget; the best matching root field is always included.
+        """
+        used = estimate_tokens(f"type {self.query_type_name} {{ }}")
+        root_fields = []
+        for field_name in self.relevant_root_fields(user_input):
+            cost = estimate_tokens(self.root_fields[field_name])
+            if root_fields and used + cost > token_budget:
+                continue
+            root_fields.append(field_name)
+            used += cost
+
+        parts = [f"type {self.query_type_name} {{ {' '.join(self.root_fields[name] for name in root_fields)} }}"]
+        for type_name in self.reachable_types(root_fields):
+            cost = estimate_tokens(self.fragments[type_name])
+            if used + cost > token_budget:
+                continue
+            parts.append(self.fragments[type_name])
+            used += cost
+        return "\n".join(parts)
+
+
+def schema_prompt(entry, user_input, token_budget=PROMPT_TOKEN_BUDGET):
+    """
+    Pruned SDL for one request against a SchemaEntry; fragments are cached on the entry.
+    """
+    fragments = entry.derived("sdl_fragments", lambda: SdlFragments(entry.schema))
+    return fragments.render(user_input, token_budget)
@@ -1,32 +1,100 @@
 from rdflib import Graph, Namespace, RDF, RDFS, URIRef, Literal
 
+from common.lazy_resource import LazyResource
+
+GRAPHQL = Namespace("http://example.org/graphql#")
+
+# Media type -> rdflib serializer, in order of preference for content negotiation.
+RDF_FORMATS = {
+    "text/turtle": "turtle",
+    "application/n-triples": "nt",
+    "application/ld+json": "json-ld",
+}
+
+
+def _prepare_entities_query():
+    from rdflib.plugins.sparql import prepareQuery
+
+    return prepareQuery(
+        """
+        SELECT DISTINCT ?entity WHERE {
+            ?entity a rdfs:Class .
+        }
+        """,
+        initNs={"rdfs": RDFS},
+    )
+
+
+entities_query = LazyResource("entities_query", _prepare_entities_query)
+
+
+def type_triples(gql_type):
+    """
+    Triples describing one introspected type and its fields.
+    """
+    type_name = gql_type["name"]
+    kind = gql_type["kind"]
+
+    type_uri = URIRef(f"http://example.org/graphql#{type_name}")
+    yield type_uri, RDF.type, RDFS.Class
+    yield type_uri, RDFS.label, Literal(type_name)
+
+    if kind == "OBJECT" and gql_type.get("fields"):
+        for field in gql_type["fields"]:
+            field_name = field["name"]
+            field_type = field["type"]["name"]
+
+            field_uri = URIRef(f"http://example.org/graphql#{field_name}")
+            yield field_uri, RDF.type, RDF.Property
+            yield field_uri, RDFS.label, Literal(field_name)
+
+            if field_type:
+                field_type_uri = URIRef(f"http://example.org/graphql#{field_type}")
+                yield field_uri, RDFS.range, field_type_uri
+                yield type_uri, RDFS.subClassOf, field_type_uri
+
 
 def convert_schema_to_rdf(schema):
     graph = Graph()
-    GRAPHQL = Namespace("http://example.org/graphql#")
-
     graph.bind("graphql", GRAPHQL)
+    graph.addN((s, p, o, graph) for gql_type in schema["types"] for s, p, o in type_triples(gql_type))
+    return graph
 
-    for gql_type in schema["types"]:
-        type_name = gql_type["name"]
-        kind = gql_type["kind"]
 
-        type_uri = URIRef(f"http://example.org/graphql#{type_name}")
-        graph.add((type_uri, RDF.type, RDFS.Class))
-        graph.add((type_uri, RDFS.label, Literal(type_name)))
+def update_graph(graph, old_types, new_types, type_names):
+    """
+    What convert_schema_to_rdf builds for new_types, derived from its graph for old_types when only
+    the types in type_names were added, removed or changed. Types are given by name.
+    """
+    stale = {triple for name in type_names if name in old_types for triple in type_triples(old_types[name])}
+    fresh = {triple for name in type_names if name in new_types for triple in type_triples(new_types[name])}
+    stale -= fresh
+    if stale:
+        # Field URIs are shared by every type with a field of that name; keep what unchanged types still emit.
+        subjects = {subject for subject, _, _ in stale}
+        for name, gql_type in new_types.items():
+            if name in type_names:
+                continue
+            uris = {GRAPHQL[name]} | {GRAPHQL[field["name"]] for field in gql_type.get("fields") or ()}
+            if uris & subjects:
+                stale.difference_update(type_triples(gql_type))
+    if not stale and all(triple in graph for triple in fresh):
+        return graph
 
-        if kind == "OBJECT" and "fields" in gql_type:
-            for field in gql_type["fields"]:
-                field_name = field["name"]
-                field_type = field["type"]["name"]
+    updated = Graph()
+    updated.bind("graphql", GRAPHQL)
+    updated.addN((s, p, o, updated) for s, p, o in graph if (s, p, o) not in stale)
+    updated.addN((s, p, o, updated) for s, p, o in fresh)
+    return updated
 
-                field_uri = URIRef(f"http://example.org/graphql#{field_name}")
-                graph.add((field_uri, RDF.type, RDF.Property))
-                graph.add((field_uri, RDFS.label, Literal(field_name)))
 
-                if field_type:
-                    field_type_uri = URIRef(f"http://example.org/graphql#{field_type}")
-                    graph.add((field_uri, RDFS.range, field_type_uri))
-                    graph.add((type_uri, RDFS.subClassOf, field_type_uri))
+def serialize_graph(graph, rdf_format):
+    data = graph.serialize(format=rdf_format)
+    return data.encode("utf-8") if isinstance(data, str) else data
 
-    return graph
+
+def entity_names(graph):
+    """
+    Local names of every rdfs:Class in the graph, sorted.
+    """
+    return sorted({str(row.entity).split('#')[-1] for row in graph.query(entities_query.get())})
@@ -1,10 +1,21 @@
+import json
+import os
 import re
-from typing import List
-from fastapi import FastAPI, HTTPException
-import requests
+from contextlib import AsyncExitStack
+from typing import List, Optional
+from urllib.parse import quote
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import httpx
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+import metrics
 from api_data import Api, apis
+from execution import QueryExecutor, ResponseCache, is_allowed, is_read_only, query_hash
+from http_client import UpstreamClient
+from query_cache import QueryCache
+from sse import SSE_HEADERS, FenceStripper, format_event, read_events
 
 app = FastAPI()
 
@@ -14,72 +25,306 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"],  
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing", "X-Cache", "X-Query-Hash", metrics.REQUEST_ID_HEADER],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 class QueryRequest(BaseModel):
     api_url: str 
     model: str     
     user_input: str 
+    max_cost: Optional[float] = None
 
-NLP_MODULE_URL = "http://127.0.0.1:5000/apis"
+class ExecuteRequest(BaseModel):
+    api_url: str
+    query: str
+    variables: Optional[dict] = None
+    operation_name: Optional[str] = None
 
-def call_nlp_module(api_url: str, user_input: str, model: str):
-    api_url = f"{NLP_MODULE_URL}/generate_query?api_url={api_url}&model={model}&user_input={user_input}"
+class BatchQueryRequest(BaseModel):
+    api_url: str
+    model: str = "custom"
+    user_inputs: List[str]
+    batch_size: Optional[int] = None
+    n_process: Optional[int] = None
+    max_cost: Optional[float] = None
+
+class SchemaChange(BaseModel):
+    api_url: str
+    old_version: str
+    new_version: str
+    affected_query_fields: Optional[List[str]] = None
+
+NLP_MODULE_URL = os.environ.get("NLP_MODULE_URL", "http://127.0.0.1:5000/apis")
+
+nlp_client = UpstreamClient(NLP_MODULE_URL, name="nlp-module")
+query_cache = QueryCache()
+executor = QueryExecutor()
+response_cache = ResponseCache()
+
+metrics.register(metrics.CallbackMetric(
+    "query_cache_lookups_total", "Generated query cache lookups by result.", "counter", ("result",),
+    lambda: [(("hit",), query_cache.hits), (("miss",), query_cache.misses)],
+))
+metrics.register(metrics.CallbackMetric(
+    "execute_cache_lookups_total", "Executed query response cache lookups by result.", "counter", ("result",),
+    lambda: [(("hit",), response_cache.hits), (("miss",), response_cache.misses)],
+))
+metrics.register(metrics.CallbackMetric(
+    "execute_upstream_requests_total", "Requests sent to upstream GraphQL APIs by persisted-query outcome.",
+    "counter", ("kind",), lambda: [((kind,), count) for kind, count in executor.counts.items()],
+))
+
+CACHE_HEADERS = ["ETag", "Cache-Control", "X-Next-Cursor"]
+
+def clean_query(raw_query: str):
+    return re.sub(r"^```graphql\n|```$", "", raw_query).strip()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await nlp_client.close()
+    await executor.close()
+
+async def call_nlp_module(api_url: str, user_input: str, model: str, max_cost: Optional[float] = None):
+    params = {"api_url": api_url, "model": model, "user_input": user_input, "max_cost": max_cost}
     
     try:
-        response = requests.get(api_url)
+        with metrics.stage("nlp-module"):
+            response = await nlp_client.get("/generate_query", params=params)
+        metrics.add_timings(metrics.parse_server_timing(response.headers.get("server-timing"), prefix="nlp."))
         response.raise_for_status() 
         data = response.json()
         raw_query = data["query"]
-        cleaned_query = re.sub(r"^```graphql\n|```$", "", raw_query).strip()
+        cleaned_query = clean_query(raw_query)
         
-        return { "query": cleaned_query }
-    except requests.exceptions.RequestException as e:
+        return { "query": cleaned_query, "schema_version": data.get("schema_version"),
+                 "validation": data.get("validation"), "cost": data.get("cost") }
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error calling OpenAI local API: {e}")
 
 @app.post("/generate_query")
 async def generate_graphql_query(request: QueryRequest):
-    print(f"Received request with API URL: {request.api_url}")
-    print(f"Using model: {request.model}")
-    print(f"User query: {request.user_input}")
+    request_id = metrics.request_id.get()
+    print(f"[{request_id}] Received request with API URL: {request.api_url}")
+    print(f"[{request_id}] Using model: {request.model}")
+    print(f"[{request_id}] User query: {request.user_input}")
+
+    with metrics.stage("cache"):
+        cached = await run_in_threadpool(query_cache.get, request.api_url, request.model, request.user_input,
+                                         request.max_cost)
+    if cached is not None:
+        return { **cached, "cached": True }
 
     try:
-        result = call_nlp_module(request.api_url, request.user_input, request.model)
-        return result
+        result = await call_nlp_module(request.api_url, request.user_input, request.model, request.max_cost)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to call OpenAI API: {e}")
 
+    await run_in_threadpool(query_cache.put, request.api_url, request.model, request.user_input, result,
+                            result.get("schema_version"), request.max_cost)
+    return { **result, "cached": False }
+
+async def cached_query_events(cached: dict):
+    yield format_event("token", {"text": cached["query"]})
+    yield format_event("done", { **cached, "cached": True })
+
+async def relay_query_events(request: QueryRequest, response: httpx.Response, stack: AsyncExitStack):
+    stripper = FenceStripper()
+    try:
+        async for event, data in read_events(response):
+            if event == "token":
+                text = stripper.feed(data["text"])
+                if text:
+                    yield format_event("token", {"text": text})
+            elif event == "done":
+                result = { "query": clean_query(data["query"]), "schema_version": data.get("schema_version"),
+                           "validation": data.get("validation"), "cost": data.get("cost") }
+                await run_in_threadpool(query_cache.put, request.api_url, request.model, request.user_input, result,
+                                        result["schema_version"], request.max_cost)
+                yield format_event("done", { **result, "cached": False })
+            else:
+                yield format_event(event, data)
+    except httpx.HTTPError as e:
+        yield format_event("error", {"error": f"Error calling NLP module: {e}"})
+    finally:
+        await stack.aclose()
+
+@app.get("/generate_query/stream")
+async def stream_graphql_query(api_url: str, model: str, user_input: str, max_cost: Optional[float] = None):
+    request = QueryRequest(api_url=api_url, model=model, user_input=user_input, max_cost=max_cost)
+    cached = await run_in_threadpool(query_cache.get, api_url, model, user_input, max_cost)
+    if cached is not None:
+        return StreamingResponse(cached_query_events(cached), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(
+            nlp_client.stream("GET", "/generate_query/stream", params=request.dict())
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        await stack.aclose()
+        raise HTTPException(status_code=500, detail=f"Error calling NLP module: {e}")
+
+    return StreamingResponse(relay_query_events(request, response, stack), media_type="text/event-stream",
+                             headers=SSE_HEADERS)
+
+@app.get("/cache")
+async def get_cache_stats():
+    return query_cache.stats()
+
+@app.delete("/cache")
+async def purge_cache(api_url: Optional[str] = None):
+    return { "purged": await run_in_threadpool(query_cache.purge, api_url) }
+
+@app.post("/cache/schema_change")
+async def schema_changed(change: SchemaChange):
+    migrated = await run_in_threadpool(query_cache.migrate, change.api_url, change.old_version, change.new_version,
+                                       change.affected_query_fields)
+    print(f"Schema of {change.api_url} changed from {change.old_version} to {change.new_version}: {migrated}")
+    return migrated
+
+async def relay_batch_results(response: httpx.Response, stack: AsyncExitStack):
+    try:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            if result.get("query"):
+                result["query"] = clean_query(result["query"])
+            yield json.dumps(result) + "\n"
+    finally:
+        await stack.aclose()
+
+@app.post("/generate_queries")
+async def generate_graphql_queries(request: BatchQueryRequest):
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(
+            nlp_client.stream("POST", "/generate_queries", json=request.dict(exclude_none=True))
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        await stack.aclose()
+        raise HTTPException(status_code=500, detail=f"Error calling NLP module: {e}")
+
+    return StreamingResponse(relay_batch_results(response, stack), media_type="application/x-ndjson")
+
+async def validate_with_nlp_module(api_url: str, query: str):
+    try:
+        with metrics.stage("validation"):
+            response = await nlp_client.post("/validate_query", json={"api_url": api_url, "query": query})
+        response.raise_for_status()
+        return response.json().get("validation")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Error calling NLP module: {e}")
+
+async def relay_execution(prefix: bytes, rest, cache_key: Optional[str], stack: AsyncExitStack):
+    body, size = [prefix], len(prefix)
+    try:
+        yield prefix
+        if rest is not None:
+            async for chunk in rest:
+                yield chunk
+                if cache_key is not None:
+                    size += len(chunk)
+                    if size > response_cache.max_entry_bytes:
+                        cache_key, body = None, []
+                    else:
+                        body.append(chunk)
+        if cache_key is not None:
+            response_cache.put_result(cache_key, b"".join(body))
+    finally:
+        await stack.aclose()
+
+@app.post("/execute")
+async def execute_query(request: ExecuteRequest):
+    if not is_allowed(request.api_url):
+        raise HTTPException(status_code=403, detail="Queries can only be executed against the listed APIs")
+    if not is_read_only(request.query):
+        raise HTTPException(status_code=400, detail="Only queries can be executed")
+
+    digest = query_hash(request.query)
+    cache_key = response_cache.key(request.api_url, digest, request.variables, request.operation_name)
+    headers = {"X-Query-Hash": digest}
+    with metrics.stage("cache"):
+        cached = response_cache.get(cache_key)
+    if cached is not None:
+        return Response(cached, media_type="application/json", headers={**headers, "X-Cache": "HIT"})
+
+    validation = await validate_with_nlp_module(request.api_url, request.query)
+    if validation is not None and not validation["valid"]:
+        raise HTTPException(status_code=400, detail={"error": "Query does not validate", "validation": validation})
+
+    stack = AsyncExitStack()
+    try:
+        with metrics.stage("upstream"):
+            response, prefix, rest = await executor.open(request.api_url, request.query, digest, request.variables,
+                                                         request.operation_name, stack)
+    except httpx.HTTPError as e:
+        await stack.aclose()
+        raise HTTPException(status_code=502, detail=f"Error calling {request.api_url}: {e}")
+
+    store_key = cache_key if response.status_code == 200 else None
+    return StreamingResponse(relay_execution(prefix, rest, store_key, stack), status_code=response.status_code,
+                             media_type="application/json", headers={**headers, "X-Cache": "MISS"})
+
+@app.get("/execute/cache")
+async def get_execute_cache_stats():
+    return { **response_cache.stats(), "upstream": executor.stats() }
+
+@app.delete("/execute/cache")
+async def purge_execute_cache(api_url: Optional[str] = None):
+    return { "purged": response_cache.purge(api_url) }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/apis", response_model=List[Api])
 async def get_apis():
     return apis
 
+def cache_headers(upstream: httpx.Response):
+    return {name: upstream.headers[name] for name in CACHE_HEADERS if name in upstream.headers}
+
+def conditional_headers(request: Request):
+    if_none_match = request.headers.get("if-none-match")
+    return {"If-None-Match": if_none_match} if if_none_match else {}
+
 @app.get("/entities")
-def fetch_country_entity(api_url: str):
-    api_url = f"{NLP_MODULE_URL}/entities?api_url={api_url}"
+async def fetch_country_entity(api_url: str, request: Request, response: Response,
+                         limit: Optional[int] = None, cursor: Optional[str] = None):
+    params = {"api_url": api_url, "limit": limit, "cursor": cursor}
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
+        upstream = await nlp_client.get("/entities", params=params, headers=conditional_headers(request))
+        if upstream.status_code == 304:
+            return Response(status_code=304, headers=cache_headers(upstream))
+        upstream.raise_for_status()
+        data = upstream.json()
         if "entities" in data and isinstance(data["entities"], list):
+            response.headers.update(cache_headers(upstream))
             return data["entities"]
         else:
             raise HTTPException(status_code=400, detail="Invalid response format: 'entities' key not found")
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching entities: {str(e)}")
 
 @app.get("/entities/{entity}")
-def fetch_entities(entity: str):
-    api_url = f"{NLP_MODULE_URL}/entities/{entity}"
+async def fetch_entities(entity: str, api_url: str, request: Request, response: Response,
+                   limit: Optional[int] = None, cursor: Optional[str] = None):
+    params = {"api_url": api_url, "limit": limit, "cursor": cursor}
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
+        upstream = await nlp_client.get(f"/entities/{quote(entity, safe='')}", params=params,
+                                        headers=conditional_headers(request))
+        if upstream.status_code == 304:
+            return Response(status_code=304, headers=cache_headers(upstream))
+        upstream.raise_for_status()
+        data = upstream.json()
         if "fields" in data and isinstance(data["fields"], list):
+            response.headers.update(cache_headers(upstream))
             return data["fields"]
         else:
             return []
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         return []
-
-
-
@@ -0,0 +1,147 @@
+"""
+Exercise /execute against a local stub GraphQL server and report latency and bytes sent upstream for
+a cold request (query registered as a persisted query), a repeat after the response cache is purged
+(hash only), a response cache hit, and an upstream without persisted query support.
+
+The stub answers every query with a fixed result of --items objects after --latency-ms, keeps the
+persisted queries it was sent and also stands in for nlp-module's /validate_query, so neither
+nlp-module nor network access is needed. tests/test_execution.py checks the same paths for correctness.
+
+    python -m benchmarks.execute_benchmark [--runs 20] [--latency-ms 50] [--items 500]
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUERY = "{ cards { id name hp rarity } }"
+
+
+class StubGraphQLServer:
+    def __init__(self, latency, items):
+        self.latency = latency
+        self.result = json.dumps({"data": {"cards": [
+            {"id": f"card-{n}", "name": f"Card {n}", "hp": n % 300, "rarity": "Common"} for n in range(items)
+        ]}}).encode("utf-8")
+        self.persisted = {}
+        self.requests = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, name="stub-graphql", daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def answer(self, path, body):
+        if path == "/apis/validate_query":
+            return 200, {"query": body["query"], "validation": {"valid": True, "errors": []}}
+        persisted = (body.get("extensions") or {}).get("persistedQuery")
+        if path == "/no-apq":
+            if "query" not in body:
+                return 400, {"errors": [{"message": "Must provide query string."}]}
+            return 200, None
+        if persisted and "query" not in body:
+            if persisted["sha256Hash"] not in self.persisted:
+                return 200, {"errors": [{"message": "PersistedQueryNotFound",
+                                         "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"}}]}
+            return 200, None
+        if persisted:
+            if hashlib.sha256(body["query"].encode("utf-8")).hexdigest() != persisted["sha256Hash"]:
+                return 400, {"errors": [{"message": "provided sha does not match query"}]}
+            self.persisted[persisted["sha256Hash"]] = body["query"]
+        return 200, None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, payload = stub.answer(self.path, json.loads(raw))
+                if self.path != "/apis/validate_query":
+                    stub.requests.append((self.path, len(raw), "query" in json.loads(raw)))
+                    time.sleep(stub.latency)
+                body = stub.result if payload is None else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def timed(call, runs, before=None):
+    timings = []
+    for _ in range(runs):
+        if before:
+            before()
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--items", type=int, default=500)
+    args = parser.parse_args()
+
+    stub = StubGraphQLServer(args.latency_ms / 1000, args.items)
+    os.environ["NLP_MODULE_URL"] = f"{stub.base_url}/apis"
+    os.environ["EXECUTE_ALLOWED_URLS"] = "*"
+    from fastapi.testclient import TestClient
+    import app
+
+    api_url, no_apq_url = f"{stub.base_url}/graphql", f"{stub.base_url}/no-apq"
+
+    def execute(url):
+        client.post("/execute", json={"api_url": url, "query": QUERY}).raise_for_status()
+
+    def sent(since):
+        return [f"{'full' if has_query else 'hash'} {size}B" for _, size, has_query in stub.requests[since:]]
+
+    try:
+        with TestClient(app.app) as client:
+            start = len(stub.requests)
+            cold = timed(lambda: execute(api_url), 1)
+            print(f"cold miss             {cold:8.2f} ms  upstream: {sent(start)}")
+
+            start = len(stub.requests)
+            hash_only = timed(lambda: execute(api_url), args.runs, before=app.response_cache.purge)
+            print(f"miss, persisted query {hash_only:8.2f} ms  upstream: {sent(start)[:1]} x {args.runs}")
+
+            start = len(stub.requests)
+            hit = timed(lambda: execute(api_url), args.runs)
+            print(f"cache hit             {hit:8.2f} ms  upstream: {sent(start)}")
+
+            start = len(stub.requests)
+            no_apq = timed(lambda: execute(no_apq_url), 3, before=app.response_cache.purge)
+            print(f"upstream without APQ  {no_apq:8.2f} ms  upstream: {sent(start)}")
+
+            stub.persisted.clear()
+            app.response_cache.purge()
+            start = len(stub.requests)
+            execute(api_url)
+            print(f"evicted upstream      {'':8}     upstream: {sent(start)}")
+
+            print(json.dumps(client.get("/execute/cache").json(), indent=2))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
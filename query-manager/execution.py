@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from graphql import GraphQLError, OperationDefinitionNode, OperationType, parse
+
+from api_data import apis
+from http_client import UpstreamClient
+
+EXECUTE_CACHE_TTL = float(os.environ.get("EXECUTE_CACHE_TTL", 300))
+EXECUTE_CACHE_MAX_ENTRIES = int(os.environ.get("EXECUTE_CACHE_MAX_ENTRIES", 512))
+EXECUTE_CACHE_MAX_BYTES = int(os.environ.get("EXECUTE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+EXECUTE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("EXECUTE_CACHE_MAX_ENTRY_BYTES", 4 * 1024 * 1024))
+EXECUTE_APQ = os.environ.get("EXECUTE_APQ", "1").lower() in {"1", "true", "yes"}
+# Upstream origins with an open connection pool; the least recently used idle one is closed beyond this.
+EXECUTE_MAX_UPSTREAMS = int(os.environ.get("EXECUTE_MAX_UPSTREAMS", 32))
+
+# Comma separated API URLs /execute may call, or "*" for any; defaults to the bundled APIs.
+EXECUTE_ALLOWED_URLS = os.environ.get("EXECUTE_ALLOWED_URLS", ",".join(api["url"] for api in apis))
+
+# A persisted-query error is a short JSON document; larger responses are relayed without being inspected.
+APQ_PEEK_BYTES = 4096
+APQ_NOT_FOUND = "PERSISTED_QUERY_NOT_FOUND"
+APQ_NOT_SUPPORTED = "PERSISTED_QUERY_NOT_SUPPORTED"
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def is_allowed(api_url: str) -> bool:
+    allowed = {url.strip() for url in EXECUTE_ALLOWED_URLS.split(",") if url.strip()}
+    return "*" in allowed or api_url in allowed
+
+
+def is_read_only(query: str) -> bool:
+    """
+    Whether a query document parses and all its operations are queries; mutations and subscriptions
+    are never proxied or cached.
+    """
+    try:
+        document = parse(query, no_location=True)
+    except GraphQLError:
+        return False
+    return all(definition.operation == OperationType.QUERY for definition in document.definitions
+               if isinstance(definition, OperationDefinitionNode))
+
+
+class ResponseCache:
+    """
+    In-process LRU of upstream GraphQL responses keyed by (api_url, query hash, variables, operation name).
+
+    Only complete 200 responses without GraphQL errors are stored. Entries expire after ttl seconds and
+    the cache holds at most max_entries responses and max_bytes of response bodies.
+    """
+
+    def __init__(self, ttl: float = EXECUTE_CACHE_TTL, max_entries: int = EXECUTE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = EXECUTE_CACHE_MAX_BYTES, max_entry_bytes: int = EXECUTE_CACHE_MAX_ENTRY_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(api_url: str, digest: str, variables: Optional[dict], operation_name: Optional[str]) -> str:
+        return json.dumps([api_url, digest, variables or {}, operation_name], sort_keys=True)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            if cached is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def _drop(self, key: str):
+        body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def put(self, key: str, body: bytes):
+        if not self.ttl or len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (body, time.time() + self.ttl)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def put_result(self, key: str, body: bytes):
+        """
+        Stores a complete response body if it is a GraphQL result without errors.
+        """
+        try:
+            result = json.loads(body)
+        except ValueError:
+            return
+        if isinstance(result, dict) and "data" in result and not result.get("errors"):
+            self.put(key, body)
+
+    def purge(self, api_url: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if api_url is None or json.loads(key)[0] == api_url]
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def persisted_query_error(body: bytes, hash_only: bool) -> Optional[str]:
+    """
+    APQ_NOT_FOUND or APQ_NOT_SUPPORTED when a complete response body is an automatic persisted
+    query error, None for anything else.
+    """
+    try:
+        result = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(result, dict) or result.get("data") or not result.get("errors"):
+        return None
+    for error in result["errors"]:
+        code = ((error.get("extensions") or {}).get("code") or "").upper()
+        message = (error.get("message") or "").replace(" ", "").lower()
+        if code == APQ_NOT_FOUND or message == "persistedquerynotfound":
+            return APQ_NOT_FOUND
+        if code == APQ_NOT_SUPPORTED or message == "persistedquerynotsupported":
+            return APQ_NOT_SUPPORTED
+    # A server without APQ support rejects a request without a query in its own words.
+    return APQ_NOT_SUPPORTED if hash_only else None
+
+
+async def peek(response: httpx.Response, limit: int = APQ_PEEK_BYTES):
+    """
+    Reads at least limit bytes of a streamed response. Returns (prefix, iterator over the rest),
+    with no iterator when the whole body has been read.
+    """
+    chunks, size = [], 0
+    iterator = response.aiter_bytes()
+    async for chunk in iterator:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            return b"".join(chunks), iterator
+    return b"".join(chunks), None
+
+
+class QueryExecutor:
+    """
+    Runs queries against upstream GraphQL APIs over one pooled UpstreamClient per host, for at most
+    max_clients hosts: beyond that the least recently used client without requests in flight is closed.
+
+    With automatic persisted queries (APQ) a query is first sent together with its SHA-256 hash, which
+    registers it upstream; afterwards only the hash is sent. A PersistedQueryNotFound answer (the upstream
+    evicted the query) resends the full query; an upstream that turns out not to support APQ gets full
+    queries from then on.
+    """
+
+    def __init__(self, apq: bool = EXECUTE_APQ, max_registered: int = EXECUTE_CACHE_MAX_ENTRIES * 4,
+                 max_clients: int = EXECUTE_MAX_UPSTREAMS):
+        self.apq = apq
+        self.max_registered = max_registered
+        self.max_clients = max_clients
+        self.apq_support: Dict[str, bool] = {}
+        self._registered: OrderedDict = OrderedDict()
+        self._clients: OrderedDict = OrderedDict()
+        self.counts = {"full": 0, "hash_only": 0, "not_found": 0, "not_supported": 0}
+
+    def client_for(self, api_url: str) -> Tuple[UpstreamClient, str]:
+        parts = urlsplit(api_url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self._clients:
+            self._clients[origin] = UpstreamClient(origin, name=parts.netloc)
+        self._clients.move_to_end(origin)
+        path = parts.path or "/"
+        return self._clients[origin], f"{path}?{parts.query}" if parts.query else path
+
+    async def _evict_clients(self):
+        # Taken out before the first await, so no request picks up a client that is being closed.
+        idle = [origin for origin, client in list(self._clients.items())[:-1] if not client.in_flight]
+        evicted = [self._clients.pop(origin) for origin in idle[:len(self._clients) - self.max_clients]]
+        for client in evicted:
+            await client.close()
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+
+    def _payloads(self, api_url: str, query: str, digest: str, variables: Optional[dict],
+                  operation_name: Optional[str]):
+        payload = {"query": query, "variables": variables or {}}
+        if operation_name:
+            payload["operationName"] = operation_name
+        if not self.apq or self.apq_support.get(api_url) is False:
+            return [("full", payload)]
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": digest}}
+        with_hash = {**payload, "extensions": extensions}
+        if (api_url, digest) in self._registered:
+            hash_only = {key: value for key, value in with_hash.items() if key != "query"}
+            return [("hash_only", hash_only), ("full", with_hash)]
+        return [("full", with_hash)]
+
+    def _register(self, api_url: str, digest: str):
+        self._registered[(api_url, digest)] = True
+        self._registered.move_to_end((api_url, digest))
+        while len(self._registered) > self.max_registered:
+            self._registered.popitem(last=False)
+
+    async def open(self, api_url: str, query: str, digest: str, variables: Optional[dict],
+                   operation_name: Optional[str], stack: AsyncExitStack):
+        """
+        Sends the query and returns (response, prefix, rest) once its status and first bytes are known.
+        The response stays open on stack; rest iterates over the body after prefix, or is None when
+        prefix is the whole body.
+        """
+        client, path = self.client_for(api_url)
+        if len(self._clients) > self.max_clients:
+            await self._evict_clients()
+        payloads = self._payloads(api_url, query, digest, variables, operation_name)
+        while True:
+            kind, payload = payloads.pop(0)
+            self.counts[kind] += 1
+            attempt = AsyncExitStack()
+            try:
+                response = await attempt.enter_async_context(client.stream("POST", path, json=payload))
+                prefix, rest = await peek(response)
+            except BaseException:
+                await attempt.aclose()
+                raise
+
+            apq_error = None
+            if rest is None and "extensions" in payload:
+                apq_error = persisted_query_error(prefix, hash_only=kind == "hash_only")
+            if apq_error == APQ_NOT_SUPPORTED:
+                self.counts["not_supported"] += 1
+                self.apq_support[api_url] = False
+                self._registered.pop((api_url, digest), None)
+                payload = {key: value for key, value in payload.items() if key != "extensions"}
+                payloads = [("full", {"query": query, **payload})]
+            elif apq_error == APQ_NOT_FOUND and payloads:
+                self.counts["not_found"] += 1
+                self._registered.pop((api_url, digest), None)
+            else:
+                stack.push_async_callback(attempt.aclose)
+                if "extensions" in payload and response.status_code == 200:
+                    if kind == "hash_only":
+                        self.apq_support[api_url] = True
+                    self._register(api_url, digest)
+                return response, prefix, rest
+            await attempt.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "apq": self.apq,
+            "apq_support": dict(self.apq_support),
+            "registered": len(self._registered),
+            "requests": dict(self.counts),
+            "hosts": sorted(self._clients),
+        }
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import random
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+import metrics
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", 60))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", 2))
+UPSTREAM_RETRY_BACKOFF = float(os.environ.get("UPSTREAM_RETRY_BACKOFF", 0.2))
+UPSTREAM_MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", 32))
+
+RETRY_STATUS_CODES = {502, 503, 504}
+# Errors raised before the request reached the upstream; a read timeout may leave it still working on the first try.
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class UpstreamClient:
+    """
+    Pooled keep-alive HTTP client for one upstream service.
+
+    GETs are retried with full-jitter exponential backoff on connection failures and 502/503/504;
+    other methods are sent once. At most max_concurrency requests are in flight at a time.
+    The pool belongs to the event loop that first used it and is recreated if the loop changes.
+    """
+
+    def __init__(self, base_url: str, name: str = "upstream", connect_timeout: float = UPSTREAM_CONNECT_TIMEOUT,
+                 read_timeout: float = UPSTREAM_READ_TIMEOUT, max_retries: int = UPSTREAM_MAX_RETRIES,
+                 retry_backoff: float = UPSTREAM_RETRY_BACKOFF, max_concurrency: int = UPSTREAM_MAX_CONCURRENCY):
+        self.base_url = base_url.rstrip("/")
+        self.name = name
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.in_flight = 0
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _clean_params(params: Optional[dict]):
+        return {key: value for key, value in (params or {}).items() if value is not None}
+
+    @staticmethod
+    def _headers(headers: Optional[dict]):
+        """
+        Caller headers plus the current request ID, so upstream logs can be correlated.
+        """
+        request_id = metrics.request_id.get()
+        if request_id is None:
+            return headers
+        return {**(headers or {}), metrics.REQUEST_ID_HEADER: request_id}
+
+    def _record(self, response: Optional[httpx.Response] = None, error: Optional[Exception] = None):
+        if error is not None:
+            metrics.upstream_errors.inc(upstream=self.name, kind=type(error).__name__)
+        elif response.status_code >= 500:
+            metrics.upstream_errors.inc(upstream=self.name, kind=f"http_{response.status_code}")
+
+    async def get(self, path: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> httpx.Response:
+        client = self._ensure_client()
+        params = self._clean_params(params)
+        headers = self._headers(headers)
+        attempt = 0
+        while True:
+            try:
+                async with self._slot():
+                    response = await client.get(path, params=params, headers=headers)
+                self._record(response)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+            except httpx.TransportError as e:
+                self._record(error=e)
+                if not isinstance(e, RETRY_ERRORS) or attempt >= self.max_retries:
+                    raise
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+            attempt += 1
+
+    async def post(self, path: str, json=None, headers: Optional[dict] = None) -> httpx.Response:
+        client = self._ensure_client()
+        try:
+            async with self._slot():
+                response = await client.post(path, json=json, headers=self._headers(headers))
+        except httpx.TransportError as e:
+            self._record(error=e)
+            raise
+        self._record(response)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, **kwargs):
+        """
+        Streamed request that holds its concurrency slot until the response is closed.
+        """
+        client = self._ensure_client()
+        if "params" in kwargs:
+            kwargs["params"] = self._clean_params(kwargs["params"])
+        kwargs["headers"] = self._headers(kwargs.get("headers"))
+        async with self._slot():
+            try:
+                async with client.stream(method, path, **kwargs) as response:
+                    self._record(response)
+                    yield response
+            except httpx.TransportError as e:
+                self._record(error=e)
+                raise
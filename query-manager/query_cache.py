@@ -0,0 +1,237 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 1024))
+QUERY_CACHE_SQLITE_PATH = os.environ.get("QUERY_CACHE_SQLITE_PATH", "")
+
+# Seconds a generated query stays valid, per model; 0 disables caching for that model.
+# The custom model is deterministic for a given schema version, so it can be kept much longer.
+QUERY_CACHE_TTLS = {
+    "custom": float(os.environ.get("QUERY_CACHE_TTL_CUSTOM", 7 * 24 * 3600)),
+    "openai": float(os.environ.get("QUERY_CACHE_TTL_OPENAI", 24 * 3600)),
+}
+QUERY_CACHE_TTL_DEFAULT = float(os.environ.get("QUERY_CACHE_TTL_DEFAULT", 3600))
+
+# First field of the (first) operation's selection set, i.e. the query root field a generated query uses.
+ROOT_FIELD_PATTERN = re.compile(r"^[^{]*\{\s*(?:[_A-Za-z]\w*\s*:\s*)?([_A-Za-z]\w*)")
+
+
+def normalize_input(user_input: str) -> str:
+    text = re.sub(r"\s+", " ", user_input.strip().lower())
+    return text.rstrip(" ?.!")
+
+
+def root_field(query: Optional[str]) -> Optional[str]:
+    match = ROOT_FIELD_PATTERN.match(query or "")
+    return match.group(1) if match else None
+
+
+class QueryCache:
+    """
+    Cache of generated queries keyed by (api_url, model, normalized user input, schema version)
+    and, when the caller set one, the cost budget the query was generated within.
+
+    Entries live in an in-process LRU and, when sqlite_path is set, in a persistent SQLite tier
+    that survives restarts. The schema version of an API is learned from nlp-module responses;
+    once a new version is seen, entries generated against the old one are no longer returned,
+    unless nlp-module reported the change and the entries' root fields were not affected (migrate).
+    get, put, migrate and purge may block on SQLite; async callers run them in a thread.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = QUERY_CACHE_TTL_DEFAULT, sqlite_path: str = QUERY_CACHE_SQLITE_PATH):
+        self.max_entries = max_entries
+        self.ttls = ttls if ttls is not None else dict(QUERY_CACHE_TTLS)
+        self.default_ttl = default_ttl
+        self.sqlite_path = sqlite_path
+        self.schema_versions: Dict[str, str] = {}
+        # Versions migrate() has moved an API away from; a late put() for one of them is dropped.
+        self._replaced_versions: Dict[str, Set[str]] = {}
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.sqlite_path:
+            with self._connect() as connection:
+                connection.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS queries (
+                        key TEXT PRIMARY KEY,
+                        api_url TEXT NOT NULL,
+                        result TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS schema_versions (
+                        api_url TEXT PRIMARY KEY,
+                        version TEXT NOT NULL
+                    );
+                    """
+                )
+                self.schema_versions.update(connection.execute("SELECT api_url, version FROM schema_versions"))
+
+    def _connect(self):
+        return sqlite3.connect(self.sqlite_path, timeout=30)
+
+    def ttl(self, model: str) -> float:
+        return self.ttls.get(model.lower(), self.default_ttl)
+
+    def _key(self, api_url: str, model: str, user_input: str, version: Optional[str],
+             max_cost: Optional[float] = None) -> str:
+        key = [api_url, model.lower(), normalize_input(user_input), version]
+        return json.dumps(key if max_cost is None else key + [max_cost])
+
+    def get(self, api_url: str, model: str, user_input: str, max_cost: Optional[float] = None) -> Optional[dict]:
+        if not self.ttl(model):
+            return None
+        key = self._key(api_url, model, user_input, self.schema_versions.get(api_url), max_cost)
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self._entries.pop(key, None)
+
+        if self.sqlite_path:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT result, expires_at FROM queries WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            if row is not None:
+                result = json.loads(row[0])
+                self._remember(key, result, row[1])
+                with self._lock:
+                    self.hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key: str, result: dict, expires_at: float):
+        with self._lock:
+            self._entries[key] = (result, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, api_url: str, model: str, user_input: str, result: dict, schema_version: Optional[str] = None,
+            max_cost: Optional[float] = None):
+        ttl = self.ttl(model)
+        if not ttl:
+            return
+        with self._lock:
+            if schema_version in self._replaced_versions.get(api_url, ()):
+                # Generated before a migrate() the request did not see; the result may not hold any more.
+                return
+            if schema_version and self.schema_versions.get(api_url) != schema_version:
+                self.schema_versions[api_url] = schema_version
+                if self.sqlite_path:
+                    with self._connect() as connection:
+                        connection.execute(
+                            "INSERT OR REPLACE INTO schema_versions (api_url, version) VALUES (?, ?)",
+                            (api_url, schema_version),
+                        )
+            key = self._key(api_url, model, user_input, self.schema_versions.get(api_url), max_cost)
+        expires_at = time.time() + ttl
+        self._remember(key, result, expires_at)
+        if self.sqlite_path:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO queries (key, api_url, result, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, api_url, json.dumps(result), expires_at),
+                )
+
+    def migrate(self, api_url: str, old_version: str, new_version: str,
+                affected_query_fields: Optional[Iterable[str]]) -> dict:
+        """
+        Moves the entries an API's old schema version produced to its new version, except those whose
+        root field is in affected_query_fields, which are dropped. None means every field is affected.
+        """
+        affected = set(affected_query_fields) if affected_query_fields is not None else None
+
+        def keep(key: str, result: dict) -> Optional[str]:
+            parts = json.loads(key)
+            if parts[0] != api_url or parts[3] != old_version:
+                return key
+            field = root_field(result.get("query"))
+            if affected is None or field is None or field in affected:
+                return None
+            result["schema_version"] = new_version
+            return json.dumps(parts[:3] + [new_version] + parts[4:])
+
+        kept, dropped = 0, 0
+        with self._lock:
+            entries = OrderedDict()
+            for key, (result, expires_at) in self._entries.items():
+                new_key = keep(key, result)
+                if new_key is None:
+                    dropped += 1
+                    continue
+                kept += new_key != key
+                entries[new_key] = (result, expires_at)
+            self._entries = entries
+            self.schema_versions[api_url] = new_version
+            self._replaced_versions.setdefault(api_url, set()).add(old_version)
+            self._replaced_versions[api_url].discard(new_version)
+
+        if self.sqlite_path:
+            with self._connect() as connection:
+                rows = connection.execute("SELECT key, result, expires_at FROM queries WHERE api_url = ?",
+                                          (api_url,)).fetchall()
+                stored = {"kept": 0, "dropped": 0}
+                for key, result, expires_at in rows:
+                    result = json.loads(result)
+                    new_key = keep(key, result)
+                    if new_key == key:
+                        continue
+                    connection.execute("DELETE FROM queries WHERE key = ?", (key,))
+                    stored["dropped" if new_key is None else "kept"] += 1
+                    if new_key is not None:
+                        connection.execute(
+                            "INSERT OR REPLACE INTO queries (key, api_url, result, expires_at) VALUES (?, ?, ?, ?)",
+                            (new_key, api_url, json.dumps(result), expires_at),
+                        )
+                connection.execute("INSERT OR REPLACE INTO schema_versions (api_url, version) VALUES (?, ?)",
+                                   (api_url, new_version))
+            kept, dropped = max(kept, stored["kept"]), max(dropped, stored["dropped"])
+        return {"kept": kept, "dropped": dropped}
+
+    def purge(self, api_url: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if api_url is None or json.loads(key)[0] == api_url]
+            for key in keys:
+                del self._entries[key]
+            if api_url is None:
+                self.schema_versions.clear()
+            else:
+                self.schema_versions.pop(api_url, None)
+        purged = len(keys)
+        if self.sqlite_path:
+            with self._connect() as connection:
+                if api_url is None:
+                    purged = max(purged, connection.execute("DELETE FROM queries").rowcount)
+                    connection.execute("DELETE FROM schema_versions")
+                else:
+                    purged = max(purged, connection.execute("DELETE FROM queries WHERE api_url = ?", (api_url,)).rowcount)
+                    connection.execute("DELETE FROM schema_versions WHERE api_url = ?", (api_url,))
+        return purged
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttls": self.ttls,
+                "schema_versions": dict(self.schema_versions),
+                "persistent": bool(self.sqlite_path),
+            }
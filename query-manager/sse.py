@@ -0,0 +1,65 @@
+import json
+import re
+
+import httpx
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+OPENING_FENCE = re.compile(r"\s*```[A-Za-z]*\n")
+PARTIAL_FENCE = re.compile(r"\s*(`{0,3}|```[A-Za-z]*)")
+
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def read_events(response: httpx.Response):
+    """
+    Parse a text/event-stream body into (event, data) pairs, data decoded from JSON.
+    """
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].lstrip())
+
+
+class FenceStripper:
+    """
+    Incremental counterpart of clean_query for streamed completions.
+
+    Drops an opening ```graphql line and the closing ``` as the text arrives. Text that could
+    still turn out to be part of a fence (a partial opening fence, trailing backticks or
+    whitespace) is held back until the next chunk decides it; whatever is held back at the end
+    of the stream is fence or whitespace and is dropped.
+    """
+
+    def __init__(self):
+        self._head = ""
+        self._started = False
+        self._tail = ""
+
+    def feed(self, text: str) -> str:
+        if not self._started:
+            self._head += text
+            opening = OPENING_FENCE.match(self._head)
+            if opening:
+                text = self._head[opening.end():]
+            elif PARTIAL_FENCE.fullmatch(self._head):
+                return ""
+            else:
+                text = self._head
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+
+        text = self._tail + text
+        keep = len(text.rstrip("`\r\n\t "))
+        self._tail = text[keep:]
+        return text[:keep]
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service modules (app, execution, ...) are imported from the query-manager directory, as uvicorn does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,103 @@
+"""
+/execute against a local stub GraphQL server that also stands in for nlp-module's /validate_query.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+import execution
+from benchmarks.execute_benchmark import StubGraphQLServer
+from execution import QueryExecutor, ResponseCache
+from http_client import UpstreamClient
+
+QUERY = "{ cards { id name hp rarity } }"
+
+
+@pytest.fixture(scope="module")
+def stub():
+    server = StubGraphQLServer(latency=0, items=3)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(stub, monkeypatch):
+    monkeypatch.setattr(execution, "EXECUTE_ALLOWED_URLS", "*")
+    monkeypatch.setattr(app, "nlp_client", UpstreamClient(f"{stub.base_url}/apis", name="nlp-module"))
+    monkeypatch.setattr(app, "executor", QueryExecutor(apq=True))
+    monkeypatch.setattr(app, "response_cache", ResponseCache())
+    stub.persisted.clear()
+    stub.requests.clear()
+    with TestClient(app.app) as test_client:
+        yield test_client
+
+
+def execute(client, stub, api_url, expected_cache):
+    response = client.post("/execute", json={"api_url": api_url, "query": QUERY})
+    assert response.status_code == 200, response.text
+    assert response.headers["x-cache"] == expected_cache
+    assert response.content == stub.result
+    return response
+
+
+def sent(stub):
+    return [has_query for _, _, has_query in stub.requests]
+
+
+def test_cold_miss_sends_the_full_query(client, stub):
+    execute(client, stub, f"{stub.base_url}/graphql", "MISS")
+    assert sent(stub) == [True]
+    assert len(stub.persisted) == 1
+
+
+def test_repeat_sends_only_the_hash(client, stub):
+    api_url = f"{stub.base_url}/graphql"
+    execute(client, stub, api_url, "MISS")
+    app.response_cache.purge()
+    execute(client, stub, api_url, "MISS")
+    assert sent(stub) == [True, False]
+    assert app.executor.apq_support[api_url] is True
+
+
+def test_response_cache_hit_does_not_call_upstream(client, stub):
+    api_url = f"{stub.base_url}/graphql"
+    execute(client, stub, api_url, "MISS")
+    response = execute(client, stub, api_url, "HIT")
+    assert sent(stub) == [True]
+    assert response.headers["x-query-hash"] == execution.query_hash(QUERY)
+
+
+def test_upstream_without_apq_falls_back_to_full_queries(client, stub):
+    api_url = f"{stub.base_url}/no-apq"
+    for _ in range(3):
+        execute(client, stub, api_url, "MISS")
+        app.response_cache.purge()
+    # The hash-only repeat is rejected and resent in full; from then on only full queries are sent.
+    assert sent(stub) == [True, False, True, True]
+    assert app.executor.apq_support[api_url] is False
+    assert app.executor.counts["not_supported"] == 1
+
+
+def test_evicted_query_is_sent_again_in_full(client, stub):
+    api_url = f"{stub.base_url}/graphql"
+    execute(client, stub, api_url, "MISS")
+    stub.persisted.clear()
+    app.response_cache.purge()
+    execute(client, stub, api_url, "MISS")
+    assert sent(stub) == [True, False, True]
+    assert app.executor.counts["not_found"] == 1
+
+
+def test_mutations_are_rejected(client, stub):
+    response = client.post("/execute", json={"api_url": f"{stub.base_url}/graphql",
+                                             "query": "# read only\nmutation { deleteCard(id: 1) }"})
+    assert response.status_code == 400
+    assert stub.requests == []
+
+
+def test_idle_upstream_clients_beyond_the_limit_are_closed(client, stub, monkeypatch):
+    monkeypatch.setattr(app.executor, "max_clients", 1)
+    port = stub.base_url.rsplit(":", 1)[1]
+    for host in ("127.0.0.1", "localhost"):
+        execute(client, stub, f"http://{host}:{port}/graphql", "MISS")
+    assert app.executor.stats()["hosts"] == [f"http://localhost:{port}"]
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+import metrics
+
+NLP_MODULE_METRICS = os.path.join(os.path.dirname(__file__), "..", "..", "nlp-module", "common", "metrics.py")
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter("test_escaped_total", "Label escaping.", ("api_url",))
+    counter.inc(api_url='a\\b"c\nd')
+    assert 'test_escaped_total{api_url="a\\\\b\\"c\\nd"} 1' in counter.render()
+
+
+@pytest.mark.skipif(not os.path.exists(NLP_MODULE_METRICS), reason="nlp-module is not checked out next to this")
+def test_copy_matches_nlp_module():
+    def code(path):
+        # Everything after the module docstring.
+        with open(path, encoding="utf-8") as file:
+            return file.read().split('"""', 2)[2]
+
+    assert code(metrics.__file__) == code(NLP_MODULE_METRICS)
@@ -0,0 +1,32 @@
+from query_cache import QueryCache
+
+API_URL = "https://countries.trevorblades.com/"
+
+
+def result(query, version):
+    return {"query": query, "schema_version": version}
+
+
+def test_migrate_keeps_unaffected_entries(tmp_path):
+    cache = QueryCache(sqlite_path=str(tmp_path / "cache.sqlite"))
+    cache.put(API_URL, "custom", "list countries", result("{ countries { name } }", "v1"), "v1")
+    cache.put(API_URL, "custom", "list continents", result("{ continents { name } }", "v1"), "v1")
+
+    assert cache.migrate(API_URL, "v1", "v2", ["continents"]) == {"kept": 1, "dropped": 1}
+    assert cache.get(API_URL, "custom", "list countries")["schema_version"] == "v2"
+    assert cache.get(API_URL, "custom", "list continents") is None
+
+
+def test_late_put_after_migrate_does_not_restore_the_old_version(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = QueryCache(sqlite_path=path)
+    cache.put(API_URL, "custom", "list countries", result("{ countries { name } }", "v1"), "v1")
+    cache.migrate(API_URL, "v1", "v2", [])
+
+    # A request that started before the schema change finishes after it.
+    cache.put(API_URL, "custom", "list languages", result("{ languages { name } }", "v1"), "v1")
+
+    assert cache.schema_versions[API_URL] == "v2"
+    assert QueryCache(sqlite_path=path).schema_versions[API_URL] == "v2"
+    assert cache.get(API_URL, "custom", "list countries") is not None
+    assert cache.get(API_URL, "custom", "list languages") is None